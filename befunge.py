@@ -1,16 +1,67 @@
 #!/usr/bin/env python3
 import argparse
+import json
+import sys
 
 from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeCompiler import BefungeCompiler
+from befunge.BefungeOutput import BefungeOutput
+from befunge.BefungeCommon import FlushPolicy, CyclePolicy
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Befunge Interpreter')
     parser.add_argument('file', help='Befunge program file')
     parser.add_argument('-s', '--steps', action='store_true',
         help='Show program steps')
-    parser.add_argument('-o', '--ops', type=int, help='operations/second',
-        default=0)
+    parser.add_argument('-o', '--ops', type=int, default=0,
+        help='Ticks/second, the achieved rate goes to stderr, default=unlimited')
+    parser.add_argument('--fps', type=int, default=20,
+        help='Frames/second of --steps, 0 to draw every step, default=20')
+    parser.add_argument('-j', '--jit', action='store_true',
+        help='Compile hot traces')
+    parser.add_argument('-p', '--peephole', action='store_true',
+        help='Fuse stack-only runs into superinstructions')
+    parser.add_argument('-l', '--loops', action='store_true',
+        help='Run counted loops in closed form')
+    parser.add_argument('--strict', action='store_true',
+        help='Signed 32-bit cells with truncating division')
+    parser.add_argument('-c', '--compile', metavar='OUTPUT',
+        help='Compile to a Python module instead of running')
+    parser.add_argument('-f', '--flush', choices=FlushPolicy.ALL,
+        help='When to write buffered output, default=size, time when paced')
+    parser.add_argument('--cycles', choices=CyclePolicy.ALL,
+        help='Stop a program stuck in a cycle: raise an error or report it')
+    parser.add_argument('--profile', action='store_true',
+        help='Count ops and cells, print a heatmap and the hottest ones to stderr')
+    parser.add_argument('--profile-json', metavar='OUTPUT',
+        help='Profile and write the counts as JSON')
     args = parser.parse_args()
+    if args.compile:
+        with open(args.file, 'r') as f:
+            compiler = BefungeCompiler(f.read(), name=args.file)
+        with open(args.compile, 'w') as f:
+            f.write(compiler.module())
+        sys.exit(0)
+    output = None
+    if args.flush and not args.steps:
+        output = BefungeOutput(policy=args.flush)
     p = BefungeProgram(name=args.file, show_steps=args.steps,
-        operations_per_second=args.ops)
-    p.run()
\ No newline at end of file
+        operations_per_second=args.ops, jit=args.jit, peephole=args.peephole,
+        loops=args.loops, output=output, cycles=args.cycles, strict=args.strict,
+        profile=args.profile or args.profile_json is not None, frames_per_second=args.fps)
+    try:
+        p.run()
+        print("")
+        if p.cycle is not None:
+            sys.stderr.write('Stopped at step %d: program repeats every %d steps\n' % p.cycle)
+    finally:
+        if p.pacer is not None and p.pacer.achieved() is not None:
+            sys.stderr.write('%d ticks at %.1f/s, asked for %d/s\n' % (
+                p.pacer.ticks, p.pacer.achieved(), args.ops))
+        if args.profile:
+            profiler = p.profiler
+            lines = profiler.heatmap(colored=sys.stderr.isatty()) + profiler.report()
+            sys.stderr.write('\n'.join(lines) + '\n')
+        if args.profile_json:
+            with open(args.profile_json, 'w') as f:
+                json.dump(p.profiler.dump(), f, indent=2)
\ No newline at end of file
@@ -0,0 +1,416 @@
+from BefungeCommon import Direction, BefungeMode, Cell, TraceCursor
+from BefungeOps import BefungeOps
+from BefungeCodegen import BlockEmitter
+
+
+class AbstractStack(object):
+    """What is known about a stack while following the program without
+    running it: the values on top, each an int if it is always the same
+    and None if not
+
+    Parameters:
+    values - known top of the stack, bottom first
+    exact - True if nothing lies below values
+
+    """
+
+    __slots__ = ('values', 'exact')
+
+    """Values kept, deeper ones are forgotten
+    """
+    DEPTH = 16
+
+    def __init__(self, values=(), exact=True):
+        self.values = list(values)
+        self.exact = exact
+
+    def push(self, a):
+        self.values.append(a)
+        if len(self.values) > AbstractStack.DEPTH:
+            del self.values[0]
+            self.exact = False
+
+    def pop(self):
+        """Pop a value, 0 from a stack known to be empty
+
+        """
+        if self.values:
+            return self.values.pop()
+        return 0 if self.exact else None
+
+    def peek(self):
+        if self.values:
+            return self.values[-1]
+        return 0 if self.exact else None
+
+    def clear(self):
+        self.values = []
+        self.exact = True
+
+    def copy(self):
+        return AbstractStack(self.values, self.exact)
+
+    def meet(self, other):
+        """Return what is known about the stack, if it is either this
+        one or other
+
+        """
+        exact = self.exact and other.exact and len(self.values) == len(other.values)
+        n = min(len(self.values), len(other.values))
+        a, b = self.values[len(self.values) - n:], other.values[len(other.values) - n:]
+        return AbstractStack([x if x == y else None for x, y in zip(a, b)], exact)
+
+    def __eq__(self, other):
+        return self.exact == other.exact and self.values == other.values
+
+
+class BasicBlock(object):
+    """A run of states with a single way in and a single way out
+
+    Parameters:
+    leader - first state of the block
+    states - all states of the block, in order
+    successors - leaders of the blocks that can follow
+    pops - number of values the block takes from the stack it starts on
+    pushes - number of values it leaves in their place
+    clears - True if the block clears the stack with 'n', pops then
+             only counts values taken before that
+    pops and pushes are None if the block uses the stack of stacks
+
+    """
+
+    def __init__(self, leader, states, successors, pops, pushes, clears):
+        self.leader = leader
+        self.states = states
+        self.successors = successors
+        self.pops = pops
+        self.pushes = pushes
+        self.clears = clears
+
+
+class BefungeAnalysis(object):
+    """Follows a program from its threads over every reachable state
+    without running it
+
+    States are (pc, direction, string mode). Every state keeps an
+    AbstractStack that holds on all paths to it, so 'p', 'j', '_', '|'
+    and 'w' are resolved statically whenever their operands are
+    constants. Otherwise both ways of a branch, all four ways of '?',
+    all cells on the line of 'j' and both threads of 't' are followed,
+    and 'p' may write anywhere.
+
+    Results:
+    states - reachable states
+    successors - dict from a state to the states that can follow it
+    executed - cells whose op runs, comment areas are left out
+    covered - cells the pc passes over, including the ones it skips
+    puts - cells 'p' writes to, when its coordinates are constant
+    illegal - cells with ops that raise
+    offsets - cells of '{' and '}', which move the storage offset
+    blocks - dict from leader to BasicBlock
+    reason - None if no put can change a covered cell or the bounding
+             box, so this analysis holds for the whole run, else why not
+
+    """
+
+    _OP_AT, _OP_P, _OP_G, _OP_J = ord('@'), ord('p'), ord('g'), ord('j')
+    _OP_RANDOM, _OP_TURN, _OP_SPLIT = ord('?'), ord('w'), ord('t')
+    _OP_NOT, _OP_DUP, _OP_SWAP, _OP_POP = ord('!'), ord(':'), ord('\\'), ord('$')
+    _OP_CLEAR = ord('n')
+    _OP_BEGIN, _OP_END, _OP_UNDER = ord('{'), ord('}'), ord('u')
+    _OP_ITERATE = ord('k')
+    _OP_INPUT_FILE, _OP_OUTPUT_FILE = ord('i'), ord('o')
+    _INPUTS = frozenset([ord('&'), ord('~')])
+    _OUTPUTS = frozenset([ord('.'), ord(',')])
+    _DIGITS = dict((ord(c), int(c, 16)) for c in '0123456789abcdef')
+    _BINARY = dict((ord(c), c) for c in '+-*/%`')
+    _BRANCHES = {
+        ord('_'): (Direction.RIGHT, Direction.LEFT),
+        ord('|'): (Direction.DOWN, Direction.UP)
+    }
+
+    """(pops, pushes) of every op, string mode pushes one value
+    """
+    _EFFECTS = dict(
+        [(op, (0, 1)) for op in _DIGITS] +
+        [(op, (2, 1)) for op in _BINARY] +
+        [(op, (1, 0)) for op in _BRANCHES] +
+        [(op, (0, 1)) for op in _INPUTS] +
+        [(op, (1, 0)) for op in _OUTPUTS] + [
+            (_OP_NOT, (1, 1)), (_OP_DUP, (1, 2)), (_OP_SWAP, (2, 2)),
+            (_OP_POP, (1, 0)), (_OP_G, (2, 1)), (_OP_P, (3, 0)),
+            (_OP_J, (1, 0)), (_OP_TURN, (2, 0))])
+
+    def __init__(self, program, max_states=1 << 20):
+        """Analyze the program as it is now
+
+        Parameters:
+        program - BefungeProgram to analyze
+        max_states - give up after that many states, default=1<<20
+
+        """
+        self.program = program
+        self.max_states = max_states
+        self.analyze()
+
+    @property
+    def static(self):
+        """True if the analysis holds for the whole run
+
+        """
+        return self.reason is None
+
+    def analyze(self):
+        """Follow the program from every thread
+
+        """
+        program = self.program
+        self.stacks = {}
+        self.successors = {}
+        self.executed = set()
+        self.covered = set()
+        self.puts = set()
+        self.illegal = set()
+        self.offsets = set()
+        self.reason = None
+        self.bbox = (program.text.x0, program.text.y0, program.text.width, program.text.height)
+        work = []
+        for thread in program.threads:
+            state = (thread.pc, thread.direction, thread.mode == BefungeMode.ASCII)
+            self._reach(state, AbstractStack(thread.stack.values()), work)
+        while work:
+            if len(self.stacks) > self.max_states:
+                self.reason = 'more than %d states' % self.max_states
+                break
+            state = work.pop()
+            following = self.successors.setdefault(state, set())
+            for successor, stack in self._step(state, self.stacks[state].copy()):
+                following.add(successor)
+                self._reach(successor, stack, work)
+        self.states = set(self.stacks)
+        if self.reason is None:
+            self.reason = self._check_puts()
+        self.blocks = self._blocks()
+
+    def _reach(self, state, stack, work):
+        """Merge stack into what is known at state
+        and queue state if that changed
+
+        """
+        known = self.stacks.get(state)
+        if known is not None:
+            stack = known.meet(stack)
+            if stack == known:
+                return
+        self.stacks[state] = stack
+        work.append(state)
+
+    def _check_puts(self):
+        """Return why a put could change the program, or None
+
+        """
+        x0, y0, width, height = self.bbox
+        if self.puts and self.offsets:
+            return '%s,%s: p relative to a storage offset that moves' % min(self.offsets)
+        for x, y in self.puts:
+            if not (x0 <= x < x0 + width and y0 <= y < y0 + height):
+                return 'p to %s,%s is outside of the program' % (x, y)
+            if (x, y) in self.covered:
+                return 'p to %s,%s could change the program' % (x, y)
+        return None
+
+    def _move(self, start, pc, direction, ascii=False):
+        """Advance from pc in direction, remembering the cells from start
+        Return the new state
+
+        """
+        cursor = TraceCursor(pc, direction)
+        self.program.advance(cursor)
+        self.covered.update(self.program.text.cells_between(start, cursor.pc, direction))
+        return (cursor.pc, direction, ascii)
+
+    def _step(self, state, stack):
+        """Return the (state, stack) pairs that can follow state
+
+        """
+        program, text = self.program, self.program.text
+        pc, direction, ascii = state
+        op = text.get(*pc)
+        self.executed.add(pc)
+        if ascii:
+            if op != Cell.QUOTE:
+                stack.push(op)
+            return [(self._move(pc, pc, direction, op != Cell.QUOTE), stack)]
+        if op == Cell.QUOTE:
+            return [(self._move(pc, pc, direction, True), stack)]
+        if op in BlockEmitter.FLOW_OPS or op == Cell.SEMICOLON:
+            cursor = TraceCursor(pc, direction)
+            BefungeOps.op_table[op](program, cursor)
+            return [(self._move(pc, cursor.pc, cursor.direction), stack)]
+        if op in BefungeAnalysis._DIGITS:
+            stack.push(BefungeAnalysis._DIGITS[op])
+        elif op in BefungeAnalysis._BINARY:
+            a, b = stack.pop(), stack.pop()
+            stack.push(self._fold(BefungeAnalysis._BINARY[op], b, a))
+        elif op == BefungeAnalysis._OP_NOT:
+            a = stack.pop()
+            stack.push(None if a is None else 1 if a == 0 else 0)
+        elif op == BefungeAnalysis._OP_DUP:
+            stack.push(stack.peek())
+        elif op == BefungeAnalysis._OP_SWAP:
+            a, b = stack.pop(), stack.pop()
+            stack.push(a)
+            stack.push(b)
+        elif op == BefungeAnalysis._OP_POP or op in BefungeAnalysis._OUTPUTS:
+            stack.pop()
+        elif op == BefungeAnalysis._OP_CLEAR:
+            stack.clear()
+        elif op == BefungeAnalysis._OP_G:
+            stack.pop()
+            stack.pop()
+            stack.push(None)
+        elif op == BefungeAnalysis._OP_P:
+            y, x = stack.pop(), stack.pop()
+            stack.pop()
+            if x is None or y is None:
+                if self.reason is None:
+                    self.reason = '%s,%s: p with computed coordinates' % pc
+            else:
+                self.puts.add((x, y))
+        elif op in BefungeAnalysis._BRANCHES:
+            a = stack.pop()
+            zero, other = BefungeAnalysis._BRANCHES[op]
+            directions = [zero, other] if a is None else [zero] if a == 0 else [other]
+            return [(self._move(pc, pc, d), stack.copy()) for d in directions]
+        elif op == BefungeAnalysis._OP_TURN:
+            b, a = stack.pop(), stack.pop()
+            turns = [Direction.turn_left(direction), Direction.turn_right(direction), direction]
+            if a is not None and b is not None:
+                turns = [turns[0] if a < b else turns[1] if b < a else turns[2]]
+            return [(self._move(pc, pc, d), stack.copy()) for d in turns]
+        elif op == BefungeAnalysis._OP_RANDOM:
+            return [(self._move(pc, pc, d), stack.copy()) for d in Direction.ALL]
+        elif op == BefungeAnalysis._OP_J:
+            a = stack.pop()
+            if a is None:
+                distances = range(text.width if direction[1] == 0 else text.height)
+            else:
+                distances = [a]
+            following = []
+            for distance in distances:
+                target = text.jump(pc, direction, distance)
+                following.append((self._move(target, target, direction), stack.copy()))
+            return following
+        elif op in BefungeAnalysis._INPUTS:
+            # End of input reflects without pushing
+            reverse = Direction.reverse(direction)
+            following = [(self._move(pc, pc, reverse), stack.copy())]
+            stack.push(None)
+            return following + [(self._move(pc, pc, direction), stack)]
+        elif op == BefungeAnalysis._OP_SPLIT:
+            reverse = Direction.reverse(direction)
+            child = (text.get_next_pc(pc, reverse), reverse, False)
+            return [(self._move(pc, pc, direction), stack), (child, stack.copy())]
+        elif op == BefungeAnalysis._OP_AT:
+            return []
+        elif op in (BefungeAnalysis._OP_BEGIN, BefungeAnalysis._OP_END, BefungeAnalysis._OP_UNDER):
+            # Stacks are not followed across the stack of stacks, and
+            # '}' and 'u' reflect when there is only one stack
+            if op != BefungeAnalysis._OP_UNDER:
+                self.offsets.add(pc)
+            stack = AbstractStack(exact=False)
+            following = [(self._move(pc, pc, direction), stack)]
+            if op != BefungeAnalysis._OP_BEGIN:
+                following.append((self._move(pc, pc, Direction.reverse(direction)), stack.copy()))
+            return following
+        elif op in (BefungeAnalysis._OP_INPUT_FILE, BefungeAnalysis._OP_OUTPUT_FILE):
+            # Both pop a string of unknown length, and reflect on
+            # errors. 'i' writes the file anywhere into the program
+            if op == BefungeAnalysis._OP_INPUT_FILE and self.reason is None:
+                self.reason = '%s,%s: i loads a file into the program' % pc
+            stack = AbstractStack(exact=False)
+            reverse = Direction.reverse(direction)
+            return [(self._move(pc, pc, direction), stack), (self._move(pc, pc, reverse), stack.copy())]
+        elif op == BefungeAnalysis._OP_ITERATE:
+            # Only repeated stack ops are followed, the stack depth
+            # after them depends on the count
+            stack.pop()
+            cursor = TraceCursor(pc, direction)
+            program.advance(cursor)
+            self.executed.add(cursor.pc)
+            if text.get(*cursor.pc) not in BlockEmitter.STACK_OPS:
+                if self.reason is None:
+                    self.reason = '%s,%s: k repeats an op that is not a stack op' % pc
+                return []
+            return [(self._move(pc, cursor.pc, direction), AbstractStack(exact=False))]
+        else:
+            handler = BefungeOps.op_table[op] if 0 <= op < 256 else None
+            if handler is None or handler is BefungeOps.op_not_implemented:
+                self.illegal.add(pc)
+                return []
+        return [(self._move(pc, pc, direction), stack)]
+
+    def _fold(self, c, b, a):
+        """Return b c a for constants, else None
+
+        """
+        if a is None or b is None:
+            return None
+        if a == 0 and c in '/%':
+            # Leave division by zero to the run
+            return None
+        return BefungeOps.fold(c, b, a, self.program.strict)
+
+    def _blocks(self):
+        """Split the reachable states into basic blocks
+
+        """
+        predecessors = {}
+        for state, following in self.successors.items():
+            for successor in following:
+                predecessors[successor] = predecessors.get(successor, 0) + 1
+        leaders = set(state for state in self.states if predecessors.get(state, 0) != 1)
+        for state, following in self.successors.items():
+            if len(following) != 1:
+                leaders.update(following)
+        blocks = {}
+        for leader in leaders:
+            states = [leader]
+            following = self.successors.get(leader, ())
+            while len(following) == 1:
+                successor = next(iter(following))
+                if successor in leaders:
+                    break
+                states.append(successor)
+                following = self.successors.get(successor, ())
+            blocks[leader] = self._block(states, set(following))
+        return blocks
+
+    def _block(self, states, following):
+        """Return the BasicBlock of states, working out its stack effect
+
+        """
+        text = self.program.text
+        depth = pops = 0
+        clears = False
+        for pc, direction, ascii in states:
+            op = text.get(*pc)
+            if ascii:
+                effect = (0, 0) if op == Cell.QUOTE else (0, 1)
+            elif op == BefungeAnalysis._OP_CLEAR:
+                depth, clears = 0, True
+                continue
+            elif op in (BefungeAnalysis._OP_BEGIN, BefungeAnalysis._OP_END,
+                    BefungeAnalysis._OP_UNDER, BefungeAnalysis._OP_ITERATE,
+                    BefungeAnalysis._OP_INPUT_FILE, BefungeAnalysis._OP_OUTPUT_FILE):
+                return BasicBlock(states[0], states, following, None, None, clears)
+            else:
+                effect = BefungeAnalysis._EFFECTS.get(op, (0, 0))
+            depth -= effect[0]
+            if depth < 0:
+                # Pops after a clear give zeros instead of taking values
+                if not clears:
+                    pops -= depth
+                depth = 0
+            depth += effect[1]
+        return BasicBlock(states[0], states, following, pops, depth, clears)
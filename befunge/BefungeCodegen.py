@@ -0,0 +1,194 @@
+from BefungeOps import BefungeOps
+
+
+class BlockEmitter(object):
+    """Compiles a straight run of befunge ops into Python source
+
+    The stack is tracked symbolically while emitting: every entry is
+    either an int constant or the name of a local variable. Values the
+    block needs from below its own pushes are read from the real stack
+    list 's' once in the prelude, and whatever is left on the symbolic
+    stack is pushed back once in the epilogue. Constant operands are
+    folded at compile time.
+
+    The generated lines expect these names to be bound:
+    s - the list backing the stack
+    out - callable writing a string to the program output
+    get - callable implementing 'g'
+    divide, modulo - the same helpers BefungeOps uses for / and %
+
+    """
+
+    """Ops that only touch the pc or direction.
+    Callers resolve the control flow, so they emit nothing.
+    """
+    FLOW_OPS = frozenset(ord(c) for c in ' z#><^v[]r')
+
+    """Ops that work on the stack and can be emitted
+    """
+    STACK_OPS = frozenset(ord(c) for c in '0123456789abcdef+-*/%!`:\\$n.,g')
+
+    def __init__(self):
+        self.lines = []
+        self.stack = []
+        # Number of values popped from the real stack
+        self.need = 0
+        # Number of values read from the real stack
+        self.read = 0
+        # Stack was cleared by 'n', so the real stack is empty
+        self.cleared = False
+        self.temps = 0
+
+    @staticmethod
+    def supports(op):
+        """Return True if op can be emitted
+
+        """
+        return op in BlockEmitter.FLOW_OPS or op in BlockEmitter.STACK_OPS
+
+    def _temp(self, expr):
+        """Assign expr to a new local and return its name
+
+        """
+        name = 't%d' % self.temps
+        self.temps += 1
+        self.lines.append('%s = %s' % (name, expr))
+        return name
+
+    def _virtual(self, n):
+        """Name of the n-th value from the top of the real stack
+
+        """
+        self.read = max(self.read, n + 1)
+        return 'i%d' % n
+
+    def pop(self):
+        """Pop a value off the symbolic stack
+
+        """
+        if self.stack:
+            return self.stack.pop()
+        if self.cleared:
+            return 0
+        self.need += 1
+        return self._virtual(self.need - 1)
+
+    def peek(self):
+        """Return the top of the symbolic stack without popping it
+
+        """
+        if self.stack:
+            return self.stack[-1]
+        if self.cleared:
+            return 0
+        return self._virtual(self.need)
+
+    def push(self, value):
+        """Push a constant or local name onto the symbolic stack
+
+        """
+        self.stack.append(value)
+
+    def push_expr(self, expr):
+        """Assign expr to a new local and push it
+
+        """
+        self.push(self._temp(expr))
+
+    def statement(self, line):
+        """Emit a line as is
+
+        """
+        self.lines.append(line)
+
+    def op(self, op):
+        """Emit a single op
+
+        Parameters:
+        op - int value of the op
+
+        """
+        c = chr(op)
+        if op in BlockEmitter.FLOW_OPS:
+            pass
+        elif '0' <= c <= '9':
+            self.push(op - 48)
+        elif 'a' <= c <= 'f':
+            self.push(op - 87)
+        elif c in '+-*':
+            a, b = self.pop(), self.pop()
+            if type(a) is int and type(b) is int:
+                self.push(b + a if c == '+' else b - a if c == '-' else b * a)
+            else:
+                self.push(self._temp('%s %s %s' % (b, c, a)))
+        elif c in '/%':
+            a, b = self.pop(), self.pop()
+            # Leave division by zero to the runtime
+            if type(a) is int and type(b) is int and a != 0:
+                self.push(BefungeOps.divide(b, a) if c == '/' else BefungeOps.modulo(b, a))
+            else:
+                self.push(self._temp('%s(%s, %s)' % ('divide' if c == '/' else 'modulo', b, a)))
+        elif c == '!':
+            a = self.pop()
+            if type(a) is int:
+                self.push(1 if a == 0 else 0)
+            else:
+                self.push(self._temp('1 if %s == 0 else 0' % a))
+        elif c == '`':
+            a, b = self.pop(), self.pop()
+            if type(a) is int and type(b) is int:
+                self.push(1 if b > a else 0)
+            else:
+                self.push(self._temp('1 if %s > %s else 0' % (b, a)))
+        elif c == ':':
+            self.push(self.peek())
+        elif c == '\\':
+            a, b = self.pop(), self.pop()
+            self.push(a)
+            self.push(b)
+        elif c == '$':
+            self.pop()
+        elif c == 'n':
+            self.stack = []
+            if not self.cleared:
+                self.lines.append('del s[:]')
+                self.cleared = True
+        elif c == '.':
+            self.lines.append("out(str(%s) + ' ')" % self.pop())
+        elif c == ',':
+            self.lines.append('out(chr(%s))' % self.pop())
+        elif c == 'g':
+            y, x = self.pop(), self.pop()
+            self.push(self._temp('get(%s, %s)' % (x, y)))
+        else:
+            raise ValueError('Can not emit op %s' % c)
+
+    def prelude(self):
+        """Lines reading the needed values from the real stack
+
+        """
+        lines = []
+        if self.read:
+            names = ', '.join('i%d' % n for n in reversed(range(self.read)))
+            lines.append('%s%s = s[-%d:] if len(s) >= %d else ([0] * %d + s)[-%d:]' % (
+                names, ',' if self.read == 1 else '',
+                self.read, self.read, self.read, self.read))
+        if self.need:
+            lines.append('del s[-%d:]' % self.need)
+        return lines
+
+    def epilogue(self):
+        """Lines pushing the symbolic stack back onto the real stack
+
+        """
+        if len(self.stack) == 1:
+            return ['s.append(%s)' % self.stack[0]]
+        elif self.stack:
+            return ['s.extend((%s))' % ', '.join(str(x) for x in self.stack)]
+        return []
+
+    def body(self):
+        """All lines of the block: prelude, ops and epilogue
+
+        """
+        return self.prelude() + self.lines + self.epilogue()
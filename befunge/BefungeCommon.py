@@ -13,34 +13,95 @@ class OpCodeNotImplemented(Exception):
     pass
 
 
+class CompileException(Exception):
+    pass
+
+
+class CycleException(Exception):
+    pass
+
+
 class Direction():
-    LEFT, RIGHT, DOWN, UP = "LEFT", "RIGHT", "DOWN", "UP"
+    """Directions are (dx, dy) deltas, y grows downwards
+    """
+    LEFT, RIGHT, DOWN, UP = (-1, 0), (1, 0), (0, 1), (0, -1)
     ALL = [LEFT, RIGHT, DOWN, UP]
-    OPPOSITE = {
-        LEFT: RIGHT,
-        RIGHT: LEFT,
-        UP: DOWN,
-        DOWN: UP
-    }
-    TURN_LEFT = {
-        LEFT: DOWN,
-        RIGHT: UP,
-        UP: LEFT,
-        DOWN: RIGHT
-    }
-    TURN_RIGHT = {
-        LEFT: UP,
-        RIGHT: DOWN,
-        UP: RIGHT,
-        DOWN: LEFT
-    }
+
+    @staticmethod
+    def reverse(direction):
+        dx, dy = direction
+        return (-dx, -dy)
+
+    @staticmethod
+    def turn_left(direction):
+        dx, dy = direction
+        return (dy, -dx)
+
+    @staticmethod
+    def turn_right(direction):
+        dx, dy = direction
+        return (-dy, dx)
+
+
+class Cell(object):
+    """Integer values of the cells the interpreter looks at directly
+    """
+    SPACE, QUOTE, SEMICOLON = ord(' '), ord('"'), ord(';')
 
 
 class BefungeMode(object):
-    OP, ASCII, JUMP, FINISHED = "OP", "ASCII", "JUMP", "FINISHED"
+    OP, ASCII, JUMP, FINISHED = 0, 1, 2, 3
+
+
+class FlushPolicy(object):
+    """When a BefungeOutput writes its buffer out
+    SIZE - buffer is full, NEWLINE - after a newline,
+    TIME - interval has passed, EXIT - only on flush()
+    """
+    SIZE, NEWLINE, TIME, EXIT = 'size', 'newline', 'time', 'exit'
+    ALL = [SIZE, NEWLINE, TIME, EXIT]
+
+
+class CyclePolicy(object):
+    """What BefungeProgram.run does about a program stuck in a cycle
+    RAISE - raise CycleException, REPORT - stop and report it on stderr
+    """
+    RAISE, REPORT = 'raise', 'report'
+    ALL = [RAISE, REPORT]
+
+
+class ExitReason(object):
+    """Why BefungeProgram.run returned
+    FINISHED - every thread ended, STEPS - ran max_steps ticks,
+    DEADLINE - ran for deadline seconds, CELLS - program held more than
+    max_cells cells, STACK - stacks held more than max_stack values,
+    CYCLE - stuck in a cycle with CyclePolicy.REPORT
+    """
+    FINISHED, STEPS, DEADLINE, CELLS, STACK, CYCLE = (
+        'finished', 'steps', 'deadline', 'cells', 'stack', 'cycle')
+    ALL = [FINISHED, STEPS, DEADLINE, CELLS, STACK, CYCLE]
+
+
+class TraceCursor(object):
+    """Stand-in for a thread while following the program without running it
+    Flow ops and BefungeProgram.advance only look at pc and direction
+
+    """
+
+    def __init__(self, pc, direction):
+        self.pc = pc
+        self.direction = direction
 
 
 class Color():
+    """Backgrounds of Color.heat, from cold to hot
+    """
+    HEAT = ['on_blue', 'on_cyan', 'on_yellow', 'on_red']
+
+    @staticmethod
+    def heat(x, level):
+        return termcolor.colored(x, 'grey', Color.HEAT[level])
+
     @staticmethod
     def blue(x):
         return termcolor.colored(x, 'blue')
@@ -0,0 +1,258 @@
+import inspect
+
+from BefungeCommon import Direction, Cell, TraceCursor
+from BefungeCommon import CompileException
+from BefungeOps import BefungeOps
+from BefungeCodegen import BlockEmitter
+from BefungeProgram import BefungeProgram
+from BefungeAnalysis import BefungeAnalysis
+from BefungeInput import BefungeInput
+
+
+"""Runtime shared by every compiled module
+Mirrors BefungeText.get/put and BefungeOps.divide/modulo,
+and reads input with the source of BefungeInput
+"""
+RUNTIME = inspect.getsource(BefungeInput) + '''
+
+def get(x, y):
+    if 0 <= x < W and 0 <= y < H:
+        return cells[y * W + x]
+    return 32
+
+
+def put(x, y, v):
+    cells[y * W + x] = v
+
+
+def divide(b, a):
+    return b // a
+
+
+def modulo(b, a):
+    return b % a
+
+
+def read_int():
+    sys.stdout.flush()
+    return stdin.read_int()
+
+
+def read_chr():
+    sys.stdout.flush()
+    return stdin.read_chr()
+
+
+stdin = BefungeInput()
+out = sys.stdout.write
+'''
+
+"""Module running the interpreter when a program can not be compiled
+"""
+FALLBACK = '''#!/usr/bin/env python3
+"""Generated by befunge.py --compile from %(name)s
+Not compiled, runs the interpreter instead: %(reason)s
+"""
+from befunge.BefungeProgram import BefungeProgram
+
+PROGRAM = %(source)r
+
+if __name__ == "__main__":
+    BefungeProgram(text=PROGRAM).run()
+    print("")
+'''
+
+
+class BefungeCompiler(object):
+    """Compiles a befunge program to a standalone Python module
+
+    The program is walked statically from (0,0) over (pc, direction,
+    string mode) states. Every state reached by a branch ('_', '|',
+    '?', 'w', or the end of input for '&' and '~') starts a basic
+    block, and each block becomes a function that keeps the stack in
+    locals (see BlockEmitter) and returns the index of the next block.
+
+    Compilation fails with CompileException when soundness can not be
+    shown: threads, computed 'j', ops without a static meaning, or a
+    BefungeAnalysis that does not hold for the whole run, as a 'p'
+    could write to a cell the program goes over or outside of the
+    bounding box.
+
+    """
+
+    _OP_AT, _OP_P, _OP_J = ord('@'), ord('p'), ord('j')
+    _OP_RANDOM, _OP_TURN = ord('?'), ord('w')
+    _INPUTS = {ord('&'): 'read_int()', ord('~'): 'read_chr()'}
+    _BRANCHES = {
+        ord('_'): (Direction.RIGHT, Direction.LEFT),
+        ord('|'): (Direction.DOWN, Direction.UP)
+    }
+
+    def __init__(self, text, name='<string>', max_length=1000):
+        """Load the program
+
+        Parameters:
+        text - program string with newlines
+        name - name of the program shown in the module docstring
+        max_length - maximum number of ops in a block, default=1000
+
+        """
+        self.source = text
+        self.name = name
+        self.max_length = max_length
+        self.program = BefungeProgram(text=text)
+        self.text = self.program.text
+
+    def module(self):
+        """Return the compiled module, or a module running
+        the interpreter if the program can not be compiled
+
+        """
+        try:
+            return self.compile()
+        except CompileException as e:
+            return FALLBACK % {'name': self.name, 'reason': e, 'source': self.source}
+
+    def compile(self):
+        """Return the source of the compiled module
+
+        """
+        analysis = BefungeAnalysis(self.program)
+        if not analysis.static:
+            raise CompileException(analysis.reason)
+        self.leaders = {}
+        self.order = []
+        blocks = []
+        self._leader(((0, 0), Direction.RIGHT, False))
+        while len(blocks) < len(self.order):
+            blocks.append(self._block(len(blocks), self.order[len(blocks)]))
+        text = self.text
+        lines = [
+            '#!/usr/bin/env python3',
+            '"""Generated by befunge.py --compile from %s"""' % self.name,
+            'import random',
+            'import sys',
+            '',
+            'W, H = %d, %d' % (text.width, text.height),
+            'cells = %r' % text.cells.tolist(),
+            RUNTIME
+        ]
+        for block in blocks:
+            lines += block + ['', '']
+        lines += [
+            'BLOCKS = [%s]' % ', '.join('b%d' % i for i in range(len(blocks))),
+            '',
+            '',
+            'def main():',
+            '    s = []',
+            '    i = 0',
+            '    while i >= 0:',
+            '        i = BLOCKS[i](s)',
+            '    print("")',
+            '',
+            '',
+            'if __name__ == "__main__":',
+            '    main()',
+            ''
+        ]
+        return '\n'.join(lines)
+
+    def _leader(self, state):
+        """Return the block index of state, adding a block if needed
+
+        """
+        if state not in self.leaders:
+            self.leaders[state] = len(self.order)
+            self.order.append(state)
+        return self.leaders[state]
+
+    def _move(self, pc, direction):
+        """Advance from pc in direction and return the new state
+
+        """
+        cursor = TraceCursor(pc, direction)
+        self.program.advance(cursor)
+        return (cursor.pc, direction, False)
+
+    def _block(self, index, state):
+        """Return the lines of the block function starting at state
+
+        """
+        program, text = self.program, self.text
+        emitter = BlockEmitter()
+        pc, direction, ascii = state
+        cursor = TraceCursor(pc, direction)
+        seen = set()
+        exit = None
+        tail = []
+        while exit is None:
+            state = (cursor.pc, cursor.direction, ascii)
+            if len(seen) and state in self.leaders:
+                exit = '%d' % self.leaders[state]
+                break
+            if state in seen or len(seen) >= self.max_length:
+                exit = '%d' % self._leader(state)
+                break
+            seen.add(state)
+            x, y = cursor.pc
+            op = text.get(x, y)
+            if ascii:
+                if op == Cell.QUOTE:
+                    ascii = False
+                else:
+                    emitter.push(op)
+            elif op == Cell.QUOTE:
+                ascii = True
+            elif op == Cell.SEMICOLON:
+                BefungeOps.op_jump_over(program, cursor)
+            elif op in BefungeCompiler._BRANCHES:
+                a = emitter.pop()
+                zero, other = [self._move(cursor.pc, d) for d in BefungeCompiler._BRANCHES[op]]
+                if type(a) is int:
+                    cursor.pc, cursor.direction, _ = zero if a == 0 else other
+                    continue
+                exit = '%d if %s == 0 else %d' % (self._leader(zero), a, self._leader(other))
+            elif op == BefungeCompiler._OP_RANDOM:
+                targets = [self._leader(self._move(cursor.pc, d)) for d in Direction.ALL]
+                exit = '%r[random.randint(0, 3)]' % (tuple(targets),)
+            elif op == BefungeCompiler._OP_TURN:
+                b, a = emitter.pop(), emitter.pop()
+                targets = []
+                for turn in (Direction.turn_left, Direction.turn_right):
+                    targets.append(self._leader(self._move(cursor.pc, turn(cursor.direction))))
+                targets.append(self._leader(self._move(cursor.pc, cursor.direction)))
+                exit = '%d if %s < %s else %d if %s < %s else %d' % (
+                    targets[0], a, b, targets[1], b, a, targets[2])
+            elif op == BefungeCompiler._OP_AT:
+                exit = '-1'
+            elif op == BefungeCompiler._OP_P:
+                # The analysis showed it only writes data
+                y, x, v = emitter.pop(), emitter.pop(), emitter.pop()
+                emitter.statement('put(%s, %s, %s)' % (x, y, v))
+            elif op == BefungeCompiler._OP_J:
+                a = emitter.pop()
+                if type(a) is not int:
+                    raise CompileException('%s,%s: j with computed distance' % cursor.pc)
+                cursor.pc = text.jump(cursor.pc, cursor.direction, a)
+            elif op in BefungeCompiler._INPUTS:
+                # Reflects at the end of input, so the block ends here
+                reflect = self._move(cursor.pc, Direction.reverse(cursor.direction))
+                tail = [
+                    'v = %s' % BefungeCompiler._INPUTS[op],
+                    'if v is None:',
+                    '    return %d' % self._leader(reflect),
+                    's.append(v)'
+                ]
+                exit = '%d' % self._leader(self._move(cursor.pc, cursor.direction))
+            elif BlockEmitter.supports(op):
+                emitter.op(op)
+                if op in BlockEmitter.FLOW_OPS:
+                    BefungeOps.op_table[op](program, cursor)
+            else:
+                raise CompileException('%s,%s: %s can not be compiled' % (x, y, chr(op)))
+            if exit is None:
+                program.advance(cursor)
+        lines = ['def b%d(s):' % index]
+        lines += ['    ' + line for line in emitter.body() + tail]
+        lines.append('    return %s' % exit)
+        return lines
@@ -0,0 +1,92 @@
+from BefungeCommon import BefungeMode
+
+
+class BefungeCycleDetector(object):
+    """Recognizes programs stuck in a cycle with Brent's algorithm
+
+    As long as no thread runs '?', '&' or '~' and no put changes the
+    program, the threads are all there is to the state of a program,
+    and a state seen before means the program runs in circles forever.
+    check() is called after every step: the state is kept at ticks
+    1, 2, 4, 8... after the last reset, or the first check past them,
+    and the current state compared to it, so a cycle is found within
+    two of its periods once it has been entered, keeping one state at
+    a time. Steps are counted in ticks, so a step that covers many
+    ticks, as closed-form loops do, counts all of them.
+
+    States are compared by pc, direction, mode, delay and stack depth
+    of every thread first, and by stack contents only if those match.
+
+    """
+
+    _NONDETERMINISTIC = frozenset(ord(c) for c in '?&~')
+
+    def __init__(self, program):
+        """Watch a program and its puts
+
+        Parameters:
+        program - BefungeProgram to watch
+
+        """
+        self.program = program
+        self.steps = 0
+        program.text.watchers.append(self.reset)
+        self.reset()
+
+    def reset(self, x=None, y=None):
+        """Forget the kept state, after anything that is not part of it
+        changed
+
+        """
+        self.kept = None
+        self.power = 1
+        self.period = 0
+
+    def _state(self):
+        """Return the cheap part of the state
+
+        """
+        threads = self.program.threads
+        if len(threads) == 1:
+            thread = threads.head
+            return (thread.pc, thread.direction, thread.mode, thread.delay, len(thread.stack))
+        return tuple((thread.pc, thread.direction, thread.mode, thread.delay, len(thread.stack))
+            for thread in threads)
+
+    def _stacks(self):
+        """Return the stack contents of all threads, with where their
+        stacks start and their storage offsets
+
+        """
+        return tuple((tuple(thread.stack.values()), tuple(thread.stack.bases), thread.stack.base,
+            thread.offset) for thread in self.program.threads)
+
+    def check(self, ticks=1):
+        """Look at the program after a step
+        Return the period of the cycle in ticks if the state was seen
+        before, else None
+
+        Parameters:
+        ticks - ticks the step took, default=1
+
+        """
+        self.steps += ticks
+        threads = self.program.threads
+        if not threads:
+            return None
+        for thread in (threads.head,) if len(threads) == 1 else threads:
+            if thread.op in BefungeCycleDetector._NONDETERMINISTIC and thread.mode == BefungeMode.OP:
+                self.reset()
+                return None
+        state = self._state()
+        if self.kept is None:
+            self.kept = (state, self._stacks())
+            return None
+        self.period += ticks
+        if state == self.kept[0] and self._stacks() == self.kept[1]:
+            return self.period
+        if self.period >= self.power:
+            self.kept = (state, self._stacks())
+            self.power *= 2
+            self.period = 0
+        return None
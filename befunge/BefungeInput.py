@@ -0,0 +1,109 @@
+import sys
+
+
+class BefungeInput(object):
+    """Reads program input from a binary stream in chunks
+
+    Bytes are read into a buffer as they become available, never
+    blocking for more than the next chunk, and parsed from there:
+    read_chr - the next character, newlines included
+    read_int - skips anything up to a decimal number, optionally
+               signed, and reads it along with a newline right after
+               it, leaving any other character after it
+    Both return None at the end of input.
+
+    """
+
+    def __init__(self, stream=None, size=65536):
+        """Start with an empty buffer
+
+        Parameters:
+        stream - binary stream, default=buffer of sys.stdin at read time
+        size - bytes to read at once, default=65536
+
+        """
+        self.stream = stream
+        self.size = size
+        self.buffer = bytearray()
+        self.position = 0
+        self.eof = False
+
+    def _fill(self):
+        """Read the next chunk, return False at the end of input
+
+        """
+        if self.eof:
+            return False
+        # Drop what has been parsed already
+        del self.buffer[:self.position]
+        self.position = 0
+        stream = self.stream
+        if stream is None:
+            stream = getattr(sys.stdin, 'buffer', None)
+        if stream is None:
+            # Text only stdin, e.g. io.StringIO
+            chunk = sys.stdin.read(self.size).encode('utf-8', 'surrogateescape')
+        else:
+            # read1 returns whatever is there instead of waiting for size bytes
+            chunk = getattr(stream, 'read1', stream.read)(self.size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def _peek(self):
+        """Return the next byte without reading it, None at the end of input
+
+        """
+        if self.position >= len(self.buffer) and not self._fill():
+            return None
+        return self.buffer[self.position]
+
+    def read_chr(self):
+        """Return the value of the next character, None at the end of input
+
+        """
+        lead = self._peek()
+        if lead is None:
+            return None
+        # Length of an UTF-8 sequence from its lead byte
+        length = 1 if lead < 0xc0 else 2 if lead < 0xe0 else 3 if lead < 0xf0 else 4
+        while len(self.buffer) - self.position < length and self._fill():
+            pass
+        data = bytes(self.buffer[self.position:self.position + length])
+        text = data.decode('utf-8', 'surrogateescape')
+        # Undecodable bytes are taken one at a time
+        if len(text) != 1:
+            text = data[:1].decode('utf-8', 'surrogateescape')
+            length = 1
+        self.position += length
+        return ord(text)
+
+    def read_int(self):
+        """Return the next decimal number, None at the end of input
+
+        """
+        negative = False
+        while True:
+            c = self._peek()
+            if c is None:
+                return None
+            self.position += 1
+            if 48 <= c <= 57:
+                break
+            negative = c == 45
+        value = c - 48
+        while True:
+            c = self._peek()
+            if c is None or not 48 <= c <= 57:
+                break
+            self.position += 1
+            value = value * 10 + c - 48
+        # A number typed on a line of its own takes the line with it
+        if c == 13:
+            self.position += 1
+            c = self._peek()
+        if c == 10:
+            self.position += 1
+        return -value if negative else value
@@ -0,0 +1,186 @@
+from BefungeCommon import Direction, BefungeMode, TraceCursor
+from BefungeOps import BefungeOps
+from BefungeCodegen import BlockEmitter
+
+
+class BefungeJit(object):
+    """Records and compiles hot straight-line traces
+
+    Once a (pc, direction) has been reached threshold times, the trace
+    starting there is recorded by following the program without running
+    it. It goes on for as long as every op is a flow op, whose outcome
+    is fixed, or a stack op BlockEmitter can compile. A trace ends before
+    any other op, or with a '_' or '|', compiled as a two way exit, or
+    with a 'p', after which the pc is advanced at run time since the put
+    may change the way ahead.
+
+    Traces are cached by (pc, direction). Every cell a trace walks over,
+    whitespace included, is remembered, and a put into one of them
+    evicts the trace. Growing the bounding box changes wraparound, so it
+    evicts all traces.
+
+    """
+
+    _OP_P = ord('p')
+    _BRANCHES = {
+        ord('_'): (Direction.RIGHT, Direction.LEFT),
+        ord('|'): (Direction.DOWN, Direction.UP)
+    }
+
+    def __init__(self, program, threshold=16, max_length=256):
+        """Attach to a program and watch its puts
+
+        Parameters:
+        program - BefungeProgram to run
+        threshold - visits before a trace is recorded, default=16
+        max_length - maximum number of ops in a trace, default=256
+
+        """
+        self.program = program
+        self.threshold = threshold
+        self.max_length = max_length
+        self.counts = {}
+        self.traces = {}
+        self.covers = {}
+        self.bbox = (program.text.width, program.text.height)
+        program.text.watchers.append(self.write_barrier)
+
+    def run(self):
+        """Run the only thread of the program until it finishes or splits
+        Return the number of ticks run
+
+        """
+        threads = self.program.threads
+        ticks = 0
+        while len(threads) == 1:
+            ticks += self.dispatch()
+        return ticks
+
+    def dispatch(self):
+        """Run a closed-form loop, a trace or a single step of the
+        only thread of the program
+        Return the number of ticks run
+
+        """
+        program = self.program
+        thread = program.threads[0]
+        # Traces see the whole list of the stack as theirs, and
+        # 'g' in them takes no storage offset
+        if thread.mode == BefungeMode.OP and thread.stack.base == 0 and thread.offset == (0, 0):
+            key = (thread.pc, thread.direction)
+            if program.loops is not None:
+                # Traces end at branches, so they end at loop heads too
+                loop = program.loops.loops.get(key)
+                if loop is not None:
+                    skipped = loop.run(program, thread)
+                    if skipped:
+                        return skipped
+            trace = self.traces.get(key)
+            if trace is None:
+                counts = self.counts
+                count = counts[key] = counts.get(key, 0) + 1
+                if count >= self.threshold:
+                    trace = self.record(*key)
+            if trace:
+                # Traces return the number of ops they ran
+                return trace(program, thread)
+        return program.step()
+
+    def write_barrier(self, x, y):
+        """Evict all traces walking over x,y
+
+        """
+        text = self.program.text
+        if (text.width, text.height) != self.bbox:
+            self.bbox = (text.width, text.height)
+            self.traces.clear()
+            self.covers.clear()
+            self.counts.clear()
+            return
+        for key in self.covers.pop((x, y), ()):
+            self.traces.pop(key, None)
+            self.counts.pop(key, None)
+
+    def _exit(self, pc, direction, cells):
+        """Advance from pc in direction and return the new pc
+
+        """
+        cursor = TraceCursor(pc, direction)
+        self.program.advance(cursor)
+        cells.update(self.program.text.cells_between(pc, cursor.pc, direction))
+        return cursor.pc
+
+    def record(self, pc, direction):
+        """Record, compile and cache the trace starting at pc, direction
+        Return the trace function, or False if there is no trace here
+
+        """
+        program = self.program
+        text = program.text
+        emitter = BlockEmitter()
+        cursor = TraceCursor(pc, direction)
+        cells = set([pc])
+        seen = set()
+        length = 0
+        tail = []
+        while length < self.max_length and (cursor.pc, cursor.direction) not in seen:
+            seen.add((cursor.pc, cursor.direction))
+            op = text.get(*cursor.pc)
+            if op in BefungeJit._BRANCHES:
+                length += 1
+                zero, other = BefungeJit._BRANCHES[op]
+                a = emitter.pop()
+                exits = [(self._exit(cursor.pc, d, cells), d) for d in (zero, other)]
+                if type(a) is int:
+                    cursor.pc, cursor.direction = exits[0 if a == 0 else 1]
+                else:
+                    tail = [
+                        'if %s == 0:' % a,
+                        '    thread.pc, thread.direction = %r, %r' % exits[0],
+                        'else:',
+                        '    thread.pc, thread.direction = %r, %r' % exits[1]
+                    ]
+                break
+            if op == BefungeJit._OP_P:
+                length += 1
+                y, x, v = emitter.pop(), emitter.pop(), emitter.pop()
+                tail = [
+                    'thread.pc, thread.direction = %r, %r' % (cursor.pc, cursor.direction),
+                    'program.text.put(%s, %s, %s)' % (x, y, v),
+                    'program.advance(thread)'
+                ]
+                break
+            if not BlockEmitter.supports(op):
+                break
+            length += 1
+            emitter.op(op)
+            start = cursor.pc
+            if op in BlockEmitter.FLOW_OPS:
+                BefungeOps.op_table[op](program, cursor)
+            program.advance(cursor)
+            cells.update(text.cells_between(start, cursor.pc, cursor.direction))
+        if not tail:
+            tail = ['thread.pc, thread.direction = %r, %r' % (cursor.pc, cursor.direction)]
+        key = (pc, direction)
+        if length < 2:
+            trace = False
+            cells = [pc]
+        else:
+            lines = [
+                'def trace(program, thread):',
+                # Bring what the trace reads out of shared segments
+                '    s = thread.stack.reserve(%d)' % emitter.read,
+                '    out = program.output',
+                '    get = program.text.get'
+            ]
+            if emitter.cleared:
+                lines.append('    thread.stack.shared = None')
+            lines += ['    ' + line for line in emitter.body() + tail]
+            lines.append('    return %d' % length)
+            scope = {'divide': BefungeOps.divide, 'modulo': BefungeOps.modulo}
+            exec('\n'.join(lines), scope)
+            trace = scope['trace']
+        self.traces[key] = trace
+        for cell in cells:
+            self.covers.setdefault(cell, set()).add(key)
+        return trace
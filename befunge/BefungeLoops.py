@@ -0,0 +1,272 @@
+from math import gcd
+
+from BefungeCommon import Cell, TraceCursor
+from BefungeOps import BefungeOps
+from BefungeCodegen import BlockEmitter
+
+
+def mat_mul(a, b, modulus=None):
+    """Return the product of two square matrices, reduced by modulus
+    if there is one
+
+    """
+    n = len(a)
+    c = [[sum(a[i][k] * b[k][j] for k in range(n)) for j in range(n)] for i in range(n)]
+    if modulus is not None:
+        c = [[x % modulus for x in row] for row in c]
+    return c
+
+
+def mat_pow(m, e, modulus=None):
+    """Return m to the power of e by squaring
+
+    """
+    n = len(m)
+    result = [[1 if i == j else 0 for j in range(n)] for i in range(n)]
+    while e:
+        if e & 1:
+            result = mat_mul(result, m, modulus)
+        m = mat_mul(m, m, modulus)
+        e >>= 1
+    return result
+
+
+class CountedLoop(object):
+    """A loop whose iterations apply x' = A x + b to the top k values
+    of the stack, x[0] being the top, and that ends once the affine
+    condition w x + e it branches on is zero. w A = w holds, so the
+    condition changes by the same d = w b every iteration and the
+    number of iterations left is known up front. In strict mode the
+    condition wraps around, so the count is solved modulo 2**32.
+
+    Parameters:
+    matrix - A followed by b, as the augmented k+1 x k+1 matrix
+    condition - (w, e)
+    ticks - number of cells one iteration executes
+
+    """
+
+    def __init__(self, matrix, condition, ticks):
+        self.matrix = matrix
+        self.condition = condition
+        self.ticks = ticks
+        self.k = len(matrix) - 1
+        w, _ = condition
+        self.step = sum(w[j] * matrix[j][self.k] for j in range(self.k))
+
+    def run(self, program, thread, limit=None):
+        """Run all iterations but the last one on thread, which is at
+        the head of the loop, or as many as fit in limit
+        Return the number of ticks they take, or 0 if the loop does not
+        end or would not run at all
+
+        The thread is the only one, so nobody can tell the ticks were
+        not spent.
+
+        Parameters:
+        program - BefungeProgram of thread
+        thread - thread at the head of the loop
+        limit - ticks the iterations may take, default=unlimited
+
+        """
+        k = self.k
+        stack = thread.stack
+        # Other threads could change the program or see the ticks
+        if len(program.threads) != 1 or len(stack) < k or self.step == 0:
+            return 0
+        x = stack.peek_many(k)[::-1]
+        w, e = self.condition
+        c = sum(w[j] * x[j] for j in range(k)) + e
+        # Iterations until the condition is zero, if it ever is
+        modulus = None
+        if program.strict:
+            modulus = 1 << 32
+            n = self._count32(c)
+        else:
+            n, rest = divmod(-c, self.step)
+            if rest:
+                return 0
+        if limit is not None:
+            # Stopping early leaves the thread at the head, as usual
+            n = min(n, limit // self.ticks)
+        if n < 1:
+            return 0
+        m = mat_pow(self.matrix, n, modulus)
+        x = x + [1]
+        for _ in range(k):
+            stack.pop()
+        stack.push_many([sum(m[j][i] * x[i] for i in range(k + 1)) for j in reversed(range(k))])
+        return n * self.ticks
+
+    def _count32(self, c):
+        """Return the least n with c + n * step = 0 in 32-bit cells,
+        or 0 if there is none
+
+        """
+        modulus = 1 << 32
+        g = gcd(self.step, modulus)
+        if c % g:
+            return 0
+        modulus //= g
+        return (-c // g) * pow(self.step // g, -1, modulus) % modulus
+
+
+class BefungeLoops(object):
+    """Runs counted loops in closed form
+
+    Every '_' and '|' is taken as the end of a loop, whose head is the
+    state after it on its non-zero side. The loop is followed from
+    there without running it, keeping every stack value as an affine
+    function of the values on the stack at the head. It qualifies if
+    it gets back to the same branch with only flow ops, digits, string
+    mode, '+', '-', '*' by a constant, ':', '\\' and '$' on the way,
+    and leaves the stack as deep as it found it. CountedLoop.run then
+    jumps over all iterations but the last.
+
+    Only reachable branches are tried when the program's
+    BefungeAnalysis is static.
+
+    Loops are keyed by the (pc, direction) of their head. Every cell a
+    loop walks over is remembered, and a put into one of them drops
+    the loop. Growing the bounding box changes wraparound, so the pass
+    is redone.
+
+    """
+
+    _BRANCHES = {
+        ord('_'): BefungeOps.op_move_left,
+        ord('|'): BefungeOps.op_move_up
+    }
+    _DIGITS = dict((ord(c), int(c, 16)) for c in '0123456789abcdef')
+    _ADD, _SUB, _MUL = ord('+'), ord('-'), ord('*')
+    _DUP, _SWAP, _POP = ord(':'), ord('\\'), ord('$')
+
+    def __init__(self, program, max_length=256):
+        """Find the loops of the program and watch its puts
+
+        Parameters:
+        program - BefungeProgram to accelerate
+        max_length - maximum number of cells in a loop, default=256
+
+        """
+        self.program = program
+        self.max_length = max_length
+        self.loops = {}
+        self.covers = {}
+        program.text.watchers.append(self.write_barrier)
+        self.analyze()
+
+    def analyze(self):
+        """Look for loops at every branch of the program
+        self.loops is cleared in place, as runners hold on to it
+
+        """
+        text = self.program.text
+        self.loops.clear()
+        self.covers.clear()
+        self.bbox = (text.width, text.height)
+        analysis = self.program.analysis
+        if analysis is not None and analysis.static:
+            branches = set(pc for pc, _, ascii in analysis.states if not ascii)
+        else:
+            branches = text.nonspace()
+        for x, y in branches:
+            if text.get(x, y) in BefungeLoops._BRANCHES:
+                self._loop((x, y))
+
+    def write_barrier(self, x, y):
+        """Drop all loops walking over x,y
+
+        """
+        text = self.program.text
+        if (text.width, text.height) != self.bbox:
+            self.analyze()
+            return
+        for key in self.covers.pop((x, y), ()):
+            self.loops.pop(key, None)
+
+    def _loop(self, branch):
+        """Add the loop ending at the branch at pc branch, if there is one
+
+        """
+        program, text = self.program, self.program.text
+        cursor = TraceCursor(branch, None)
+        BefungeLoops._BRANCHES[text.get(*branch)](program, cursor)
+        program.advance(cursor)
+        head = (cursor.pc, cursor.direction)
+        cells = set(text.cells_between(branch, cursor.pc, cursor.direction))
+        # Affine functions are dicts from variable to factor, None
+        # holding the constant. Variable j is the j-th value from the
+        # top of the stack at the head.
+        stack = []
+        need = [0]
+
+        def pop():
+            if stack:
+                return stack.pop()
+            need[0] += 1
+            return {need[0] - 1: 1}
+
+        ascii = False
+        ticks = 0
+        while True:
+            if ticks >= self.max_length:
+                return
+            op = text.get(*cursor.pc)
+            start = cursor.pc
+            ticks += 1
+            if op == Cell.QUOTE:
+                ascii = not ascii
+            elif ascii:
+                stack.append({None: op})
+            elif cursor.pc == branch:
+                condition = pop()
+                break
+            elif op in BlockEmitter.FLOW_OPS:
+                BefungeOps.op_table[op](program, cursor)
+            elif op in BefungeLoops._DIGITS:
+                stack.append({None: BefungeLoops._DIGITS[op]})
+            elif op in (BefungeLoops._ADD, BefungeLoops._SUB, BefungeLoops._MUL):
+                a, b = pop(), pop()
+                if op == BefungeLoops._MUL:
+                    if set(a) <= set([None]):
+                        a, b = b, a
+                    if not set(b) <= set([None]):
+                        return
+                    factor = b.get(None, 0)
+                    stack.append(dict((v, f * factor) for v, f in a.items()))
+                else:
+                    sign = 1 if op == BefungeLoops._ADD else -1
+                    c = dict(b)
+                    for v, f in a.items():
+                        c[v] = c.get(v, 0) + sign * f
+                    stack.append(c)
+            elif op == BefungeLoops._DUP:
+                a = pop()
+                stack.extend([a, a])
+            elif op == BefungeLoops._SWAP:
+                a, b = pop(), pop()
+                stack.extend([a, b])
+            elif op == BefungeLoops._POP:
+                pop()
+            else:
+                return
+            program.advance(cursor)
+            cells.update(text.cells_between(start, cursor.pc, cursor.direction))
+            if (cursor.pc, cursor.direction) == head and not ascii:
+                # Back at the head without passing the branch
+                return
+        k = need[0]
+        if ascii or k == 0 or len(stack) != k:
+            return
+        # x'[j] is the j-th value from the top after an iteration
+        matrix = [[stack[-1 - j].get(i, 0) for i in range(k)] + [stack[-1 - j].get(None, 0)]
+            for j in range(k)]
+        matrix.append([0] * k + [1])
+        w = [condition.get(j, 0) for j in range(k)]
+        for i in range(k):
+            if sum(w[j] * matrix[j][i] for j in range(k)) != w[i]:
+                return
+        self.loops[head] = CountedLoop(matrix, (w, condition.get(None, 0)), ticks)
+        for cell in cells:
+            self.covers.setdefault(cell, set()).add(head)
@@ -1,23 +1,95 @@
 import random
-import sys
 
-from BefungeCommon import OpCodeNotImplemented
-from BefungeCommon import Direction, BefungeMode
+from BefungeCommon import OpCodeNotImplemented, IllegalOpCodeException
+from BefungeCommon import Direction, BefungeMode, Cell, TraceCursor
 
 
 class BefungeOps(object):
 
+    @staticmethod
+    def divide(b, a):
+        """Return b/a the way '/' computes it
+        """
+        return b // a
+
+    @staticmethod
+    def modulo(b, a):
+        """Return b%a the way '%' computes it
+        """
+        return b % a
+
+    @staticmethod
+    def wrap32(a):
+        """Return a wrapped around to a signed 32-bit int
+        """
+        return ((a + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+    @staticmethod
+    def divide32(b, a):
+        """Return b/a the way '/' computes it in strict mode:
+        truncated towards zero, 0 when dividing by zero
+        """
+        if a == 0:
+            return 0
+        q = abs(b) // abs(a)
+        return BefungeOps.wrap32(q if (a < 0) == (b < 0) else -q)
+
+    @staticmethod
+    def modulo32(b, a):
+        """Return b%a the way '%' computes it in strict mode:
+        with the sign of b, 0 when dividing by zero
+        """
+        if a == 0:
+            return 0
+        r = abs(b) % abs(a)
+        return r if b >= 0 else -r
+
+    @staticmethod
+    def fold(c, b, a, strict=False):
+        """Return b c a for the binary op c in '+-*/%`'
+        the way the program computes it
+        """
+        if c == '`':
+            return 1 if b > a else 0
+        elif c == '/':
+            return BefungeOps.divide32(b, a) if strict else BefungeOps.divide(b, a)
+        elif c == '%':
+            return BefungeOps.modulo32(b, a) if strict else BefungeOps.modulo(b, a)
+        elif c == '+':
+            v = b + a
+        elif c == '-':
+            v = b - a
+        else:
+            v = b * a
+        return BefungeOps.wrap32(v) if strict else v
+
+    @staticmethod
+    def pop_string(stack):
+        """Pop a 0gnirts: values up to and including a 0, the first
+        character on top
+        Return the string, or None if a value is not a character
+        """
+        values = []
+        c = stack.pop()
+        while c != 0:
+            values.append(c)
+            c = stack.pop()
+        if not all(0 < c < 0x110000 for c in values):
+            return None
+        return ''.join(map(chr, values))
+
     @staticmethod
     def pseudo_op_ascii_mode(program, thread):
         """Get int value of ascii char at current pc location
         """
-        thread.stack.push(ord(program.text.get(*thread.pc)))
+        thread.stack.push(thread.op)
 
     def op_push_int(program, thread):
         """Push an integer onto the stack
         """
-        # Get int value in base 16
-        thread.stack.push(int(thread.op, 16))
+        # Get int value in base 16: '0'-'9' then 'a'-'f'
+        op = thread.op
+        thread.stack.push(op - 48 if op < 58 else op - 87)
 
     def op_addition(program, thread):
         """Pop a,b then push a+b
@@ -38,7 +110,7 @@ class BefungeOps(object):
         """
         stack = thread.stack
         a, b = stack.pop(), stack.pop()
-        stack.push(b / a)
+        stack.push(program.divide(b, a))
 
     def op_multiplication(program, thread):
         """Pop a,b then push a*b
@@ -51,7 +123,7 @@ class BefungeOps(object):
         """
         stack = thread.stack
         a, b = stack.pop(), stack.pop()
-        stack.push(b % a)
+        stack.push(program.modulo(b, a))
 
     def op_logical_not(program, thread):
         """Pop a, if a==0 push 1, else push 0
@@ -117,12 +189,17 @@ class BefungeOps(object):
     def op_turn_left(program, thread):
         """Turn left on z-axis
         """
-        thread.direction = Direction.TURN_LEFT[thread.direction]
+        thread.direction = Direction.turn_left(thread.direction)
 
     def op_turn_right(program, thread):
         """Turn right on z-axis
         """
-        thread.direction = Direction.TURN_RIGHT[thread.direction]
+        thread.direction = Direction.turn_right(thread.direction)
+
+    def op_reverse(program, thread):
+        """Reverse direction
+        """
+        thread.direction = Direction.reverse(thread.direction)
 
     def op_move_turn(program, thread):
         """Pop a,b, if a<b then [ elif b>a then ] else nothing
@@ -130,9 +207,9 @@ class BefungeOps(object):
         stack = thread.stack
         b, a = stack.pop(), stack.pop()
         if a < b:
-            BefungeOps.op_map['['](program, thread)
+            BefungeOps.op_turn_left(program, thread)
         elif b < a:
-            BefungeOps.op_map[']'](program, thread)
+            BefungeOps.op_turn_right(program, thread)
         else:
             pass
 
@@ -170,20 +247,12 @@ class BefungeOps(object):
     def op_print_int(program, thread):
         """Pop a and print as integer
         """
-        a = str(thread.stack.pop()) + ' '
-        if program.show_steps:
-            program.stdout_log += a
-        else:
-            sys.stdout.write(a)
+        program.output(str(thread.stack.pop()) + ' ')
 
     def op_print_chr(program, thread):
         """Pop a and print as chr
         """
-        a = chr(thread.stack.pop())
-        if program.show_steps:
-            program.stdout_log += a
-        else:
-            sys.stdout.write(a)
+        program.output(chr(thread.stack.pop()))
 
     def op_trampoline(program, thread):
         """Skip next cell
@@ -196,7 +265,7 @@ class BefungeOps(object):
         # Get next pc until we hit another ;
         while True:
             thread.pc = program.text.get_next_pc(thread.pc, thread.direction)
-            if program.text.get(*thread.pc) == ';':
+            if program.text.get(*thread.pc) == Cell.SEMICOLON:
                 thread.pc = program.text.get_next_pc(thread.pc, thread.direction)
                 return
 
@@ -208,38 +277,130 @@ class BefungeOps(object):
 
     def op_put(program, thread):
         """Pop y,x,v and put value v at position x,y
+        relative to the storage offset
         """
         stack = thread.stack
         y, x, v = stack.pop(), stack.pop(), stack.pop()
-        program.text.put(x, y, v)
+        dx, dy = thread.offset
+        program.text.put(x + dx, y + dy, v)
 
     def op_get(program, thread):
-        """Pop y,x and push ascii value of that char onto stack
+        """Pop y,x and push value of that cell onto stack
+        relative to the storage offset
         """
         stack = thread.stack
         y, x = stack.pop(), stack.pop()
-        v = program.text.get(x, y)
-        if type(v) is str:
-            stack.push(ord(v))
-        else:
-            stack.push(v)
+        dx, dy = thread.offset
+        stack.push(program.text.get(x + dx, y + dy))
+
+    def op_begin_block(program, thread):
+        """Pop n, push a new stack with the top n values moved onto it
+        and the storage offset pushed under them, then set the storage
+        offset to the next cell
+        """
+        stack = thread.stack
+        stack.begin(stack.pop(), thread.offset)
+        (x, y), (dx, dy) = thread.pc, thread.direction
+        thread.offset = (x + dx, y + dy)
+
+    def op_end_block(program, thread):
+        """Pop n, drop the top stack with its top n values moved to the
+        one below, and pop the storage offset from that one
+        Reflect if there is only one stack
+        """
+        stack = thread.stack
+        if not stack.bases:
+            BefungeOps.op_reverse(program, thread)
+            return
+        thread.offset = stack.end(stack.pop())
+
+    def op_stack_under(program, thread):
+        """Pop n, move n values from the stack below to this one, or -n
+        values the other way if n is negative
+        Reflect if there is only one stack
+        """
+        stack = thread.stack
+        if not stack.bases:
+            BefungeOps.op_reverse(program, thread)
+            return
+        stack.under(stack.pop())
 
     def op_input_int(program, thread):
-        """Ask user for integer input and push on stack
+        """Read an integer and push on stack, reflect at end of input
         """
-        is_int = False
-        while(not is_int):
-            try:
-                a = int(input())
-                is_int = True
-            except ValueError:
-                pass
-        thread.stack.push(a)
+        # Show any prompt before waiting
+        program.flush()
+        a = program.input.read_int()
+        if a is None:
+            BefungeOps.op_reverse(program, thread)
+        else:
+            thread.stack.push(a)
 
     def op_input_chr(program, thread):
-        """Ask user for a single char and push on stack
+        """Read a char and push on stack, reflect at end of input
+        """
+        program.flush()
+        a = program.input.read_chr()
+        if a is None:
+            BefungeOps.op_reverse(program, thread)
+        else:
+            thread.stack.push(a)
+
+    def op_input_file(program, thread):
+        """Pop a filename, flags and a vector Va, and load the file with
+        its least point at Va relative to the storage offset, then push
+        its size Vb and Va. Every line is a row, or with flag 1 the
+        whole file is one row. Bytes are cells
+        Reflect if the file can not be read
+        """
+        stack = thread.stack
+        name = BefungeOps.pop_string(stack)
+        flags = stack.pop()
+        y, x = stack.pop(), stack.pop()
+        try:
+            with open(name, 'rb') as f:
+                data = f.read()
+        except (OSError, TypeError, ValueError):
+            BefungeOps.op_reverse(program, thread)
+            return
+        if flags & 1:
+            rows = [data] if data else []
+        else:
+            rows = data.splitlines()
+        dx, dy = thread.offset
+        program.text.put_rect(x + dx, y + dy, rows)
+        stack.push_many([max([len(row) for row in rows] + [0]), len(rows), x, y])
+
+    def op_output_file(program, thread):
+        """Pop a filename, flags and vectors Va and Vb, and write the
+        rectangle of size Vb at Va relative to the storage offset to the
+        file, a line per row. With flag 1, spaces at the end of lines
+        and empty lines at the end are left out. Cells are written as
+        bytes, modulo 256
+        Reflect if the file can not be written
         """
-        thread.stack.push(ord(input()[0]))
+        stack = thread.stack
+        name = BefungeOps.pop_string(stack)
+        flags = stack.pop()
+        y, x = stack.pop(), stack.pop()
+        height, width = stack.pop(), stack.pop()
+        dx, dy = thread.offset
+        lines = []
+        for row in program.text.get_rect(x + dx, y + dy, max(width, 0), max(height, 0)):
+            values = row.tolist()
+            try:
+                lines.append(bytes(values))
+            except ValueError:
+                lines.append(bytes([v & 0xFF for v in values]))
+        if flags & 1:
+            lines = [line.rstrip(b' ') for line in lines]
+            while lines and not lines[-1]:
+                lines.pop()
+        try:
+            with open(name, 'wb') as f:
+                f.write(b''.join([line + b'\n' for line in lines]))
+        except (OSError, TypeError, ValueError):
+            BefungeOps.op_reverse(program, thread)
 
     def op_noop(program, thread):
         """Do nothing
@@ -256,10 +417,35 @@ class BefungeOps(object):
         """
         thread.mode = BefungeMode.FINISHED
 
+    def op_iterate(program, thread):
+        """Pop n and run the next instruction n times from here, then
+        skip it unless it moved the thread. Reflect if n is negative
+        """
+        n = thread.stack.pop()
+        if n < 0:
+            BefungeOps.op_reverse(program, thread)
+            return
+        pc, direction = thread.pc, thread.direction
+        cursor = TraceCursor(pc, direction)
+        program.advance(cursor)
+        if n:
+            op = thread.op = program.text.get(*cursor.pc)
+            repeat = BefungeOps.repeat_map.get(op)
+            if repeat is not None:
+                repeat(program, thread, n)
+            else:
+                handler = BefungeOps.op_table[op] if 0 <= op < 256 else None
+                if handler is None:
+                    raise IllegalOpCodeException('%s,%s: %s' % (cursor.pc[0], cursor.pc[1], op))
+                for _ in range(n):
+                    handler(program, thread)
+        if thread.pc == pc and thread.direction == direction:
+            thread.pc = cursor.pc
+
     def op_not_implemented(program, thread):
         """Raise error for non-implemented opcodes
         """
-        raise OpCodeNotImplemented('%s,%s: %s' % (thread.pc[0], thread.pc[1], thread.op))
+        raise OpCodeNotImplemented('%s,%s: %s' % (thread.pc[0], thread.pc[1], chr(thread.op)))
 
     """Map operators to function handlers
     """
@@ -283,16 +469,16 @@ class BefungeOps(object):
         '?': op_move_random,
         # PC
         '#': op_trampoline, ';': op_jump_over,
-        'j': op_jump,'k': op_not_implemented,
+        'j': op_jump,'k': op_iterate,
         # Stack
         ':': op_duplicate, '\\': op_swap,
         '$': op_pop, 'n': op_clear_stack,
-        'u': op_not_implemented,
+        'u': op_stack_under,
         # I/O
         '.': op_print_int, ',': op_print_chr,
         '&': op_input_int, '~': op_input_chr,
         '=': op_not_implemented,
-        'i': op_not_implemented, 'o': op_not_implemented,
+        'i': op_input_file, 'o': op_output_file,
         # Storage
         'p': op_put, 'g': op_get,
         's': op_not_implemented,
@@ -301,11 +487,71 @@ class BefungeOps(object):
         # Misc
         '\'': op_not_implemented,
         '(': op_not_implemented, ')': op_not_implemented,
-        '{': op_not_implemented, '}': op_not_implemented,
+        '{': op_begin_block, '}': op_end_block,
         '"': op_toggle_ascii,
         ' ': op_noop, 'z': op_noop,
         'x': op_not_implemented,
         'y': op_not_implemented,
-        'r': op_not_implemented,
+        'r': op_reverse,
         'q': op_not_implemented
     }
+    # Cells hold ints, so key handlers by the int value of the char
+    op_map = dict((ord(k), v) for k, v in op_map.items())
+
+    """Handlers indexed by cell value, None for illegal opcodes
+    """
+    op_table = list(map(op_map.get, range(256)))
+
+    def repeat_pop(program, thread, n):
+        """Pop n values at once
+        """
+        thread.stack.drop(n)
+
+    def repeat_duplicate(program, thread, n):
+        """Push n copies of the top value at once
+        """
+        stack = thread.stack
+        stack.push_many([stack.peek()] * n)
+
+    def repeat_push_int(program, thread, n):
+        """Push n copies of the digit at once
+        """
+        op = thread.op
+        thread.stack.push_many([op - 48 if op < 58 else op - 87] * n)
+
+    def repeat_once(program, thread, n):
+        """Run an op that does the same every time once
+        """
+        BefungeOps.op_table[thread.op](program, thread)
+
+    def repeat_turn(program, thread, n):
+        """Turn n times, which comes around after four
+        """
+        for _ in range(n % 4):
+            BefungeOps.op_table[thread.op](program, thread)
+
+    def repeat_reverse(program, thread, n):
+        """Reverse n times, which comes around after two
+        """
+        if n % 2:
+            BefungeOps.op_reverse(program, thread)
+
+    def repeat_trampoline(program, thread, n):
+        """Skip n cells at once
+        """
+        thread.pc = program.text.jump(thread.pc, thread.direction, n)
+
+    """Ops 'k' runs n times without n dispatches
+    """
+    repeat_map = {
+        '0': repeat_push_int, '1': repeat_push_int, '2': repeat_push_int, '3': repeat_push_int,
+        '4': repeat_push_int, '5': repeat_push_int, '6': repeat_push_int, '7': repeat_push_int,
+        '8': repeat_push_int, '9': repeat_push_int, 'a': repeat_push_int, 'b': repeat_push_int,
+        'c': repeat_push_int, 'd': repeat_push_int, 'e': repeat_push_int, 'f': repeat_push_int,
+        '$': repeat_pop, ':': repeat_duplicate,
+        '>': repeat_once, '<': repeat_once, '^': repeat_once, 'v': repeat_once,
+        '?': repeat_once, 'n': repeat_once, 'z': repeat_once, '@': repeat_once,
+        '[': repeat_turn, ']': repeat_turn, 'r': repeat_reverse,
+        '#': repeat_trampoline
+    }
+    repeat_map = dict((ord(k), v) for k, v in repeat_map.items())
@@ -0,0 +1,121 @@
+import sys
+import time
+
+from BefungeCommon import FlushPolicy
+
+
+class BefungeOutput(object):
+    """Buffers program output and writes it out in chunks
+
+    Text is encoded into a bytearray and written to the binary stream
+    according to the flush policy, so printing a char is no syscall.
+    The buffer is always written out once it holds size bytes.
+    With FlushPolicy.TIME, poll() lets a program that went quiet still
+    have its output written in time.
+
+    """
+
+    """Whether getvalue() holds all output, not only the unflushed part
+    """
+    KEEPS_ALL = False
+
+    def __init__(self, stream=None, policy=FlushPolicy.SIZE, size=65536, interval=0.1,
+            clock=time.monotonic):
+        """Set up an empty buffer
+
+        Parameters:
+        stream - binary stream, default=buffer of sys.stdout at flush time
+        policy - FlushPolicy, default=SIZE
+        size - buffer size in bytes, default=65536
+        interval - seconds between flushes with FlushPolicy.TIME, default=0.1
+        clock - monotonic clock in seconds, default=time.monotonic
+
+        """
+        if policy not in FlushPolicy.ALL:
+            raise ValueError('Unknown flush policy: %s' % policy)
+        self.stream = stream
+        self.policy = policy
+        self.size = size
+        self.interval = interval
+        self.clock = clock
+        self.buffer = bytearray()
+        self.last_flush = clock()
+
+    def write(self, s):
+        """Add s to the buffer, flushing as the policy says
+
+        """
+        self.buffer += s.encode('utf-8', 'surrogateescape')
+        if len(self.buffer) >= self.size:
+            self.flush()
+        elif self.policy == FlushPolicy.NEWLINE:
+            if '\n' in s:
+                self.flush()
+        elif self.policy == FlushPolicy.TIME:
+            self.poll()
+
+    def poll(self):
+        """Flush if FlushPolicy.TIME says it is time, also without
+        a write, for run loops about to sleep
+
+        """
+        if self.policy == FlushPolicy.TIME and self.clock() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Write the buffer to the stream
+
+        """
+        self.last_flush = self.clock()
+        if not self.buffer:
+            return
+        data = bytes(self.buffer)
+        del self.buffer[:]
+        stream = self.stream
+        if stream is None:
+            # Look up stdout now, it may have been replaced
+            stream = getattr(sys.stdout, 'buffer', None)
+            if stream is None:
+                # Text only stdout, e.g. io.StringIO
+                sys.stdout.write(data.decode('utf-8', 'surrogateescape'))
+                sys.stdout.flush()
+                return
+            # Anything already written through sys.stdout goes first
+            sys.stdout.flush()
+        stream.write(data)
+        stream.flush()
+
+    def getvalue(self):
+        """Return what has not been flushed yet
+
+        """
+        return self.buffer.decode('utf-8', 'surrogateescape')
+
+
+class CaptureOutput(BefungeOutput):
+    """Keeps all program output in memory, for show_steps and embedding
+
+    """
+
+    KEEPS_ALL = True
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, s):
+        """Add s to the captured output
+
+        """
+        self.buffer += s.encode('utf-8', 'surrogateescape')
+
+    def poll(self):
+        """Nothing to do, output stays in memory
+
+        """
+        pass
+
+    def flush(self):
+        """Nothing to do, output stays in memory
+
+        """
+        pass
@@ -0,0 +1,103 @@
+import time
+
+
+class BefungePacer(object):
+    """Paces the ticks of run() to a rate, like a token bucket
+
+    Tick n is due at n / rate seconds after the first one. wait() is
+    called before every tick and hands out ticks in batches of BATCH
+    seconds once the first of them is due, so the clock is read once
+    a batch and the time ticks and sleeps take is made up by the next
+    batch instead of adding up.
+    A program that falls behind, waiting for input or slower than the
+    rate, catches up by at most BURST seconds worth of ticks.
+    Before it sleeps, poll is called, so output flushed in time gets
+    out while the program is held back.
+
+    """
+
+    """Seconds worth of ticks handed out at once
+    """
+    BATCH = 0.005
+
+    """Seconds worth of ticks a program that fell behind may catch up
+    """
+    BURST = 0.1
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep, poll=None):
+        """Hand out nothing yet
+
+        Parameters:
+        rate - ticks a second
+        clock - monotonic clock in seconds, default=time.monotonic
+        sleep - sleeps for seconds, default=time.sleep
+        poll - called before sleeping, such as BefungeOutput.poll, default=None
+
+        """
+        self.rate = float(rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.poll = poll
+        self.batch = max(1, int(rate * BefungePacer.BATCH))
+        self.burst = max(self.batch, int(rate * BefungePacer.BURST))
+        # Ticks of the current batch left to hand out
+        self.tokens = 0
+        # Ticks the schedule handed out, or gave up on
+        self.scheduled = 0
+        # Ticks handed out
+        self.issued = 0
+        self.start = None
+        self.end = None
+
+    def wait(self):
+        """Return once the next tick is due
+
+        """
+        if self.tokens:
+            self.tokens -= 1
+            return
+        self._refill()
+        self.tokens -= 1
+
+    def _refill(self):
+        """Sleep until the next batch is due and take it
+
+        """
+        now = self.clock()
+        if self.start is None:
+            self.start = now
+        deadline = self.start + self.scheduled / self.rate
+        if now < deadline and self.poll is not None:
+            self.poll()
+            now = self.clock()
+        while now < deadline:
+            self.sleep(deadline - now)
+            now = self.clock()
+        behind = int((now - self.start) * self.rate) - self.scheduled
+        if behind > self.burst:
+            # Give up on the ticks it could not run in time
+            self.scheduled += behind - self.burst
+        self.tokens = self.batch
+        self.scheduled += self.batch
+        self.issued += self.batch
+
+    def stop(self):
+        """Stop the clock of achieved()
+
+        """
+        self.end = self.clock()
+
+    @property
+    def ticks(self):
+        """Ticks run so far
+        """
+        return self.issued - self.tokens
+
+    def achieved(self):
+        """Return the ticks a second run so far, None before the first
+
+        """
+        if self.start is None:
+            return None
+        seconds = (self.end if self.end is not None else self.clock()) - self.start
+        return self.ticks / seconds if seconds > 0 else None
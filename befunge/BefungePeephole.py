@@ -0,0 +1,188 @@
+from BefungeCommon import Direction, Cell, TraceCursor
+from BefungeOps import BefungeOps
+from BefungeCodegen import BlockEmitter
+
+
+class Superinstruction(object):
+    """A fused run of cells executed with a single dispatch
+
+    Parameters:
+    push - constants pushed by the run
+    guard - stack depth the run needs to be fused, smaller stacks
+            run cell by cell
+    ticks - number of cells the run stands for
+    end - (pc, direction) after the run
+
+    """
+
+    def __init__(self, push, guard, ticks, end):
+        self.push = push
+        self.guard = guard
+        self.ticks = ticks
+        self.end = end
+
+    def run(self, program, thread):
+        """Execute the run on thread
+        Return False if the stack is too shallow, or if other threads
+        run, since a put of theirs into the run would come too late
+
+        """
+        stack = thread.stack
+        if len(program.threads) != 1 or (self.guard and len(stack) < self.guard):
+            return False
+        if self.push:
+            stack.push_many(self.push)
+        thread.pc, thread.direction = self.end
+        # Sit out the ticks the run stands for
+        thread.delay = self.ticks - 1
+        return True
+
+
+class BefungePeephole(object):
+    """Fuses stack-only runs of cells into superinstructions
+
+    A pre-pass follows the program from every digit, '"', ':' and '\\'
+    in all four directions, through flow ops with a fixed outcome, and
+    folds what it finds:
+    digits and arithmetic on them - push the resulting constants
+    string mode literals - push the characters
+    ':$' - nothing
+    '\\\\' - nothing, as long as the stack holds two values
+
+    When the program's BefungeAnalysis is static, only reachable
+    states are tried.
+
+    Superinstructions are keyed by (pc, direction). Every cell a run
+    walks over is remembered, and a put into one of them drops the run.
+    Growing the bounding box changes wraparound, so the pass is redone.
+
+    """
+
+    _DIGITS = dict((ord(c), int(c, 16)) for c in '0123456789abcdef')
+    _BINARY = dict((ord(c), c) for c in '+-*/%`')
+    _STARTS = frozenset(ord(c) for c in '0123456789abcdef":\\')
+    _NOT, _DUP, _SWAP, _POP = ord('!'), ord(':'), ord('\\'), ord('$')
+
+    def __init__(self, program, max_length=256):
+        """Fuse the program and watch its puts
+
+        Parameters:
+        program - BefungeProgram to fuse
+        max_length - maximum number of cells in a run, default=256
+
+        """
+        self.program = program
+        self.max_length = max_length
+        program.text.watchers.append(self.write_barrier)
+        self.fuse()
+
+    def fuse(self):
+        """Run the pre-pass over the whole program
+
+        """
+        text = self.program.text
+        self.fused = {}
+        self.covers = {}
+        self.bbox = (text.width, text.height)
+        analysis = self.program.analysis
+        if analysis is not None and analysis.static:
+            # Only from states that can run, comment areas are left out
+            for pc, direction, ascii in analysis.states:
+                if not ascii and text.get(*pc) in BefungePeephole._STARTS:
+                    self._fuse(pc, direction)
+            return
+        for x, y in text.nonspace():
+            if text.get(x, y) in BefungePeephole._STARTS:
+                for direction in Direction.ALL:
+                    self._fuse((x, y), direction)
+
+    def write_barrier(self, x, y):
+        """Drop all runs walking over x,y
+
+        """
+        text = self.program.text
+        if (text.width, text.height) != self.bbox:
+            self.fuse()
+            return
+        for key in self.covers.pop((x, y), ()):
+            self.fused.pop(key, None)
+
+    def _path(self, pc, direction):
+        """Follow the program from pc, direction
+        Return a list of (op, ascii, state, cells) per cell executed,
+        where ascii is the string mode before and after the cell
+
+        """
+        program, text = self.program, self.program.text
+        cursor = TraceCursor(pc, direction)
+        path = []
+        ascii = False
+        while len(path) < self.max_length:
+            op = text.get(*cursor.pc)
+            start = cursor.pc
+            before = ascii
+            if op == Cell.QUOTE:
+                ascii = not ascii
+            elif ascii:
+                pass
+            elif op in BlockEmitter.FLOW_OPS:
+                BefungeOps.op_table[op](program, cursor)
+            elif op not in BlockEmitter.STACK_OPS:
+                break
+            program.advance(cursor)
+            cells = text.cells_between(start, cursor.pc, cursor.direction)
+            path.append((op, (before, ascii), (cursor.pc, cursor.direction), cells))
+        return path
+
+    def _fuse(self, pc, direction):
+        """Fold the run starting at pc, direction if there is one
+
+        """
+        path = self._path(pc, direction)
+        consts = []
+        guard = 0
+        best = None
+        i = 0
+        while i < len(path):
+            op, ascii, _, _ = path[i]
+            following = path[i + 1][0] if i + 1 < len(path) and not path[i + 1][1][0] else None
+            if op == Cell.QUOTE:
+                pass
+            elif ascii[0]:
+                consts.append(op)
+            elif op in BlockEmitter.FLOW_OPS:
+                pass
+            elif op in BefungePeephole._DIGITS:
+                consts.append(BefungePeephole._DIGITS[op])
+            elif op in BefungePeephole._BINARY:
+                if len(consts) < 2 or (consts[-1] == 0 and op in (ord('/'), ord('%'))):
+                    break
+                a, b = consts.pop(), consts.pop()
+                consts.append(BefungeOps.fold(BefungePeephole._BINARY[op], b, a, self.program.strict))
+            elif op == BefungePeephole._NOT and consts:
+                consts.append(1 if consts.pop() == 0 else 0)
+            elif op == BefungePeephole._DUP and consts:
+                consts.append(consts[-1])
+            elif op == BefungePeephole._DUP and following == BefungePeephole._POP:
+                i += 1
+            elif op == BefungePeephole._SWAP and len(consts) >= 2:
+                consts[-2:] = [consts[-1], consts[-2]]
+            elif op == BefungePeephole._SWAP and following == BefungePeephole._SWAP:
+                guard = max(guard, 2 - len(consts))
+                i += 1
+            elif op == BefungePeephole._POP and consts:
+                consts.pop()
+            else:
+                break
+            i += 1
+            # Only cut the run outside of string mode
+            if not path[i - 1][1][1]:
+                best = (i, tuple(consts), guard)
+        if best is None or best[0] < 2:
+            return
+        ticks, push, guard = best
+        key = (pc, direction)
+        self.fused[key] = Superinstruction(push, guard, ticks, path[ticks - 1][2])
+        for _, _, _, cells in path[:ticks]:
+            for cell in cells:
+                self.covers.setdefault(cell, set()).add(key)
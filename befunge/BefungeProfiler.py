@@ -0,0 +1,177 @@
+import math
+import time
+
+from BefungeCommon import BefungeMode, Cell, Color
+from BefungeCommon import IllegalOpCodeException
+from BefungeOps import BefungeOps
+
+
+class BefungeProfiler(object):
+    """Counts what a program runs and where it spends its time
+
+    The profiler puts an instrumented copy of BefungeProgram.step on
+    the program, so programs without one run the plain step loop and
+    pay nothing for it. Superinstructions and closed-form loops count
+    as a single run of the cell they start at.
+
+    Results:
+    ops - dict from op to the number of times it ran, None holding the
+          cells pushed in string mode
+    cells - dict from (x, y) to the number of times it ran
+    threads - dict from thread to [ops, seconds], in order of first run
+    ticks - number of ticks stepped
+
+    """
+
+    """Number of heat levels
+    """
+    LEVELS = len(Color.HEAT)
+
+    def __init__(self, program):
+        """Start counting from zero and install step on program
+
+        Parameters:
+        program - BefungeProgram to profile
+
+        """
+        self.program = program
+        self.ops = {}
+        self.cells = {}
+        self.threads = {}
+        self.ticks = 0
+        program.step = self.step
+
+    def step(self, steps=1, overrun=0):
+        """BefungeProgram.step, counting every op and timing every thread
+        Return the number of ticks run
+
+        """
+        program = self.program
+        ops, cells, threads = self.ops, self.cells, self.threads
+        clock = time.perf_counter
+        ticks = 0
+        while ticks < steps:
+            thread = program.threads.head
+            if thread is None:
+                return ticks
+            ticks += 1
+            self.ticks += 1
+            last = clock()
+            while thread is not None:
+                following = thread.next_thread
+                if thread.delay:
+                    thread.delay -= 1
+                    thread = following
+                    continue
+                pc = thread.pc
+                cells[pc] = cells.get(pc, 0) + 1
+                limit = None if overrun is None else steps - ticks + 1 + overrun
+                op, skipped = self._tick(thread, limit)
+                if skipped:
+                    ticks += skipped - 1
+                    self.ticks += skipped - 1
+                ops[op] = ops.get(op, 0) + 1
+                now = clock()
+                spent = threads.get(thread)
+                if spent is None:
+                    spent = threads[thread] = [0, 0.0]
+                spent[0] += 1
+                spent[1] += now - last
+                last = now
+                thread = following
+        return ticks
+
+    def _tick(self, thread, limit):
+        """Run the op of thread the way BefungeProgram.step does
+        Return the op, or None for a cell pushed in string mode, and
+        the ticks a closed-form loop took, limited to limit, or 0
+
+        """
+        program = self.program
+        op = thread.op = program.text.get(*thread.pc)
+        if thread.mode == BefungeMode.OP:
+            if program.peephole is not None:
+                superinstruction = program.peephole.fused.get((thread.pc, thread.direction))
+                if superinstruction is not None and superinstruction.run(program, thread):
+                    return op, 0
+            if program.loops is not None:
+                loop = program.loops.loops.get((thread.pc, thread.direction))
+                if loop is not None:
+                    skipped = loop.run(program, thread, limit)
+                    if skipped:
+                        return op, skipped
+            handler = BefungeOps.op_table[op] if 0 <= op < 256 else None
+            if handler is None:
+                raise IllegalOpCodeException('%s,%s: %s' % (thread.pc[0], thread.pc[1], op))
+            handler(program, thread)
+        elif thread.mode == BefungeMode.ASCII:
+            if op == Cell.QUOTE:
+                BefungeOps.op_toggle_ascii(program, thread)
+            else:
+                BefungeOps.pseudo_op_ascii_mode(program, thread)
+                op = None
+        program.advance(thread)
+        if thread.mode == BefungeMode.FINISHED:
+            program.threads.retire(thread)
+        return op, 0
+
+    def levels(self):
+        """Return a dict from (x, y) to the heat level of the cell,
+        on a log scale from 0 to LEVELS - 1
+
+        """
+        if not self.cells:
+            return {}
+        top = math.log(max(self.cells.values()) + 1)
+        return dict((pc, min(BefungeProfiler.LEVELS - 1,
+            int(BefungeProfiler.LEVELS * math.log(count + 1) / top)))
+            for pc, count in self.cells.items())
+
+    def heatmap(self, colored=True):
+        """Return the rows of the program with the cells that ran
+        colored by heat, or replaced by their heat level as a digit
+
+        """
+        if colored:
+            colors = dict((pc, lambda c, level=level: Color.heat(c, level))
+                for pc, level in self.levels().items())
+        else:
+            colors = dict((pc, lambda c, level=level: str(level))
+                for pc, level in self.levels().items())
+        return self.program.render(colors)
+
+    def report(self, top=10):
+        """Return the hottest ops, cells and threads as lines of text
+
+        """
+        total = sum(self.ops.values()) or 1
+        lines = ['%d ticks, %d ops' % (self.ticks, sum(self.ops.values())), 'Ops:']
+        for op, count in sorted(self.ops.items(), key=lambda item: -item[1])[:top]:
+            lines.append('%10d %5.1f%%  %s' % (count, 100.0 * count / total, BefungeProfiler._name(op)))
+        lines.append('Cells:')
+        for (x, y), count in sorted(self.cells.items(), key=lambda item: -item[1])[:top]:
+            lines.append('%10d %5.1f%%  %d,%d' % (count, 100.0 * count / total, x, y))
+        lines.append('Threads:')
+        for number, (count, seconds) in enumerate(list(self.threads.values())[:top]):
+            lines.append('%10d %9.6fs  thread %d' % (count, seconds, number))
+        return lines
+
+    def dump(self):
+        """Return the counts as a dict that json can write
+
+        """
+        return {
+            'ticks': self.ticks,
+            'ops': dict((BefungeProfiler._name(op), count) for op, count in self.ops.items()),
+            'cells': [[x, y, count] for (x, y), count in sorted(self.cells.items())],
+            'threads': [{'ops': count, 'seconds': seconds} for count, seconds in self.threads.values()]
+        }
+
+    @staticmethod
+    def _name(op):
+        """Return the name of op in reports
+
+        """
+        if op is None:
+            return 'string'
+        return chr(op) if 32 <= op < 127 else str(op)
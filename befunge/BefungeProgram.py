@@ -1,10 +1,21 @@
 import time
 
-from BefungeStack import BefungeStack
-from BefungeText import BefungeText
-from BefungeCommon import Direction, Color, BefungeMode
-from BefungeCommon import IllegalOpCodeException
+from BefungeStack import BefungeStack, BefungeStack32
+from BefungeText import BefungeText, cell_to_str
+from BefungeCommon import Direction, BefungeMode, Cell, FlushPolicy, CyclePolicy, ExitReason
+from BefungeCommon import IllegalOpCodeException, CycleException
 from BefungeOps import BefungeOps
+from BefungeJit import BefungeJit
+from BefungePeephole import BefungePeephole
+from BefungeLoops import BefungeLoops
+from BefungeAnalysis import BefungeAnalysis
+from BefungeScheduler import BefungeScheduler
+from BefungeOutput import BefungeOutput, CaptureOutput
+from BefungeInput import BefungeInput
+from BefungeCycles import BefungeCycleDetector
+from BefungeProfiler import BefungeProfiler
+from BefungeRenderer import BefungeRenderer
+from BefungePacer import BefungePacer
 
 
 class BefungeThread(object):
@@ -13,119 +24,341 @@ class BefungeThread(object):
 
     """
 
-    def __init__(self, pc, direction):
-        self.stack = BefungeStack()
+    def __init__(self, pc, direction, stack=None):
+        self.stack = stack if stack is not None else BefungeStack()
         self.pc = pc
         self.direction = direction
-        self.op = ' '
+        self.op = Cell.SPACE
         self.mode = BefungeMode.OP
+        # Ticks to sit out after a superinstruction
+        self.delay = 0
+        # Storage offset of 'g' and 'p', moved by '{' and '}'
+        self.offset = (0, 0)
+
+
+class BefungeResult(object):
+    """What a run() did
+
+    reason - ExitReason it returned for
+    steps - ticks run
+    seconds - wall-clock time it took
+    output - everything printed with a CaptureOutput, else None
+    peak_cells - most cells the program held, see BefungeText.held
+    peak_stack - most values the stacks of all threads held
+
+    Peaks are sampled between batches of ticks.
+
+    """
+
+    def __init__(self):
+        self.reason = ExitReason.FINISHED
+        self.steps = 0
+        self.seconds = 0.0
+        self.output = None
+        self.peak_cells = 0
+        self.peak_stack = 0
 
 
 class BefungeProgram(object):
     """Holds the state of a befunge program and runs it
 
     """
-    def __init__(self, name=None, text=None, show_steps=False, operations_per_second=0):
+
+    """Ticks run() steps between looking at its limits
+    """
+    BATCH = 1024
+
+    def __init__(self, name=None, text=None, show_steps=False, operations_per_second=0,
+            jit=False, peephole=False, loops=False, output=None, input=None, cycles=None,
+            strict=False, profile=False, frames_per_second=20):
         """Initialize text with file, empty stack and (0,0) pc
 
         Parameters:
         f - file
         show_steps - output program status, default=False
-        operations_per_second - how many befunge ops a second, default=unlimited
+        operations_per_second - how many ticks a second, paced by a
+                                BefungePacer in self.pacer, default=unlimited
+        jit - compile hot traces in run(), default=False
+        peephole - fuse stack-only runs into superinstructions, default=False
+        loops - run counted loops in closed form, default=False
+        output - sink for program output, default=CaptureOutput with show_steps,
+                 else BefungeOutput to stdout, flushed in time when paced
+        input - source of program input, default=BefungeInput from stdin
+        cycles - CyclePolicy for a run() stuck in a cycle, default=None to not look
+        strict - signed 32-bit cells on a BefungeStack32, wrapping around,
+                 with truncating division, default=False for unbounded ints
+        profile - count ops and cells and time threads with a
+                  BefungeProfiler in self.profiler, default=False
+        frames_per_second - how often show_steps draws, 0 for every step,
+                            default=20
 
         """
-        self.threads = [BefungeThread((0, 0), Direction.RIGHT)]
+        self.strict = strict
+        stack = BefungeStack32() if strict else None
+        self.threads = BefungeScheduler([BefungeThread((0, 0), Direction.RIGHT, stack)])
+        # Bound once, '/' and '%' call them
+        self.divide = BefungeOps.divide32 if strict else BefungeOps.divide
+        self.modulo = BefungeOps.modulo32 if strict else BefungeOps.modulo
         self.text = BefungeText(name, text)
-        self.stdout_log = ''
+        if output is None:
+            if show_steps:
+                output = CaptureOutput()
+            elif operations_per_second != 0:
+                output = BefungeOutput(policy=FlushPolicy.TIME)
+            else:
+                output = BefungeOutput()
+        self.sink = output
+        # Bound once, ops call it for every printed value
+        self.output = output.write
+        self.input = input if input is not None else BefungeInput()
         self.show_steps = show_steps
+        self.renderer = BefungeRenderer(self, frames_per_second) if show_steps else None
         self.operations_per_second = operations_per_second
+        self.pacer = None
+        if operations_per_second != 0:
+            self.pacer = BefungePacer(operations_per_second, poll=output.poll)
+        self.jit = BefungeJit(self) if jit else None
+        # Lets the passes below skip code that never runs
+        self.analysis = BefungeAnalysis(self) if peephole or loops else None
+        self.peephole = BefungePeephole(self) if peephole else None
+        self.loops = BefungeLoops(self) if loops else None
+        self.cycles = cycles
+        self.cycle_detector = BefungeCycleDetector(self) if cycles is not None else None
+        # (step, period) once run() found a cycle
+        self.cycle = None
+        # Replaces self.step with its own, counting one
+        self.profiler = BefungeProfiler(self) if profile else None
 
-    def step(self, steps=1):
+    def step(self, steps=1, overrun=0):
         """Step through another iteration.
         Get pc value and tell handl_operator to run it
+        Return the number of ticks run, fewer than steps if every
+        thread ended
+
+        A closed-form loop takes all the ticks of its iterations at
+        once, and only as many iterations as fit in the ticks left, so
+        the count is exact unless overrun lets it go past steps.
+
+        Parameters:
+        steps - ticks to run, default=1
+        overrun - ticks loops may run past steps, None for any, default=0
 
         """
-        for step in range(steps):
-            # Make duplicate in case we split
-            # TODO: Is there a nicer way?
-            for thread in self.threads[:]:
-                thread.op = self.text.get(*thread.pc)
+        op_table = BefungeOps.op_table
+        text = self.text
+        fused = self.peephole.fused if self.peephole is not None else None
+        loops = self.loops.loops if self.loops is not None else None
+        ticks = 0
+        while ticks < steps:
+            # Children are spawned in front of the head,
+            # so they first run on the next step
+            thread = self.threads.head
+            if thread is None:
+                return ticks
+            ticks += 1
+            while thread is not None:
+                following = thread.next_thread
+                if thread.delay:
+                    thread.delay -= 1
+                    thread = following
+                    continue
+                op = thread.op = text.get(*thread.pc)
                 # In op mode, so check opcode
-                if thread.mode == BefungeMode.OP and not thread.op in BefungeOps.op_map:
-                    raise IllegalOpCodeException('%s,%s: %s' % (self.pc[0], self.pc[1], self.op))
-                elif thread.mode == BefungeMode.OP:
-                    BefungeOps.op_map[thread.op](self, thread)
+                if thread.mode == BefungeMode.OP:
+                    if fused is not None:
+                        superinstruction = fused.get((thread.pc, thread.direction))
+                        if superinstruction is not None and superinstruction.run(self, thread):
+                            thread = following
+                            continue
+                    if loops is not None:
+                        loop = loops.get((thread.pc, thread.direction))
+                        if loop is not None:
+                            limit = None if overrun is None else steps - ticks + 1 + overrun
+                            skipped = loop.run(self, thread, limit)
+                            if skipped:
+                                # This tick is the first of them
+                                ticks += skipped - 1
+                                thread = following
+                                continue
+                    handler = op_table[op] if 0 <= op < 256 else None
+                    if handler is None:
+                        raise IllegalOpCodeException('%s,%s: %s' % (thread.pc[0], thread.pc[1], op))
+                    handler(self, thread)
                 # In ascii mode
                 elif thread.mode == BefungeMode.ASCII:
                     # End ascii mode
-                    if thread.op == '"':
-                        BefungeOps.op_map['"'](self, thread)
+                    if thread.op == Cell.QUOTE:
+                        BefungeOps.op_toggle_ascii(self, thread)
                     # Read in with peusdo opcode
                     else:
                         BefungeOps.pseudo_op_ascii_mode(self, thread)
-                thread.pc = self.text.get_next_pc(thread.pc, thread.direction)
-                # Skip jump_overs with zero ticks
-                # Handled here, so that next op is highlighted
-                # instea of first ;
-                while self.text.get(*thread.pc) == ';':
-                    BefungeOps.op_map[';'](self, thread)
-            # Clear out finished threads
-            self.threads = [thread for thread in self.threads if not thread.mode == BefungeMode.FINISHED]
+                self.advance(thread)
+                # Clear out finished thread
+                if thread.mode == BefungeMode.FINISHED:
+                    self.threads.retire(thread)
+                thread = following
+        return ticks
+
+    def advance(self, thread):
+        """Move thread to its next pc
+
+        """
+        thread.pc = self.text.get_next_pc(thread.pc, thread.direction)
+        # Skip jump_overs with zero ticks
+        # Handled here, so that next op is highlighted
+        # instea of first ;
+        while self.text.get(*thread.pc) == Cell.SEMICOLON:
+            BefungeOps.op_jump_over(self, thread)
+
+    @property
+    def stdout_log(self):
+        """Program output not yet flushed, all of it with CaptureOutput
+
+        """
+        return self.sink.getvalue()
+
+    def flush(self):
+        """Write out buffered program output
+
+        """
+        self.sink.flush()
 
     def split(self, thread):
         """Create another thread with same PC but opposite direction
+        and a copy of the stack
 
         """
         # Get opposite direction
-        direction = Direction.OPPOSITE[thread.direction]
+        direction = Direction.reverse(thread.direction)
         # Get next position, otherwise child thread will be on 't' op again
         pc = self.text.get_next_pc(thread.pc, direction)
-        # Prepend child
-        self.threads.insert(0, BefungeThread(pc, direction))
+        # Prepend child, with a copy of the stack
+        child = BefungeThread(pc, direction, thread.stack.copy())
+        child.offset = thread.offset
+        self.threads.spawn(child)
+
+    def run(self, max_steps=None, deadline=None, max_cells=None, max_stack=None):
+        """Step through program until every thread ended or a limit
+        was hit
+        Return a BefungeResult
 
-    def run(self):
-        """Step through program
+        Ticks run in batches of BATCH, or one at a time while drawn,
+        paced or looked at for cycles, and the limits other than
+        max_steps are checked every BATCH ticks. A program may go a
+        batch past them, and a single op like 'k' or 'i' may take any
+        time or memory.
+
+        Parameters:
+        max_steps - ticks to run at most, default=unlimited
+        deadline - seconds to run at most, default=unlimited
+        max_cells - cells the program may hold, default=unlimited
+        max_stack - values the stacks of all threads may hold,
+                    default=unlimited
 
         """
-        while len(self.threads) > 0:
-            if self.show_steps:
-                self.show_program()
-            if self.operations_per_second != 0:
-                time.sleep(1.0 / self.operations_per_second)
-            self.step()
-        print("")
+        # Traces run many ops at once, so only use them when nobody
+        # watches, paces, limits or looks for cycles in single ops.
+        # They work on the lists of unbounded stacks, so not in strict
+        # mode, and the profiler counts single ops.
+        jit = self.jit
+        detector = self.cycle_detector
+        pacer = self.pacer
+        if self.show_steps or pacer is not None or detector is not None:
+            jit = None
+        if self.strict or self.profiler is not None:
+            jit = None
+        if (max_steps, deadline, max_cells, max_stack) != (None, None, None, None):
+            jit = None
+        if self.renderer is not None or pacer is not None or detector is not None:
+            batch = 1
+        else:
+            batch = BefungeProgram.BATCH
+        result = BefungeResult()
+        start = time.monotonic()
+        end = start + deadline if deadline is not None else None
+        steps = check = 0
+        try:
+            while len(self.threads) > 0:
+                if self.renderer is not None:
+                    self.renderer.frame()
+                if pacer is not None:
+                    pacer.wait()
+                if jit is not None and len(self.threads) == 1:
+                    ticks = jit.run()
+                    check = steps + ticks
+                elif max_steps is not None:
+                    left = max_steps - steps
+                    ticks = self.step(min(batch, left), left - min(batch, left))
+                else:
+                    # Paced ticks are due one at a time, loops included
+                    ticks = self.step(batch, 0 if pacer is not None else None)
+                steps += ticks
+                if detector is not None:
+                    period = detector.check(ticks)
+                    if period is not None:
+                        self.cycle = (detector.steps, period)
+                        if self.cycles == CyclePolicy.RAISE:
+                            raise CycleException('step %d: program repeats every %d steps' % self.cycle)
+                        result.reason = ExitReason.CYCLE
+                        break
+                if steps < check and (max_steps is None or steps < max_steps):
+                    continue
+                check = steps + BefungeProgram.BATCH
+                cells = self.text.held()
+                stack = sum([thread.stack.held() for thread in self.threads])
+                result.peak_cells = max(result.peak_cells, cells)
+                result.peak_stack = max(result.peak_stack, stack)
+                if len(self.threads) == 0:
+                    break
+                if max_steps is not None and steps >= max_steps:
+                    result.reason = ExitReason.STEPS
+                elif end is not None and time.monotonic() >= end:
+                    result.reason = ExitReason.DEADLINE
+                elif max_cells is not None and cells > max_cells:
+                    result.reason = ExitReason.CELLS
+                elif max_stack is not None and stack > max_stack:
+                    result.reason = ExitReason.STACK
+                else:
+                    continue
+                break
+        finally:
+            if pacer is not None:
+                pacer.stop()
+            if self.renderer is not None:
+                # Show how the program ended
+                self.renderer.frame(force=True)
+            self.flush()
+        result.steps = steps
+        result.seconds = time.monotonic() - start
+        if self.sink.KEEPS_ALL:
+            result.output = self.sink.getvalue()
+        return result
 
-    def show_program(self):
-        """Print terminal colored program status
+    def render(self, colors, x=None, y=None, width=None, height=None):
+        """Return the rows of the program as strings
+        The cell at every (x, y) in colors goes through its function
+
+        Parameters:
+        colors - dict from (x, y) to a function of the printed cell
+        x - first column, default=left of the bounding box
+        y - first row, default=top of the bounding box
+        width - number of columns, default=to the right of the box
+        height - number of rows, default=to the bottom of the box
 
         """
-        # Divider
-        print(Color.blue('#' * 80))
-        # Code header
-        print("%s" % Color.yellow_dark("Code:"))
-        # Code
-        # Rows with pcs
-        pcs = {}
-        for thread in self.threads:
-            row = thread.pc[1]
-            if row in pcs:
-                pcs[row].append(thread.pc[0])
-            else:
-                pcs[row] = [thread.pc[0]]
-        # Loop throw rows of code
-        for i in range(len(self.text.text)):
-            row = self.text.text[i]
-            # This line contains our pc
-            if i in pcs:
-                # Make copy and replace pc with highlighted pc
-                row = row[::]
-                for pc in pcs[i]:
-                    row[pc] = Color.grey_on_green(row[pc])
-            print(''.join([str(x) for x in row]))
-        # Stack
-        for thread in self.threads:
-            print("%s %s" % (Color.yellow_dark("Stack N:"), thread.stack))
-            print("%s %r" % (Color.yellow_dark("Stack A:"), thread.stack))
-        # Aggregated stdout
-        print("%s %s" % (Color.yellow_dark("Stdout:"), self.stdout_log), end="")
-        print("")
+        text = self.text
+        x = text.x0 if x is None else x
+        y = text.y0 if y is None else y
+        width = text.x0 + text.width - x if width is None else width
+        height = text.y0 + text.height - y if height is None else height
+        rows = {}
+        for (cx, cy), color in colors.items():
+            if x <= cx < x + width:
+                rows.setdefault(cy, []).append((cx - x, color))
+        lines = []
+        for r, cells in enumerate(text.get_rect(x, y, width, height)):
+            row = [cell_to_str(v) for v in cells]
+            for i, color in rows.get(y + r, ()):
+                row[i] = color(row[i])
+            lines.append(''.join(row))
+        return lines
@@ -0,0 +1,153 @@
+import shutil
+import sys
+import time
+
+from BefungeCommon import Color
+
+
+class BefungeRenderer(object):
+    """Draws the state of a running program at a fixed frame rate
+
+    run() calls frame() before every step, which only draws once a
+    frame is due, so the program runs at full speed in between.
+
+    A frame shows a viewport of the code that fits the terminal, kept
+    where it is while it shows the pc of the first thread and moved
+    to center on it otherwise, then the top of the stacks of the first
+    threads and the end of the output. On a terminal only the lines
+    that changed since the last frame are written, each at its place
+    with cursor positioning. Elsewhere every frame is written in full.
+
+    """
+
+    """Threads whose stacks are shown
+    """
+    THREADS = 4
+
+    """Values shown from the top of a stack
+    """
+    VALUES = 32
+
+    """Lines of output shown
+    """
+    OUTPUT = 3
+
+    def __init__(self, program, frames_per_second=20, stream=None, size=None, incremental=None):
+        """Draw nothing yet
+
+        Parameters:
+        program - BefungeProgram to draw
+        frames_per_second - frame rate, 0 to draw before every step, default=20
+        stream - text stream, default=sys.stdout at draw time
+        size - (columns, rows) to fill, default=size of the terminal
+        incremental - only write changed lines, default=True on a terminal
+
+        """
+        self.program = program
+        self.interval = 1.0 / frames_per_second if frames_per_second > 0 else 0
+        self.stream = stream
+        self.size = size
+        self.incremental = incremental
+        self.next_frame = 0
+        # Lines on the screen, None before the first frame
+        self.lines = None
+        # Top left cell of the viewport
+        self.origin = None
+        self.frames = 0
+
+    def frame(self, force=False):
+        """Draw a frame if one is due or force is set
+        Return True if it did
+
+        """
+        now = time.monotonic()
+        if now < self.next_frame and not force:
+            return False
+        self.next_frame = now + self.interval
+        self.draw(self.render())
+        return True
+
+    def render(self):
+        """Return the lines of a frame
+
+        """
+        program, text = self.program, self.program.text
+        columns, rows = self.size or shutil.get_terminal_size((80, 24))
+        threads = list(program.threads)
+        shown = threads[:BefungeRenderer.THREADS]
+        footer = []
+        for thread in shown:
+            values = thread.stack.peek_many(BefungeRenderer.VALUES)
+            more = '...,' if len(thread.stack) > len(values) else ''
+            footer.append('%s %s' % (Color.yellow_dark('Stack N:'),
+                (more + ','.join([str(v) for v in values]))[:columns - 9]))
+            footer.append('%s %s' % (Color.yellow_dark('Stack A:'),
+                (more + ','.join([repr(chr(v)) if 0 <= v <= 255 else str(v) for v in values]))[:columns - 9]))
+        if len(threads) > len(shown):
+            footer.append(Color.yellow_dark('... %d more threads' % (len(threads) - len(shown))))
+        output = program.stdout_log.split('\n')[-BefungeRenderer.OUTPUT:]
+        footer.append('%s %s' % (Color.yellow_dark('Stdout:'), output[0][:columns - 8]))
+        footer.extend([line[:columns] for line in output[1:]])
+        # Divider and header above, one line left for the cursor
+        width = min(columns, text.width)
+        height = max(1, min(rows - len(footer) - 3, text.height))
+        x, y = self._viewport(width, height, threads)
+        header = 'Code:'
+        if (width, height) != (text.width, text.height):
+            header += ' %d,%d to %d,%d of %dx%d' % (x, y, x + width - 1, y + height - 1,
+                text.width, text.height)
+        code = program.render(dict((thread.pc, Color.grey_on_green) for thread in threads),
+            x, y, width, height)
+        lines = [Color.blue('#' * min(columns, 80)), Color.yellow_dark(header)]
+        return lines + code + footer
+
+    def _viewport(self, width, height, threads):
+        """Return the top left cell of a width x height viewport
+        The box of the program bounds it, and the pc of the first
+        thread is in it
+
+        """
+        text = self.program.text
+        x0, y0 = text.x0, text.y0
+        x, y = self.origin if self.origin is not None else (x0, y0)
+        if threads:
+            px, py = threads[0].pc
+            if not x <= px < x + width:
+                x = px - width // 2
+            if not y <= py < y + height:
+                y = py - height // 2
+        # Stay inside of the box, which may have moved or grown
+        x = max(x0, min(x, x0 + text.width - width))
+        y = max(y0, min(y, y0 + text.height - height))
+        self.origin = (x, y)
+        return x, y
+
+    def draw(self, lines):
+        """Write lines as the next frame
+
+        """
+        stream = self.stream if self.stream is not None else sys.stdout
+        incremental = self.incremental
+        if incremental is None:
+            isatty = getattr(stream, 'isatty', None)
+            incremental = isatty is not None and isatty()
+        self.frames += 1
+        if not incremental:
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
+            return
+        out = []
+        if self.lines is None:
+            # Clear the screen once
+            out.append('\x1b[2J')
+        old = self.lines or []
+        for i, line in enumerate(lines):
+            if i >= len(old) or old[i] != line:
+                out.append('\x1b[%d;1H%s\x1b[K' % (i + 1, line))
+        if len(lines) < len(old):
+            out.append('\x1b[%d;1H\x1b[J' % (len(lines) + 1))
+        # Leave the cursor below the frame
+        out.append('\x1b[%d;1H' % (len(lines) + 1))
+        stream.write(''.join(out))
+        stream.flush()
+        self.lines = lines
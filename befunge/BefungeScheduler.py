@@ -0,0 +1,87 @@
+class BefungeScheduler(object):
+    """Runs threads in order, newest first
+
+    Threads are linked to each other through prev_thread and next_thread,
+    so spawning a thread at the front and retiring any thread are O(1).
+    Iterating from the head while threads spawn keeps the order of the
+    tick: children are prepended before the point where it started.
+
+    """
+
+    def __init__(self, threads=()):
+        """Schedule threads in the given order
+
+        Parameters:
+        threads - initial threads
+
+        """
+        self.head = None
+        self.tail = None
+        self.count = 0
+        for thread in threads:
+            self.append(thread)
+
+    def spawn(self, thread):
+        """Schedule thread before all others
+
+        """
+        thread.prev_thread = None
+        thread.next_thread = self.head
+        if self.head is None:
+            self.tail = thread
+        else:
+            self.head.prev_thread = thread
+        self.head = thread
+        self.count += 1
+
+    def append(self, thread):
+        """Schedule thread after all others
+
+        """
+        thread.prev_thread = self.tail
+        thread.next_thread = None
+        if self.tail is None:
+            self.head = thread
+        else:
+            self.tail.next_thread = thread
+        self.tail = thread
+        self.count += 1
+
+    def retire(self, thread):
+        """Remove thread from the schedule
+        Its next_thread is kept, so a loop over the schedule can go on
+
+        """
+        if thread.prev_thread is None:
+            self.head = thread.next_thread
+        else:
+            thread.prev_thread.next_thread = thread.next_thread
+        if thread.next_thread is None:
+            self.tail = thread.prev_thread
+        else:
+            thread.next_thread.prev_thread = thread.prev_thread
+        thread.prev_thread = None
+        self.count -= 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        thread = self.head
+        while thread is not None:
+            following = thread.next_thread
+            yield thread
+            thread = following
+
+    def __getitem__(self, i):
+        """Return the i-th thread, walking from the head
+
+        """
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('thread index out of range')
+        thread = self.head
+        for _ in range(i):
+            thread = thread.next_thread
+        return thread
@@ -1,10 +1,129 @@
-class BefungeStack(object):
+from array import array
+
+from BefungeOps import BefungeOps
+
+
+class StackSegment(object):
+    """Frozen bottom part of a stack, shared between copies
+
+    Parameters:
+    items - values of the segment, bottom first, never changed
+    below - segment under this one or None
+
+    """
+
+    __slots__ = ('items', 'below', 'size')
+
+    def __init__(self, items, below):
+        self.items = items
+        self.below = below
+        self.size = len(items) + (below.size if below is not None else 0)
+
+
+class StackOfStacks(object):
+    """Funge-98 stack of stacks kept in a single buffer
+
+    All stacks of a thread lie in one buffer, bottom first. The top
+    stack (TOSS) starts at self.base, and self.bases holds where each
+    stack below it starts, so the stack under it (SOSS) is the buffer
+    from self.bases[-1] to self.base. Moving values between the two is
+    a slice move in the buffer instead of a pop and push per value.
+
+    Subclasses provide the buffer through _size, _slice, _delete and
+    _insert, and have it unshared by _unshare.
+
+    """
+
+    def _unshare(self):
+        """Make the whole stack one buffer
+
+        """
+        pass
+
+    def begin(self, n, offset):
+        """Push a new stack and move the top n values onto it as a
+        block, then push the storage offset under them
+        For n < 0, push -n zeros instead of moving any values
+
+        """
+        self._unshare()
+        size = self._size()
+        if n < 0:
+            self._insert(size, [0] * -n)
+            size -= n
+            n = 0
+        start = size - n
+        # Values missing from the stack below are zeros
+        zeros = max(0, self.base - start)
+        start = max(start, self.base)
+        self._insert(start, list(offset) + [0] * zeros)
+        self.bases.append(self.base)
+        self.base = start + 2
+
+    def end(self, n):
+        """Pop the storage offset from the stack below, move the top n
+        values onto it as a block and drop the top stack
+        For n < 0, pop -n values from the stack below instead
+        Return the storage offset, or None if there is only one stack
+
+        """
+        if not self.bases:
+            return None
+        size, top, below = self._size(), self.base, self.bases.pop()
+        # The stack below may have lost the offset to 'u'
+        count = min(2, top - below)
+        x, y = ([0, 0] + self._slice(top - count, top))[-2:]
+        start = top - count
+        if n >= 0:
+            k = min(n, size - top)
+            self._delete(start, size - k)
+            if k < n:
+                self._insert(start, [0] * (n - k))
+        else:
+            self._delete(max(below, start + n), size)
+        self.base = below
+        return (x, y)
+
+    def under(self, n):
+        """Move n values one at a time from the stack below onto the
+        top stack, or -n values the other way for n < 0
+        Return False if there is only one stack
+
+        """
+        if not self.bases:
+            return False
+        size, top, below = self._size(), self.base, self.bases[-1]
+        if n > 0:
+            k = min(n, top - below)
+            values = self._slice(top - k, top)[::-1] + [0] * (n - k)
+            self._delete(top - k, top)
+            self._insert(size - k, values)
+            self.base = top - k
+        elif n < 0:
+            k = min(-n, size - top)
+            values = self._slice(size - k, size)[::-1] + [0] * (-n - k)
+            self._delete(size - k, size)
+            self._insert(top, values)
+            self.base = top - n
+        return True
+
+
+class BefungeStack(StackOfStacks):
     """Simulates a stack
 
+    The top of the stack is the list self.stack. Below it lies a chain
+    of shared StackSegments, which copy() hands out without copying any
+    values. A segment is only copied into self.stack when the stack is
+    popped below its own top. Once there is more than one stack, all of
+    them are in self.stack.
+
     """
 
     def __init__(self):
-        self.clear()
+        self.stack = []
+        self.shared = None
+        self.bases = []
+        self.base = 0
 
     def push(self, a):
         """Push a value onto the stack
@@ -12,43 +131,275 @@ class BefungeStack(object):
         """
         self.stack.append(a)
 
+    def push_many(self, values):
+        """Push values onto the stack, last one on top
+
+        """
+        self.stack.extend(values)
+
     def pop(self):
         """Pop a value from the stack
         Return 0 on empty stack
 
         """
-        if(len(self.stack) > 0):
+        if len(self.stack) > self.base:
             return self.stack.pop()
-        else:
-            return 0
+        if self.shared is not None:
+            return self.reserve(1).pop()
+        return 0
 
     def peek(self):
         """Return a value form the stack
         Return 0 on empty stack
 
         """
-        if(len(self.stack) > 0):
+        if len(self.stack) > self.base:
             return self.stack[-1]
+        if self.shared is not None:
+            return self.reserve(1)[-1]
+        return 0
+
+    def drop(self, n):
+        """Pop n values at once
+
+        """
+        if n >= len(self):
+            self.clear()
         else:
-            return 0
+            stack = self.reserve(n)
+            del stack[len(stack) - n:]
+
+    def reserve(self, n):
+        """Copy shared segments into self.stack until it holds
+        at least n values or nothing is shared anymore
+        Return self.stack, which keeps its identity
+
+        """
+        while len(self.stack) < n and self.shared is not None:
+            self.stack[:0] = self.shared.items
+            self.shared = self.shared.below
+        return self.stack
+
+    def peek_many(self, n):
+        """Return the top n values, bottom first
+
+        """
+        stack = self.reserve(n)
+        return stack[max(self.base, len(stack) - n):]
+
+    def copy(self):
+        """Return a copy of the stack in O(1)
+        Both stacks share the current contents from now on
+        With more than one stack, the values are copied
+
+        """
+        other = BefungeStack.__new__(type(self))
+        other.bases = list(self.bases)
+        other.base = self.base
+        if self.bases:
+            other.stack = list(self.stack)
+            other.shared = None
+            return other
+        if self.stack:
+            # The list is frozen into the segment, so start a new one
+            self.shared = StackSegment(self.stack, self.shared)
+            self.stack = []
+        other.stack = []
+        other.shared = self.shared
+        return other
+
+    def values(self):
+        """Return a list of all values of all stacks, bottom first
+
+        """
+        values = []
+        segment = self.shared
+        while segment is not None:
+            values[:0] = segment.items
+            segment = segment.below
+        return values + self.stack
 
     def clear(self):
-        """Clear contents of stack
+        """Clear contents of the top stack
 
         """
-        self.stack = []
+        del self.stack[self.base:]
+        if not self.bases:
+            self.shared = None
 
-    def __len__(self):
+    def held(self):
+        """Return the number of values on all stacks, shared ones included
+
+        """
+        if self.shared is not None:
+            return len(self.stack) + self.shared.size
+        return len(self.stack)
+
+    def _unshare(self):
+        self.reserve(len(self))
+
+    def _size(self):
         return len(self.stack)
 
+    def _slice(self, start, end):
+        return self.stack[start:end]
+
+    def _delete(self, start, end):
+        del self.stack[start:end]
+
+    def _insert(self, start, values):
+        self.stack[start:start] = values
+
+    def __len__(self):
+        if self.shared is not None:
+            return len(self.stack) + self.shared.size
+        return len(self.stack) - self.base
+
+    def __str__(self):
+        """Comma seperated values
+
+        """
+        return ','.join([str(x) for x in self.values()])
+
+    def __repr__(self):
+        """Comma seperated values: ASCII if visible
+
+        """
+        return ','.join([repr(chr(x)) if x <= 255 and x >= 0 else str(x) for x in self.values()])
+
+
+class BefungeStack32(StackOfStacks):
+    """Stack of signed 32-bit cells for strict mode
+
+    Values live in a growable array('i'), of which the first self.top
+    entries are in use, so every value takes four bytes. Values out of
+    range wrap around when pushed.
+
+    """
+
+    def __init__(self):
+        self.cells = array('i', bytes(16 * array('i').itemsize))
+        self.top = 0
+        self.bases = []
+        self.base = 0
+
+    def _grow(self, n):
+        """Make room for n more values
+
+        """
+        cells = self.cells
+        if self.top + n > len(cells):
+            cells.frombytes(bytes(max(n, len(cells)) * cells.itemsize))
+
+    def push(self, a):
+        """Push a value onto the stack
+
+        """
+        if self.top == len(self.cells):
+            self._grow(1)
+        try:
+            self.cells[self.top] = a
+        except OverflowError:
+            self.cells[self.top] = BefungeOps.wrap32(a)
+        self.top += 1
+
+    def push_many(self, values):
+        """Push values onto the stack, last one on top
+
+        """
+        try:
+            values = array('i', values)
+        except OverflowError:
+            values = array('i', [BefungeOps.wrap32(a) for a in values])
+        self._grow(len(values))
+        self.cells[self.top:self.top + len(values)] = values
+        self.top += len(values)
+
+    def pop(self):
+        """Pop a value from the stack
+        Return 0 on empty stack
+
+        """
+        if self.top > self.base:
+            self.top -= 1
+            return self.cells[self.top]
+        return 0
+
+    def peek(self):
+        """Return a value form the stack
+        Return 0 on empty stack
+
+        """
+        if self.top > self.base:
+            return self.cells[self.top - 1]
+        return 0
+
+    def drop(self, n):
+        """Pop n values at once
+
+        """
+        self.top = max(self.base, self.top - n)
+
+    def peek_many(self, n):
+        """Return the top n values, bottom first
+
+        """
+        return self.cells[max(self.base, self.top - n):self.top].tolist()
+
+    def copy(self):
+        """Return a copy of the stack
+
+        """
+        other = BefungeStack32.__new__(BefungeStack32)
+        other.cells = self.cells[:max(self.top, 16)]
+        other.top = self.top
+        other.bases = list(self.bases)
+        other.base = self.base
+        return other
+
+    def values(self):
+        """Return a list of all values of all stacks, bottom first
+
+        """
+        return self.cells[:self.top].tolist()
+
+    def clear(self):
+        """Clear contents of the top stack
+
+        """
+        self.top = self.base
+
+    def held(self):
+        """Return the number of values on all stacks
+
+        """
+        return self.top
+
+    def _size(self):
+        return self.top
+
+    def _slice(self, start, end):
+        return self.cells[start:end].tolist()
+
+    def _delete(self, start, end):
+        del self.cells[start:end]
+        self.top -= end - start
+
+    def _insert(self, start, values):
+        self.cells[start:start] = array('i', values)
+        self.top += len(values)
+
+    def __len__(self):
+        return self.top - self.base
+
     def __str__(self):
         """Comma seperated values
 
         """
-        return ','.join([str(x) for x in self.stack])
+        return ','.join([str(x) for x in self.values()])
 
     def __repr__(self):
         """Comma seperated values: ASCII if visible
 
         """
-        return ','.join([repr(chr(x)) if x <= 255 and x >= 0 else str(x) for x in self.stack])
+        return ','.join([repr(chr(x)) if x <= 255 and x >= 0 else str(x) for x in self.values()])
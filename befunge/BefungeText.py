@@ -1,10 +1,112 @@
-from BefungeCommon import Direction
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from BefungeCommon import Cell
+
+
+def cell_to_str(v):
+    """Return the printable form of a cell value
+    Printable characters are shown as is, everything else as a number
+
+    """
+    if 0 <= v < 0x110000:
+        c = chr(v)
+        if c.isprintable():
+            return c
+    return str(v)
+
+
+"""Carriage return not ending a line
+"""
+LONE_CR = re.compile(br'\r(?!\n)')
+
+"""Non-space bytes of a mapped row
+"""
+NONSPACE = re.compile(br'[^ ]')
+
+"""Bytes str.rstrip strips
+"""
+WHITESPACE = frozenset(c for c in range(128) if chr(c).isspace())
+
+
+def skip_table(values, step):
+    """Return the position of the next non-space cell for every
+    position of a line, moving by step (1 or -1) and wrapping around.
+    Lines without any non-space cell just move by one.
+
+    Parameters:
+    values - cell values of the line
+    step - 1 to move forward, -1 to move backward
+
+    """
+    n = len(values)
+    table = array('q', bytes(8 * n))
+    # Walk the line twice against the direction of travel, so
+    # the first lap seeds the next non-space cell across the wrap
+    if step > 0:
+        indices = range(2 * n - 1, -1, -1)
+    else:
+        indices = range(-n, n)
+    nxt = None
+    for i in indices:
+        j = i % n
+        if 0 <= i < n:
+            table[j] = (j + step) % n if nxt is None else nxt
+        if values[j] != Cell.SPACE:
+            nxt = j
+    return table
 
 
 class BefungeText(object):
     """Holds contents of befunge program.
+    Every cell is stored as an int in one row-major array('q')
+    covering the bounding box of the program.
+
+    Moves that skip whitespace use per-line skip tables, built the
+    first time a line is travelled and dropped when a put turns a
+    cell of that line from or into a space.
 
+    Files of at least MAP_BYTES bytes are memory-mapped instead, if
+    they are ASCII. Rows are read from the mapping where they are
+    and puts go into copies of the rows they touch, kept in an
+    overlay dict by row, so only touched rows cost memory.
+
+    A put to a negative coordinate, or one that would grow the box
+    past DENSE_CELLS cells, or any growth of a mapped box, switches
+    to paged storage for good:
+    square pages of cells in a dict keyed by page coordinate, so
+    memory follows the cells that were written. The bounding box then
+    starts at (x0, y0), grows with every non-space put outside of it,
+    and whitespace is skipped with sorted lists of the non-space
+    cells of every row and column.
+
+    A put of a value beyond 64 bits switches to paged storage too,
+    and turns the page it goes to into a list of ints.
+
+    Callables in watchers are called with (x, y) after a put changed
+    a cell or grew the bounding box.
+
+    Hosts read and write rectangles with read_region and write_region,
+    which speak the buffer protocol, so memoryview and NumPy arrays
+    work without converting cell by cell.
+
+    """
+
+    """Cells a dense bounding box may hold
     """
+    DENSE_CELLS = 1 << 20
+
+    """Smallest file that is memory-mapped
+    """
+    MAP_BYTES = 1 << 20
+
+    """Pages are PAGE_SIZE x PAGE_SIZE cells
+    """
+    PAGE_BITS = 5
+    PAGE_SIZE = 1 << PAGE_BITS
 
     def __init__(self, name=None, text=None):
         """Load the program from a file
@@ -14,7 +116,15 @@ class BefungeText(object):
         text - program string with newlines
 
         """
-        self.text = []
+        self.x0 = 0
+        self.y0 = 0
+        self.width = 1
+        self.height = 1
+        self.cells = array('q', [Cell.SPACE])
+        self.source = None
+        self.pages = None
+        self.watchers = []
+        self._clear_skip_tables()
         self._load_program(name, text)
 
     def _load_program(self, name=None, text=None):
@@ -27,53 +137,193 @@ class BefungeText(object):
 
         """
         if not name == None:
-            for x in open(name, 'r'):
-                self.text.append(list(x.rstrip()))
+            if self._map_program(name):
+                return
+            with open(name, 'r') as f:
+                rows = [x.rstrip() for x in f]
         elif not text == None:
-            for x in text.split('\n'):
-                self.text.append(list(x.rstrip()))
+            rows = [x.rstrip() for x in text.split('\n')]
+        else:
+            return
+        self._resize(max([len(row) for row in rows] + [1]), max(len(rows), 1))
+        for y, row in enumerate(rows):
+            start = y * self.width
+            self.cells[start:start + len(row)] = array('q', [ord(c) for c in row])
+
+    def _map_program(self, name):
+        """Memory-map the file if it is large enough and ASCII
+        Return True if it was mapped
+
+        Only the start and end of every row are read up front, to
+        find the bounding box.
+
+        Parameters:
+        name - file name of program
+
+        """
+        size = os.path.getsize(name)
+        # Empty files can not be mapped
+        if size == 0 or size < BefungeText.MAP_BYTES:
+            return False
+        with open(name, 'rb') as f:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Anything not ASCII would have to be decoded, and a lone
+        # carriage return is a line break to text files
+        chunk = BefungeText.MAP_BYTES or size
+        if (not all(source[i:i + chunk].isascii() for i in range(0, size, chunk)) or
+                (source.find(b'\r') >= 0 and LONE_CR.search(source))):
+            source.close()
+            return False
+        offsets, ends = array('q'), array('q')
+        width = 1
+        start = 0
+        while start < size:
+            end = source.find(b'\n', start)
+            if end < 0:
+                end = size
+            stop = end
+            while stop > start and source[stop - 1] in WHITESPACE:
+                stop -= 1
+            offsets.append(start)
+            ends.append(stop)
+            width = max(width, stop - start)
+            start = end + 1
+        if hasattr(source, 'madvise'):
+            # Scanned pages are not needed until the program reads them
+            source.madvise(mmap.MADV_DONTNEED)
+        self.source = source
+        self._offsets = offsets
+        self._ends = ends
+        self._overlay = {}
+        self.cells = None
+        self.width, self.height = width, max(len(offsets), 1)
+        self._clear_skip_tables()
+        self.get = self._get_mapped
+        return True
+
+    def _get_mapped(self, x, y):
+        """get with a memory-mapped file
+
+        """
+        if self._overlay:
+            row = self._overlay.get(y)
+            if row is not None:
+                return row[x] if 0 <= x < self.width else Cell.SPACE
+        if 0 <= y < self.height and x >= 0:
+            i = self._offsets[y] + x
+            if i < self._ends[y]:
+                return self.source[i]
+        return Cell.SPACE
+
+    def _overlay_row(self, y):
+        """Return the overlay copy of row y of a mapped file, copying
+        it from the mapping the first time
+
+        """
+        row = self._overlay.get(y)
+        if row is None:
+            start = self._offsets[y]
+            row = array('q', list(self.source[start:self._ends[y]]))
+            row += array('q', [Cell.SPACE]) * (self.width - len(row))
+            self._overlay[y] = row
+        return row
 
     def _number_of_rows(self):
         """Return the number of rows in the program
 
         """
-        return len(self.text)
+        return self.height
 
     def _length_of_row(self, y):
         """Return the length of the given row
+        All rows span the width of the bounding box
+
+        Parameters:
+        y - row number
+
+        """
+        return self.width
+
+    def _clear_skip_tables(self):
+        """Drop all skip tables
+        Row tables are indexed by dx > 0, column tables by dy > 0
+
+        """
+        self._skip_rows = ({}, {})
+        self._skip_columns = ({}, {})
+
+    def _skip_row(self, y, step):
+        """Build the skip table of a row
 
         Parameters:
         y - row number
+        step - 1 for right, -1 for left
 
         """
-        return len(self.text[y])
+        if self.cells is None:
+            values = [self.get(x, y) for x in range(self.width)]
+        else:
+            start = y * self.width
+            values = self.cells[start:start + self.width]
+        table = skip_table(values, step)
+        self._skip_rows[step > 0][y] = table
+        return table
 
-    def _add_row(self, value=None):
-        """Add a row to the program
-        If value not specified, then empty row added
+    def _skip_column(self, x, step):
+        """Build the skip table of a column
 
         Parameters:
-        value = list of characters
+        x - column number
+        step - 1 for down, -1 for up
 
         """
-        if value == None:
-            self.text.append([])
+        if self.cells is None:
+            values = [self.get(x, y) for y in range(self.height)]
         else:
-            self.text.append(value)
+            values = self.cells[x::self.width]
+        table = skip_table(values, step)
+        self._skip_columns[step > 0][x] = table
+        return table
+
+    def _resize(self, width, height):
+        """Grow the bounding box to at least width x height
+        New cells are filled with spaces
+
+        Parameters:
+        width - minimum number of columns
+        height - minimum number of rows
+
+        """
+        width, height = max(width, self.width), max(height, self.height)
+        if width == self.width:
+            # Rows keep their offsets, so just append new rows
+            rows = array('q', [Cell.SPACE]) * (width * (height - self.height))
+            try:
+                self.cells.extend(rows)
+            except BufferError:
+                # A region view holds on to the array, leave it to it
+                self.cells = self.cells + rows
+        else:
+            cells = array('q', [Cell.SPACE]) * (width * height)
+            for y in range(self.height):
+                start = y * self.width
+                cells[y * width:y * width + self.width] = self.cells[start:start + self.width]
+            self.cells = cells
+        self.width, self.height = width, height
+        self._clear_skip_tables()
 
     def get(self, x, y):
         """Implement 'g' command and get field
 
         """
-        if(y >= self._number_of_rows() or x >= self._length_of_row(y)):
-            return ' '
-        else:
-            return self.text[y][x]
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.cells[y * self.width + x]
+        return Cell.SPACE
 
     def put(self, x, y, z):
         """Implment 'p' command and alter text
         If x and/or y are beyond current program bounds
-        add empty rows and whitespace
+        grow the bounding box with whitespace.
 
         Parameters:
         x - column number
@@ -81,23 +331,409 @@ class BefungeText(object):
         z - value
 
         """
-        # If its a visible char, then convert it to that
-        if z > 31 and z < 127:
-            z = chr(z)
-        # If the put value is beyond our current amount of rows
-        if(y >= self._number_of_rows()):
-            # Add dummy empty rows until row
-            for r in xrange(self._number_of_rows(), y):
-                self._add_row()
-            # Add row, left padded with whitespace
-            self._add_row(list("%s" % (" " * (x))) + [z])
-        # Else if y is past the current row length
-        elif(x >= self._length_of_row(y)):
-            # Append whitespace and value
-            self.text[y] = self.text[y] + list("%s" % (" " * (x - self._length_of_row(y)))) + [z]
-        # Otherwise modify whats currently there
+        if self.pages is None:
+            width, height = self.width, self.height
+            outside = x < 0 or y < 0 or x >= width or y >= height
+            if outside and (x < 0 or y < 0 or self.cells is None or
+                    max(x + 1, width) * max(y + 1, height) > BefungeText.DENSE_CELLS):
+                # Spaces outside of the box change nothing
+                if z == Cell.SPACE:
+                    return
+                self._promote()
+        if self.pages is not None:
+            self._put_paged(x, y, z)
+            return
+        resized = x >= self.width or y >= self.height
+        if resized:
+            self._resize(x + 1, y + 1)
+        i = y * self.width + x
+        old = self.cells[i] if self.cells is not None else self.get(x, y)
+        if old == z and not resized:
+            return
+        if (old == Cell.SPACE) != (z == Cell.SPACE):
+            for rows in self._skip_rows:
+                rows.pop(y, None)
+            for columns in self._skip_columns:
+                columns.pop(x, None)
+        try:
+            if self.cells is not None:
+                self.cells[i] = z
+            else:
+                self._overlay_row(y)[x] = z
+        except OverflowError:
+            self._promote()
+            self._put_paged(x, y, z)
+            return
+        for watcher in self.watchers:
+            watcher(x, y)
+
+    def _promote(self):
+        """Move all cells to pages, and switch get and
+        get_next_pc over to their paged versions
+
+        """
+        cells = [(x, y, self.get(x, y)) for x, y in self.nonspace()]
+        self.pages = {}
+        self._rows = {}
+        self._columns = {}
+        for x, y, v in cells:
+            self._page(x, y)[self._page_index(x, y)] = v
+            # Cells come row by row, so both lists stay sorted
+            self._rows.setdefault(y, []).append(x)
+            self._columns.setdefault(x, []).append(y)
+        self.cells = None
+        self.source = None
+        self._overlay = None
+        self._clear_skip_tables()
+        self.get = self._get_paged
+        self.get_next_pc = self._get_next_pc_paged
+
+    def _page(self, x, y):
+        """Return the page holding x,y, adding it if needed
+
+        """
+        key = (x >> BefungeText.PAGE_BITS, y >> BefungeText.PAGE_BITS)
+        page = self.pages.get(key)
+        if page is None:
+            page = self.pages[key] = array('q', [Cell.SPACE]) * (BefungeText.PAGE_SIZE ** 2)
+        return page
+
+    @staticmethod
+    def _page_index(x, y):
+        """Return the index of x,y in its page
+
+        """
+        mask = BefungeText.PAGE_SIZE - 1
+        return ((y & mask) << BefungeText.PAGE_BITS) | (x & mask)
+
+    def _get_paged(self, x, y):
+        """get with paged storage
+
+        """
+        page = self.pages.get((x >> BefungeText.PAGE_BITS, y >> BefungeText.PAGE_BITS))
+        if page is None:
+            return Cell.SPACE
+        return page[BefungeText._page_index(x, y)]
+
+    def _put_paged(self, x, y, z):
+        """put with paged storage
+
+        """
+        x0, y0 = self.x0, self.y0
+        resized = not (x0 <= x < x0 + self.width and y0 <= y < y0 + self.height)
+        if resized:
+            if z == Cell.SPACE:
+                return
+            x1 = max(x0 + self.width, x + 1)
+            y1 = max(y0 + self.height, y + 1)
+            self.x0, self.y0 = min(x0, x), min(y0, y)
+            self.width, self.height = x1 - self.x0, y1 - self.y0
+        page = self._page(x, y)
+        i = BefungeText._page_index(x, y)
+        old = page[i]
+        if old == z and not resized:
+            return
+        if (old == Cell.SPACE) != (z == Cell.SPACE):
+            for lines, line, position in ((self._rows, y, x), (self._columns, x, y)):
+                if z == Cell.SPACE:
+                    positions = lines[line]
+                    del positions[bisect_left(positions, position)]
+                    if not positions:
+                        del lines[line]
+                else:
+                    insort(lines.setdefault(line, []), position)
+        try:
+            page[i] = z
+        except OverflowError:
+            # Only a list holds ints beyond 64 bits
+            page = self.pages[(x >> BefungeText.PAGE_BITS, y >> BefungeText.PAGE_BITS)] = page.tolist()
+            page[i] = z
+        for watcher in self.watchers:
+            watcher(x, y)
+
+    def put_rect(self, x, y, rows):
+        """Write a rectangle of cells at once
+        Row r of rows goes to row y + r from column x on. Rows may
+        differ in length and are written as they are, spaces included.
+
+        The box grows once, and rows are copied as slices: whole rows
+        with dense storage, the part of a row in every page with paged
+        storage, or into the overlay rows of a mapped file. Watchers
+        hear of the cells that changed, or only once if the bounding
+        box grew.
+
+        Parameters:
+        x - column of the first cell of every row
+        y - row of the first row
+        rows - sequences of cell values, such as bytes or array('q')
+
+        """
+        rows = [row if isinstance(row, array) and row.typecode == 'q' else array('q', list(row))
+            for row in rows]
+        width = max([len(row) for row in rows] + [0])
+        if width == 0:
+            return
+        # Empty rows at the end write nothing
+        while not rows[-1]:
+            rows.pop()
+        height = len(rows)
+        inside = x >= 0 and y >= 0 and x + width <= self.width and y + height <= self.height
+        if self.pages is None and not inside and (x < 0 or y < 0 or self.cells is None or
+                max(x + width, self.width) * max(y + height, self.height) > BefungeText.DENSE_CELLS):
+            self._promote()
+        if self.pages is not None:
+            self._put_rect_paged(x, y, rows)
+            return
+        resized = x + width > self.width or y + height > self.height
+        if resized:
+            self._resize(x + width, y + height)
+        dirty = False
+        changed = []
+        for r, row in enumerate(rows):
+            if self.cells is not None:
+                cells, start = self.cells, (y + r) * self.width + x
+            else:
+                cells, start = self._overlay_row(y + r), x
+            old = cells[start:start + len(row)]
+            if old == row:
+                continue
+            cells[start:start + len(row)] = row
+            dirty = True
+            for skip_rows in self._skip_rows:
+                skip_rows.pop(y + r, None)
+            if self.watchers and not resized:
+                changed.extend((x + i, y + r) for i in range(len(row)) if old[i] != row[i])
+        if dirty:
+            for skip_columns in self._skip_columns:
+                for column in range(x, x + width):
+                    skip_columns.pop(column, None)
+        if resized:
+            changed = [(x, y)]
+        for watcher in self.watchers:
+            for cell in changed:
+                watcher(*cell)
+
+    def _put_rect_paged(self, x, y, rows):
+        """put_rect with paged storage
+
+        """
+        bits, size = BefungeText.PAGE_BITS, BefungeText.PAGE_SIZE
+        mask = size - 1
+        x0, y0 = self.x0, self.y0
+        x1, y1 = x0 + self.width, y0 + self.height
+        changed = []
+        # Rows that lost or gained a non-space cell, by column
+        removed, added = {}, {}
+        for r, row in enumerate(rows):
+            yy = y + r
+            xs = [x + i for i, v in enumerate(row) if v != Cell.SPACE]
+            if xs:
+                x0, x1 = min(x0, xs[0]), max(x1, xs[-1] + 1)
+                y0, y1 = min(y0, yy), max(y1, yy + 1)
+            line = self._rows.get(yy, [])
+            left, right = bisect_left(line, x), bisect_left(line, x + len(row))
+            for column in line[left:right]:
+                removed.setdefault(column, set()).add(yy)
+            for column in xs:
+                added.setdefault(column, []).append(yy)
+            line[left:right] = xs
+            if line:
+                self._rows[yy] = line
+            else:
+                self._rows.pop(yy, None)
+            start = 0
+            while start < len(row):
+                xx = x + start
+                end = min(len(row), start + size - (xx & mask))
+                chunk = row[start:end]
+                key = (xx >> bits, yy >> bits)
+                if key in self.pages or any(v != Cell.SPACE for v in chunk):
+                    page = self._page(xx, yy)
+                    i = BefungeText._page_index(xx, yy)
+                    old = page[i:i + len(chunk)]
+                    if old != chunk:
+                        page[i:i + len(chunk)] = chunk
+                        if self.watchers:
+                            changed.extend((xx + j, yy) for j in range(len(chunk)) if old[j] != chunk[j])
+                start = end
+        for column in set(removed) | set(added):
+            line = self._columns.get(column, [])
+            left, right = bisect_left(line, y), bisect_left(line, y + len(rows))
+            gone = removed.get(column, ())
+            line[left:right] = sorted([v for v in line[left:right] if v not in gone] +
+                added.get(column, []))
+            if line:
+                self._columns[column] = line
+            else:
+                self._columns.pop(column, None)
+        resized = (x0, y0, x1 - x0, y1 - y0) != (self.x0, self.y0, self.width, self.height)
+        if resized:
+            self.x0, self.y0, self.width, self.height = x0, y0, x1 - x0, y1 - y0
+            changed = [(x, y)]
+        for watcher in self.watchers:
+            for cell in changed:
+                watcher(*cell)
+
+    def get_rect(self, x, y, width, height):
+        """Return a rectangle of cells as a list of array('q') rows
+        Cells outside of the bounding box are spaces. Rows are sliced
+        from the dense array, the mapped file or its overlay, or from
+        pages. Rows through a page of cells beyond 64 bits are lists
+
+        Parameters:
+        x - column of the first cell of every row
+        y - row of the first row
+        width - number of columns
+        height - number of rows
+
+        """
+        blank = array('q', [Cell.SPACE])
+        bits, size = BefungeText.PAGE_BITS, BefungeText.PAGE_SIZE
+        rows = []
+        left = min(max(x, 0), x + width)
+        for row in range(y, y + height):
+            if self.pages is None:
+                if not 0 <= row < self.height:
+                    rows.append(blank * width)
+                    continue
+                if self.cells is not None:
+                    start = row * self.width
+                    right = max(min(x + width, self.width), left)
+                    cells = self.cells[start + left:start + right]
+                elif row in self._overlay:
+                    right = max(min(x + width, self.width), left)
+                    cells = self._overlay[row][left:right]
+                else:
+                    # Only the part of the row in the rectangle is read
+                    start = self._offsets[row]
+                    right = max(min(x + width, self._ends[row] - start), left)
+                    cells = array('q', list(self.source[start + left:start + right]))
+                values = blank * (left - x) + cells + blank * (x + width - right)
+            else:
+                values = array('q')
+                column = x
+                while column < x + width:
+                    end = min(x + width, column + size - (column & (size - 1)))
+                    page = self.pages.get((column >> bits, row >> bits))
+                    if page is None:
+                        values += blank * (end - column)
+                    else:
+                        i = BefungeText._page_index(column, row)
+                        chunk = page[i:i + end - column]
+                        if isinstance(chunk, list) and not isinstance(values, list):
+                            values = values.tolist()
+                        values += chunk
+                    column = end
+            rows.append(values)
+        return rows
+
+    def read_region(self, x, y, width, height):
+        """Return a rectangle of cells as a read-only memoryview of
+        format 'q' and shape (height, width), so numpy.asarray takes
+        it as it is. An empty rectangle is an empty view
+
+        Full rows of dense storage are a view of the cells themselves,
+        without a copy. It follows puts until the bounding box grows,
+        from then on it shows the cells as they were. Any other
+        rectangle is copied, and raises OverflowError if it holds a
+        cell beyond 64 bits.
+
+        Parameters:
+        x - column of the first cell of every row
+        y - row of the first row
+        width - number of columns
+        height - number of rows
+
+        """
+        if width <= 0 or height <= 0:
+            return memoryview(array('q')).toreadonly()
+        if (self.cells is not None and x == 0 and width == self.width and
+                0 <= y and y + height <= self.height):
+            view = memoryview(self.cells)[y * width:(y + height) * width]
+        else:
+            cells = array('q')
+            for row in self.get_rect(x, y, width, height):
+                cells.extend(row)
+            view = memoryview(cells)
+        return view.cast('B').cast('q', [height, width]).toreadonly()
+
+    def write_region(self, x, y, data):
+        """Write a rectangle of cells from a buffer, such as a
+        memoryview, an array or a NumPy array, through put_rect
+        Two dimensions are rows and columns, one dimension is a
+        single row. Buffers of 64-bit ints are copied as raw memory
+
+        Parameters:
+        x - column of the first cell of every row
+        y - row of the first row
+        data - object supporting the buffer protocol
+
+        """
+        view = memoryview(data)
+        if view.ndim == 1:
+            height, width = 1, view.shape[0]
+        elif view.ndim == 2:
+            height, width = view.shape
+        else:
+            raise ValueError('regions have one or two dimensions, not %d' % view.ndim)
+        if view.format.lstrip('@=') in ('q', 'l') and view.itemsize == 8:
+            cells = array('q')
+            cells.frombytes(view.tobytes())
+        else:
+            values = view.tolist()
+            if view.ndim == 2:
+                values = [v for row in values for v in row]
+            cells = array('q', values)
+        self.put_rect(x, y, [cells[r * width:(r + 1) * width] for r in range(height)])
+
+    def held(self):
+        """Return the number of cells held in memory: the dense box,
+        the pages, or the mapped file and its overlay
+
+        """
+        if self.pages is not None:
+            return len(self.pages) * BefungeText.PAGE_SIZE ** 2
+        if self.source is not None:
+            return len(self.source) + sum([len(row) for row in self._overlay.values()])
+        return len(self.cells)
+
+    def nonspace(self):
+        """Yield the coordinates of all non-space cells, row by row
+
+        """
+        if self.pages is not None:
+            for y in sorted(self._rows):
+                for x in self._rows[y]:
+                    yield (x, y)
+        elif self.source is not None:
+            for y, start in enumerate(self._offsets):
+                row = self._overlay.get(y)
+                if row is not None:
+                    for x, v in enumerate(row):
+                        if v != Cell.SPACE:
+                            yield (x, y)
+                    continue
+                for match in NONSPACE.finditer(self.source, start, self._ends[y]):
+                    yield (match.start() - start, y)
         else:
-            self.text[y][x] = z
+            for y in range(self.height):
+                start = y * self.width
+                for x, v in enumerate(self.cells[start:start + self.width]):
+                    if v != Cell.SPACE:
+                        yield (x, y)
+
+    def row(self, y):
+        """Return the printable cells of a row as a list of strings
+        The first one is at x0
+
+        Parameters:
+        y - row number
+
+        """
+        if self.cells is None:
+            return [cell_to_str(self.get(x, y)) for x in range(self.x0, self.x0 + self.width)]
+        start = y * self.width
+        return [cell_to_str(v) for v in self.cells[start:start + self.width]]
 
     def get_next_pc(self, pc, direction, skip=True):
         """Get the next pc based on direction
@@ -105,43 +741,85 @@ class BefungeText(object):
         Skip whitesapce by default
 
         """
-        op = ' '
         x, y = pc
+        dx, dy = direction
         # For befunge98, we skip all whitespace with zero ticks
-        while op == ' ':
-            # If left or right, just mod with current row length
-            if direction == Direction.RIGHT:
-                x, y = ((x + 1) % self._length_of_row(y), y)
-            # Negative values work the way we want :-)
-            elif direction == Direction.LEFT:
-                x, y = ((x - 1) % self._length_of_row(y), y)
-            elif direction == Direction.DOWN:
-                x, y = (x, (y + 1) % self._number_of_rows())
-            elif direction == Direction.UP:
-                x, y = (x, (y - 1) % self._number_of_rows())
-            op = self.get(x, y)
-            # Don't skip whitespace
-            if not skip:
+        if skip:
+            if dy == 0 and (dx == 1 or dx == -1):
+                table = self._skip_rows[dx > 0].get(y)
+                if table is None:
+                    table = self._skip_row(y, dx)
+                return (table[x], y)
+            if dx == 0 and (dy == 1 or dy == -1):
+                table = self._skip_columns[dy > 0].get(x)
+                if table is None:
+                    table = self._skip_column(x, dy)
+                return (x, table[y])
+            # Other deltas walk, for at most one lap of the box
+            width, height = self.width, self.height
+            for _ in range(width * height):
+                x, y = (x + dx) % width, (y + dy) % height
+                if self.get(x, y) != Cell.SPACE:
+                    return (x, y)
+            x, y = pc
+        # Negative values work the way we want :-)
+        return ((x + dx) % self.width, (y + dy) % self.height)
+
+    def _get_next_pc_paged(self, pc, direction, skip=True):
+        """get_next_pc with paged storage
+
+        """
+        x, y = pc
+        dx, dy = direction
+        if skip:
+            if dy == 0 and (dx == 1 or dx == -1):
+                line, position, other = self._rows.get(y), x, y
+            elif dx == 0 and (dy == 1 or dy == -1):
+                line, position, other = self._columns.get(x), y, x
+            else:
+                line = None
+                # Other deltas walk, for at most one lap of the box
+                x0, y0, width, height = self.x0, self.y0, self.width, self.height
+                for _ in range(width * height):
+                    x, y = (x - x0 + dx) % width + x0, (y - y0 + dy) % height + y0
+                    if self.get(x, y) != Cell.SPACE:
+                        return (x, y)
+                x, y = pc
+            if line:
+                if dx + dy > 0:
+                    i = bisect_right(line, position)
+                    position = line[i] if i < len(line) else line[0]
+                else:
+                    # line[-1] wraps around
+                    position = line[bisect_left(line, position) - 1]
+                return (position, other) if dy == 0 else (other, position)
+        return ((x - self.x0 + dx) % self.width + self.x0, (y - self.y0 + dy) % self.height + self.y0)
+
+    def cells_between(self, start, end, direction):
+        """Return the cells from start to end, one cell at a time
+        Stop after one lap if end is not on the way
+
+        """
+        cells = [start]
+        pc = start
+        for _ in range(self.width + self.height):
+            if pc == end:
                 break
-            #print "%s,%s,%s,%s" % (op, pc, direction, op == ' ')
-        return (x, y)
+            pc = self.get_next_pc(pc, direction, skip=False)
+            cells.append(pc)
+        return cells
 
     def jump(self, pc, direction, j):
         """Jump over that many cells
 
         """
         x, y = pc
-        if direction == Direction.RIGHT:
-            return ((x + j) % self._length_of_row(y), y)
-        elif direction == Direction.LEFT:
-            return ((x - j) % self._length_of_row(y), y)
-        elif direction == Direction.DOWN:
-            return (x, (y + j) % self._number_of_rows())
-        elif direction == Direction.UP:
-            return (x, (y - j) % self._number_of_rows())
+        dx, dy = direction
+        x0, y0 = self.x0, self.y0
+        return ((x - x0 + dx * j) % self.width + x0, (y - y0 + dy * j) % self.height + y0)
 
     def __str__(self):
         ret = ''
-        for row in self.text:
-            ret += '%s\n' % (''.join([str(x) for x in row]))
+        for y in range(self.y0, self.y0 + self.height):
+            ret += '%s\n' % (''.join(self.row(y)).rstrip())
         return ret
@@ -0,0 +1,11 @@
+"""Speed measurements of the interpreter
+
+workloads - generated programs of a chosen size, the examples and
+            programs holding many threads for the scheduler
+opcodes - every handler of BefungeOps.op_map on its own
+compare - flags results that got slower than in an earlier run
+runner - runs them, saves the results as JSON and compares two runs
+
+Run from the repository root:
+PYTHONPATH=befunge:. python -m benchmarks.runner
+"""
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Compare two result files of the runner
+
+A result regresses when its ops/sec drops by more than the threshold.
+The exit status is 1 if any did.
+
+Run from the repository root:
+PYTHONPATH=befunge:. python -m benchmarks.compare old.json new.json
+"""
+import argparse
+import json
+import sys
+
+
+def load(name):
+    """Return the results of a result file
+
+    """
+    with open(name) as f:
+        return json.load(f)['results']
+
+
+def compare(old, new, threshold=0.1, out=sys.stdout):
+    """Print old and new results side by side
+    Return the names of the results that regressed
+
+    Parameters:
+    old, new - dicts from name to result
+    threshold - fraction of ops/sec that may be lost, default=0.1
+
+    """
+    regressions = []
+    out.write('%-32s %14s %14s %8s %12s %12s\n' % (
+        'workload', 'old ops/s', 'new ops/s', 'change', 'old p99 ns', 'new p99 ns'))
+    for name in sorted(set(old) & set(new)):
+        a, b = old[name], new[name]
+        if not a['ops_per_second'] or not b['ops_per_second']:
+            continue
+        change = b['ops_per_second'] / a['ops_per_second'] - 1
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(name)
+        out.write('%-32s %14.0f %14.0f %+7.1f%% %12.0f %12.0f%s\n' % (
+            name, a['ops_per_second'], b['ops_per_second'], 100 * change,
+            a['latency_ns']['p99'], b['latency_ns']['p99'], '  REGRESSION' if regressed else ''))
+    missing, added = len(set(old) - set(new)), len(set(new) - set(old))
+    if missing or added:
+        out.write('%d results only in the old run, %d only in the new one\n' % (missing, added))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('old', help='results of the baseline run')
+    parser.add_argument('new', help='results of the run to check')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+        help='fraction of ops/sec that may be lost, default=0.1')
+    args = parser.parse_args()
+    if compare(load(args.old), load(args.new), args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
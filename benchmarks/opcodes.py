@@ -0,0 +1,63 @@
+"""Every handler of BefungeOps.op_map on its own
+
+Handlers are called directly, in batches, on a thread of a small
+program whose stack is filled up front, so that pops never run dry
+and no other op runs in between.
+"""
+import io
+import time
+from array import array
+
+from befunge.BefungeOps import BefungeOps
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeInput import BefungeInput
+from befunge.BefungeOutput import BefungeOutput
+
+from benchmarks.workloads import NullStream
+
+
+"""Ops left out: they spawn or end threads, touch files or quit
+"""
+SKIP = frozenset(ord(c) for c in 'tioq@')
+
+"""Ops that pop their last result again and would reach zero with
+ones: '%' gets increasing values instead, so b < a and b % a = b
+"""
+COUNTING = frozenset([ord('%')])
+
+
+def opcodes():
+    """Return the ops to measure, as sorted chars
+
+    """
+    return sorted(chr(op) for op, handler in BefungeOps.op_map.items()
+        if op not in SKIP and handler is not BefungeOps.op_not_implemented)
+
+
+def bench_op(c, calls, batch=100):
+    """Call the handler of op c about calls times, batch at a time
+    Return (calls made, seconds per call of every batch)
+
+    """
+    op = ord(c)
+    handler = BefungeOps.op_map[op]
+    batches = max(1, calls // batch)
+    calls = batches * batch
+    program = BefungeProgram(text=c + ' 1',
+        output=BefungeOutput(stream=NullStream()),
+        input=BefungeInput(io.BytesIO(b'7 ' * calls)))
+    thread = program.threads.head
+    size = 3 * calls + 16
+    thread.stack.push_many(range(1, size + 1) if op in COUNTING else [1] * size)
+    latencies = array('d')
+    clock = time.perf_counter
+    pc = thread.pc
+    for _ in range(batches):
+        start = clock()
+        for _ in range(batch):
+            # Every call starts on the cell of the op, as when stepping
+            thread.pc = pc
+            thread.op = op
+            handler(program, thread)
+        latencies.append((clock() - start) / batch)
+    return calls, latencies
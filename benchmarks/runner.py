@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Run the workloads, scheduler and opcode benchmarks
+
+Every workload is stepped one tick at a time up to the tick budget,
+and each tick is timed. With --jit a tick is whatever the jit runs at
+once, a trace or a closed-form loop. Scheduler runs step programs of
+1 to 100000 threads for the tick budget in thread-ticks, and spawn and
+retire as many threads. Results hold ops/sec, where an op is one tick
+of one thread, percentiles of the time per tick, or per call for
+opcodes, and the peak RSS of the process that ran them. Each runs in
+a fresh process, so the peak RSS is its own.
+
+Run from the repository root:
+PYTHONPATH=befunge:. python -m benchmarks.runner -o new.json
+PYTHONPATH=befunge:. python -m benchmarks.runner --only 'op/*' --compare old.json
+"""
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import platform
+import sys
+import time
+from array import array
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+
+from befunge.BefungeProgram import BefungeThread
+from befunge.BefungeCommon import Direction
+
+from benchmarks import workloads
+from benchmarks.opcodes import opcodes, bench_op
+from benchmarks.compare import compare, load
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes,
+    or None where it is not known
+
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes everywhere but on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def summary(ops, seconds, latencies):
+    """Return the result of a measurement
+
+    Parameters:
+    ops - number of ops run
+    seconds - time they took
+    latencies - seconds per tick or call
+
+    """
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e9
+
+    return {
+        'ops': ops,
+        'seconds': seconds,
+        'ops_per_second': ops / seconds if seconds else None,
+        'latency_ns': dict([(name, percentile(p) if latencies else None)
+            for name, p in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)]]),
+        'peak_rss': peak_rss()
+    }
+
+
+"""Thread counts of the scheduler runs
+"""
+THREADS = [1, 10, 100, 1000, 10000, 100000]
+
+
+def run_workload(workload, ticks, options):
+    """Step the program of workload until it ends or ran ticks ticks
+
+    """
+    program = workload.program(**options)
+    threads = program.threads
+    jit = program.jit
+    latencies = array('d')
+    ops = run = 0
+    clock = time.perf_counter
+    while len(threads) and run < ticks:
+        count = len(threads)
+        start = clock()
+        if jit is not None and count == 1:
+            n = jit.dispatch()
+        else:
+            # Closed-form loops may take all of their ticks
+            n = program.step(1, None)
+        latencies.append(clock() - start)
+        # Only a single thread runs traces and loops, worth many ticks
+        n = max(n, 1)
+        ops += count * n
+        run += n
+    result = summary(ops, sum(latencies), latencies)
+    result['ticks'] = run
+    return result
+
+
+def run_threads(threads, budget):
+    """Step a program of threads spinning threads for budget thread-ticks
+
+    """
+    program = workloads.spinning(threads)
+    latencies = array('d')
+    clock = time.perf_counter
+    for _ in range(max(1, budget // threads)):
+        start = clock()
+        program.step()
+        latencies.append(clock() - start)
+    result = summary(threads * len(latencies), sum(latencies), latencies)
+    result['ticks'] = len(latencies)
+    return result
+
+
+def run_churn(threads):
+    """Spawn threads threads and retire them again
+
+    """
+    program = workloads.spinning(0)
+    scheduler = program.threads
+    latencies = array('d')
+    clock = time.perf_counter
+    for _ in range(threads):
+        start = clock()
+        scheduler.spawn(BefungeThread((0, 0), Direction.RIGHT))
+        latencies.append(clock() - start)
+    for thread in list(scheduler):
+        start = clock()
+        scheduler.retire(thread)
+        latencies.append(clock() - start)
+    return summary(len(latencies), sum(latencies), latencies)
+
+
+def run_opcode(c, calls):
+    """Call the handler of op c calls times
+
+    """
+    calls, latencies = bench_op(c, calls)
+    return summary(calls, sum(latencies) * calls / len(latencies), latencies)
+
+
+def isolated(function, *args):
+    """Return function(*args), called in a fresh process
+
+    """
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(function, args)
+
+
+def benchmarks(args):
+    """Return (name, function, args) of every benchmark to run
+
+    """
+    options = {'jit': args.jit, 'peephole': args.peephole, 'loops': args.loops,
+        'strict': args.strict}
+    runs = [(workload.name, run_workload, (workload, args.ticks, options))
+        for workload in workloads.synthetic(args.scale) + workloads.examples()]
+    runs += [('scheduler/step-%d' % n, run_threads, (n, args.ticks)) for n in THREADS]
+    runs += [('scheduler/churn-%d' % n, run_churn, (n,)) for n in THREADS]
+    runs += [('op/' + c, run_opcode, (c, args.calls)) for c in opcodes()]
+    if args.only:
+        runs = [run for run in runs if any(fnmatch.fnmatchcase(run[0], p) for p in args.only)]
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the interpreter')
+    parser.add_argument('-o', '--output', help='save the results as JSON to this file')
+    parser.add_argument('-c', '--compare', help='compare the results with this result file')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+        help='fraction of ops/sec that may be lost, default=0.1')
+    parser.add_argument('--only', action='append',
+        help='only run benchmarks matching this pattern, e.g. op/*, scheduler/* or examples/*')
+    parser.add_argument('--ticks', type=int, default=200000,
+        help='tick budget of a workload, default=200000')
+    parser.add_argument('--calls', type=int, default=100000,
+        help='calls of an opcode handler, default=100000')
+    parser.add_argument('--scale', type=int, default=1,
+        help='size factor of the generated workloads, default=1')
+    parser.add_argument('--jit', action='store_true', help='compile hot traces')
+    parser.add_argument('--peephole', action='store_true', help='fuse superinstructions')
+    parser.add_argument('--loops', action='store_true', help='run counted loops in closed form')
+    parser.add_argument('--strict', action='store_true', help='use 32-bit cells')
+    parser.add_argument('--in-process', action='store_true',
+        help='run everything in this process, peak RSS is then shared')
+    args = parser.parse_args()
+
+    results = {}
+    print('%-32s %14s %10s %10s %10s' % ('workload', 'ops/s', 'p50 ns', 'p99 ns', 'rss MB'))
+    for name, function, function_args in benchmarks(args):
+        if args.in_process:
+            result = function(*function_args)
+        else:
+            result = isolated(function, *function_args)
+        results[name] = result
+        rss = result['peak_rss']
+        print('%-32s %14.0f %10.0f %10.0f %10s' % (name, result['ops_per_second'] or 0,
+            result['latency_ns']['p50'] or 0, result['latency_ns']['p99'] or 0,
+            '%.1f' % (rss / 2.0 ** 20) if rss is not None else '-'))
+    if args.output:
+        meta = {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': dict((k, v) for k, v in vars(args).items() if k not in ('output', 'compare'))
+        }
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        print('')
+        if compare(load(args.compare), results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
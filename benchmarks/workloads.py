@@ -0,0 +1,183 @@
+"""Programs to measure
+
+Generated programs all run a counted loop, whose size and body are
+chosen by parameters, so a workload can be scaled from a quick check
+to a long run. The examples are run as they are, for up to the tick
+budget of the runner. Spinning programs hold a chosen number of
+threads, for the cost of the scheduler per thread.
+"""
+import glob
+import io
+import os
+
+from befunge.BefungeProgram import BefungeProgram, BefungeThread
+from befunge.BefungeCommon import Direction
+from befunge.BefungeInput import BefungeInput
+from befunge.BefungeOutput import BefungeOutput
+
+
+"""Directory of the example programs
+"""
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+"""Input for programs that read, numbers and text alike
+"""
+INPUT = b'12 34 56 78\nhello world\n' * 64
+
+
+class NullStream(object):
+    """Binary stream that drops everything written to it
+
+    """
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class Workload(object):
+    """A program to measure
+
+    Parameters:
+    name - name of the workload in the results
+    text - program string with newlines, or None to load file
+    file - file name of the program
+    input - bytes the program reads, default=INPUT
+
+    """
+
+    def __init__(self, name, text=None, file=None, input=INPUT):
+        self.name = name
+        self.text = text
+        self.file = file
+        self.input = input
+
+    def program(self, **options):
+        """Return a new BefungeProgram running the workload
+        Output goes nowhere, options go to BefungeProgram
+
+        """
+        return BefungeProgram(name=self.file, text=self.text,
+            output=BefungeOutput(stream=NullStream()),
+            input=BefungeInput(io.BytesIO(self.input)), **options)
+
+
+def number(n):
+    """Return code pushing n >= 0
+
+    """
+    if n < 10:
+        return str(n)
+    digit = n % 10
+    return number(n // 10) + 'a*' + ('%d+' % digit if digit else '')
+
+
+def loop(iterations, body='', gap=0, rows=0, back=''):
+    """Return a program running body iterations times
+
+    The counter is pushed first. The way forward decrements it and runs
+    body on the first row, the way back runs back from right to left
+    on the row below rows empty rows, and '_' ends the program once the
+    counter is zero.
+
+    Parameters:
+    iterations - number of times the loop runs
+    body - code on the way forward, leaving the stack as it found it
+    gap - spaces after body
+    rows - empty rows between the way forward and the way back
+    back - code on the way back, at most len(body) + gap + 2 cells
+
+    """
+    head = number(iterations)
+    forward = '>1-:' + body + ' ' * gap + 'v'
+    left, right = len(head), len(head) + len(forward) - 1
+    if len(back) > right - left - 1:
+        raise ValueError('the way back is %d cells long' % (right - left - 1))
+    lines = [head + forward] + [''] * rows
+    lines.append(' ' * left + '^' + back.ljust(right - left - 1) + '_@')
+    return '\n'.join(lines)
+
+
+def tight_loop(iterations):
+    """Return a loop doing nothing but counting
+
+    """
+    return loop(iterations)
+
+
+def whitespace_grid(iterations, size):
+    """Return a loop around a size x size square of spaces
+
+    """
+    return loop(iterations, gap=size, rows=size)
+
+
+def strings(iterations, length):
+    """Return a loop pushing a string of length characters and
+    popping it again
+
+    """
+    return loop(iterations, body='"%s"%s' % ('x' * length, '$' * length))
+
+
+def self_modifying(iterations, puts):
+    """Return a loop that counts in a data cell with 'g' and 'p', and
+    turns a cell of its own way forward from a space into a 'z' and
+    back, puts times per iteration
+
+    """
+    # The cell after the body is the target, and the body holds its column
+    body = ''
+    while True:
+        column = len(number(iterations)) + 4 + len(body)
+        toggle = '02g1+:02p2%%9a**84*+%s0p' % number(column)
+        if toggle * puts == body:
+            break
+        body = toggle * puts
+    return loop(iterations, body=body, gap=1)
+
+
+def thread_storm(iterations, length):
+    """Return a loop spawning a thread every iteration, which walks
+    length cells before it ends
+
+    """
+    text = loop(iterations, gap=1, back='tv#')
+    column = len(number(iterations)) + 2
+    corridor = [' ' * column + 'z'] * length + [' ' * column + '@']
+    return '\n'.join([text] + corridor)
+
+
+def synthetic(scale=1):
+    """Return the generated workloads, scale times as large
+
+    """
+    return [
+        Workload('loop', tight_loop(20000 * scale)),
+        Workload('whitespace', whitespace_grid(5000 * scale, 200)),
+        Workload('strings', strings(500 * scale, 100)),
+        Workload('self-modifying', self_modifying(2000 * scale, 4)),
+        Workload('threads', thread_storm(500 * scale, 2000)),
+    ]
+
+
+def spinning(threads):
+    """Return a program holding threads threads, each a '>' spinning
+    on the same cell, so every thread does the same work a tick
+
+    """
+    program = BefungeProgram(text='>')
+    program.threads.retire(program.threads.head)
+    for _ in range(threads):
+        program.threads.spawn(BefungeThread((0, 0), Direction.RIGHT))
+    return program
+
+
+def examples():
+    """Return a workload for every program in examples/
+
+    """
+    return [Workload('examples/' + os.path.basename(name), file=name)
+        for name in sorted(glob.glob(os.path.join(EXAMPLES, '*.bf')))]
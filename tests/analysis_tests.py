@@ -0,0 +1,79 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeAnalysis import BefungeAnalysis
+from befunge.BefungeCommon import Direction
+
+def strip_program(a):
+	# Remove leading and trailing newline
+	a = a[1:-2]
+	# Remove tabs
+	a = a.replace('\t','')
+	return a
+
+def analyze(a):
+	return BefungeAnalysis(BefungeProgram(text=a))
+
+def test_comment():
+	# Control flow is routed around the comment
+	analysis = analyze(strip_program("""
+	v Never executed
+	>"iH",,@
+	"""))
+	assert analysis.static
+	assert analysis.executed == set([(0, 0), (0, 1), (1, 1), (2, 1), (3, 1), (4, 1), (5, 1), (6, 1), (7, 1)])
+	assert not any(y == 0 and x > 0 for x, y in analysis.covered)
+
+def test_flow():
+	for a, cells in [
+		# Trampoline and jump over skip cells
+		('#1@', [(0, 0), (2, 0)]),
+		('1;2;@', [(0, 0), (4, 0)]),
+		# Constant branches and jumps only go one way
+		('1_@@', [(0, 0), (1, 0), (3, 0)]),
+		('2j34@', [(0, 0), (1, 0), (4, 0)]),
+		# The @ skipped by # runs in the child thread
+		('#@t@', [(0, 0), (1, 0), (2, 0), (3, 0)])]:
+		assert analyze(a).executed == set(cells), a
+	# Unknown branches go both ways
+	analysis = analyze('&_@')
+	assert ((2, 0), Direction.RIGHT, False) in analysis.states
+	assert ((2, 0), Direction.LEFT, False) in analysis.states
+
+def test_puts():
+	# Constants are known where branches meet again
+	analysis = analyze('55&|\n   >p@\n   ^')
+	assert analysis.puts == set([(5, 5)])
+	assert analysis.reason == 'p to 5,5 is outside of the program'
+	for a, static in [
+		# Data cells are fine, code cells and computed coordinates are not
+		('"A"21p@\nxxx', True),
+		('"@"40p5.@', False),
+		('&&p@', False),
+		# Files loaded by i may cover anything
+		('0000"f"i@', False)]:
+		assert analyze(a).static == static, a
+
+def test_blocks():
+	analysis = analyze('12:g|\n    .\n    @')
+	first = analysis.blocks[((0, 0), Direction.RIGHT, False)]
+	assert (first.pops, first.pushes, first.clears) == (0, 1, False)
+	assert first.successors == set([((4, 1), Direction.DOWN, False), ((4, 2), Direction.UP, False)])
+	down = analysis.blocks[((4, 1), Direction.DOWN, False)]
+	assert (down.pops, down.pushes, len(down.states)) == (1, 0, 2)
+	up = analysis.blocks[((4, 2), Direction.UP, False)]
+	assert (up.pops, up.pushes, len(up.states)) == (0, 0, 1)
+
+def test_skip_comments():
+	# The peephole pass only fuses code that runs
+	a = '1v 23+\n @'
+	program = BefungeProgram(text=a, peephole=True)
+	assert program.analysis.static
+	assert list(program.peephole.fused) == [((0, 0), Direction.RIGHT)]
+
+def test_iterate():
+	# The stack is unknown after k, which only repeats stack ops
+	analysis = analyze('5k1.@')
+	assert analysis.static
+	assert (1, 0) in analysis.executed and (2, 0) in analysis.executed
+	assert analysis.blocks[((0, 0), Direction.RIGHT, False)].pops is None
+	assert not analyze('5k#1.@').static
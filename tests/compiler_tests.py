@@ -0,0 +1,72 @@
+import contextlib
+import io
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeCompiler import BefungeCompiler, CompileException, FALLBACK
+from befunge.BefungeInput import BefungeInput
+
+def strip_program(a):
+	# Remove leading and trailing newline
+	a = a[1:-2]
+	# Remove tabs
+	a = a.replace('\t','')
+	return a
+
+def interpret(a, data=b''):
+	program = BefungeProgram(text=a, input=BefungeInput(io.BytesIO(data)))
+	output = []
+	program.output = output.append
+	program.run()
+	return ''.join(output)
+
+def compiled(a, data=b''):
+	scope = {'__name__': 'compiled'}
+	exec(BefungeCompiler(a).compile(), scope)
+	output = []
+	scope['out'] = output.append
+	scope['stdin'] = BefungeInput(io.BytesIO(data))
+	scope['main']()
+	return ''.join(output)
+
+def test_compile():
+	for a in [
+		'55*       v\n.:_v#+1:-1<\n   @',
+		'v Hello!\n>1              v\n_v#-7:,g0:+1    <\n >55+,@',
+		'>               v\nv"Hello World!"0<\n>:#,_$55+,@',
+		'2j789.@',
+		'12+;Whatever;.a,@',
+		' ]  ]  10w\n[]  ][   0\n[    [   5\n         w4.a,11w2.a,@']:
+		assert compiled(a) == interpret(a), a
+
+def test_put_data():
+	# Puts into cells the program never walks over are compiled
+	a = '>"A"12p12g.12g,@\n\n'
+	assert compiled(a) == interpret(a) == '65 A'
+
+def test_fallback():
+	# Puts into the program itself, puts with computed
+	# coordinates and threads all need the interpreter
+	for a in ['"@"30p  5.@', '>:25p1+', '1&&p@', 't@']:
+		assert_raises(CompileException, BefungeCompiler(a).compile)
+		assert 'BefungeProgram(text=PROGRAM).run()' in BefungeCompiler(a).module()
+
+def run_module(source):
+	stdout = io.StringIO()
+	with contextlib.redirect_stdout(stdout):
+		exec(source, {'__name__': '__main__'})
+	return stdout.getvalue()
+
+def test_fallback_output():
+	# Compiled or not, a module prints the same, newline at the end included
+	a = '"iH",,55+.@'
+	fallback = FALLBACK % {'name': 'test', 'reason': 'test', 'source': a}
+	assert run_module(fallback) == run_module(BefungeCompiler(a).compile()) == interpret(a) + '\n'
+
+def test_input():
+	# End of input reflects
+	for a, data, output in [
+		('1&.@', b' -12x', '-12 '),
+		('1&.@', b'', ''),
+		('1&&+.@', b'1 2 ', '3 '),
+		('~.~.@', b'\xc3\xa9!', '233 33 ')]:
+		assert compiled(a, data) == interpret(a, data) == output, a
@@ -0,0 +1,58 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram, CycleException
+from befunge.BefungeCommon import CyclePolicy
+
+def strip_program(a):
+	# Remove leading and trailing newline
+	a = a[1:-2]
+	# Remove tabs
+	a = a.replace('\t','')
+	return a
+
+def run_program(a, cycles=CyclePolicy.REPORT, steps=10000):
+	program = BefungeProgram(text=a, cycles=cycles)
+	output = []
+	program.output = output.append
+	if steps is None:
+		program.run()
+	else:
+		detector = program.cycle_detector
+		for _ in range(steps):
+			program.step()
+			period = detector.check()
+			if period is not None:
+				return period
+	return program
+
+def test_cycle():
+	# Counts 1, 2, 0 around a loop of 8 cells
+	a = strip_program("""
+	>1+3%v
+	^    <
+	""")
+	assert run_program(a) == 24
+	program = run_program(a, steps=None)
+	assert program.cycle == (56, 24)
+	assert_raises(CycleException, run_program, a, CyclePolicy.RAISE, None)
+	# Both threads end up in the same loop of 4 cells
+	assert run_program('t>v\n ^<') == 4
+
+def test_no_cycle():
+	# Counters that grow, programs that change themselves
+	# and random directions are not cycles
+	for a in ['>1+v\n^  <', '>!:91pv\n^     <', '>?<']:
+		assert type(run_program(a)) is BefungeProgram, a
+	program = run_program('55+>1-:#v_@\n   ^    <', steps=None)
+	assert program.cycle is None
+
+def test_loops():
+	# Counts down from 900 in closed form, 9 ticks an iteration,
+	# then spins on the > below
+	a = 'f:*4*>1-:#v_v\n     ^    < \n            >'
+	program = BefungeProgram(text=a, cycles=CyclePolicy.REPORT, loops=True)
+	program.output = lambda s: None
+	result = program.run()
+	assert program.cycle[1] == 1
+	# The step is counted in ticks, past the 8100 ticks of the loop
+	assert program.cycle[0] == result.steps
+	assert 900 * 9 < result.steps < 900 * 9 + 20
@@ -0,0 +1,45 @@
+import io
+from nose.tools import *
+from befunge.BefungeInput import BefungeInput
+from befunge.BefungeProgram import BefungeProgram
+
+def read_all(data, read, size):
+	values = []
+	stream = BefungeInput(io.BytesIO(data), size=size)
+	while True:
+		value = read(stream)
+		values.append(value)
+		if value is None:
+			return values
+
+def test_read_int():
+	# Chunks of every size give the same numbers
+	for size in [1, 2, 3, 65536]:
+		values = read_all(b'12 x-3,45\n-\n6-', BefungeInput.read_int, size)
+		assert values == [12, -3, 45, 6, None], size
+
+def test_read_chr():
+	for size in [1, 2, 65536]:
+		values = read_all('a\n\xe9☺'.encode('utf-8') + b'\xff', BefungeInput.read_chr, size)
+		assert values == [97, 10, 0xe9, 0x263a, 0xdcff, None], size
+
+def test_mixed():
+	stream = BefungeInput(io.BytesIO(b'42\nx1 y2\r\n\n'))
+	assert stream.read_int() == 42
+	# The newline after a number is read with it, anything else is left
+	assert stream.read_chr() == ord('x')
+	assert stream.read_int() == 1
+	assert stream.read_chr() == ord(' ')
+	assert stream.read_int() == 2
+	assert stream.read_chr() == 10
+	assert stream.read_chr() is None
+	assert stream.read_int() is None
+
+def test_rpn():
+	# One token a line, the ~ after && reads the operator
+	for data, expected in [(b'6\n3\n+\n', '=9 \n'), (b'6 3*', '=18 \n'), (b'7\r\n2\r\n-\r\n', '=5 \n')]:
+		program = BefungeProgram(name='examples/rpn.bf', input=BefungeInput(io.BytesIO(data)))
+		output = []
+		program.output = output.append
+		program.step(400)
+		assert ''.join(output) == expected, data
@@ -0,0 +1,80 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeOps import BefungeOps
+from befunge.BefungeCodegen import BlockEmitter
+from befunge.BefungeCommon import Direction
+
+def strip_program(a):
+	# Remove leading and trailing newline
+	a = a[1:-2]
+	# Remove tabs
+	a = a.replace('\t','')
+	return a
+
+def run_program(a, jit):
+	program = BefungeProgram(text=a, jit=jit)
+	if jit:
+		program.jit.threshold = 2
+	output = []
+	program.output = output.append
+	program.run()
+	return ''.join(output)
+
+def test_emitter():
+	# Compiled blocks must leave the same stack as the interpreter,
+	# including pops and dups on short stacks
+	for ops in ['55+', '1+:*', ':$', '\\\\', '$:', '::+', '\\', '$$1',
+			'12n3', '2:+:-!', '73`37`', '94/94%', 'n:']:
+		for stack in [[], [5], [1, 2, 3]]:
+			program = BefungeProgram(text=ops)
+			program.threads[0].stack.stack = stack[:]
+			program.step(len(ops))
+			emitter = BlockEmitter()
+			for op in ops:
+				emitter.op(ord(op))
+			scope = {'s': stack[:], 'divide': BefungeOps.divide,
+				'modulo': BefungeOps.modulo}
+			exec('\n'.join(emitter.body()), scope)
+			assert scope['s'] == program.threads[0].stack.stack, ops
+
+def test_loop():
+	a = strip_program("""
+	"}}"*  >1-:#v_$"enod",,,,55+,@
+	       ^  .:<
+	""")
+	assert run_program(a, True) == run_program(a, False)
+
+def test_self_modifying():
+	# Rewrites the 1 of 1+ to a 2 once the counter passes 5
+	a = strip_program("""
+	0>:.1+:5`"1"+40p:f`!v
+	 ^                  _@
+	""")
+	output = run_program(a, False)
+	assert output == '0 1 2 3 4 5 6 8 10 12 14 '
+	assert run_program(a, True) == output
+
+def test_shared_stack():
+	# Traces read through and clear stacks shared with a split child
+	program = BefungeProgram(text='+++.n7.@', jit=True)
+	output = []
+	program.output = output.append
+	stack = program.threads[0].stack
+	stack.push_many([1, 2, 3])
+	child = stack.copy()
+	stack.push(4)
+	trace = program.jit.record((0, 0), Direction.RIGHT)
+	assert trace(program, program.threads[0]) == 7
+	assert output == ['10 ', '7 ']
+	assert len(stack) == 0
+	assert child.values() == [1, 2, 3]
+
+def test_negative_heap():
+	# Stores 10..1 at negative coordinates, paging the program
+	a = strip_program("""
+	55+>::01-p:01-g.1-:v
+	   ^               _@
+	""")
+	output = run_program(a, False)
+	assert output == '10 9 8 7 6 5 4 3 2 1 '
+	assert run_program(a, True) == output
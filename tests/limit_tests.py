@@ -0,0 +1,75 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeOutput import CaptureOutput
+from befunge.BefungeCommon import ExitReason
+
+def test_finished():
+	program = BefungeProgram(text='"ih",,@', output=CaptureOutput())
+	result = program.run(max_steps=100)
+	assert result.reason == ExitReason.FINISHED
+	assert result.steps == 7
+	assert result.output == 'hi'
+	# Without a CaptureOutput the output is gone
+	program = BefungeProgram(text='1.@')
+	program.output = lambda s: None
+	assert program.run().output is None
+
+def test_step():
+	program = BefungeProgram(text='1.@')
+	program.output = lambda s: None
+	assert program.step(10) == 3
+
+def test_steps():
+	# Spins forever
+	program = BefungeProgram(text='>')
+	result = program.run(max_steps=5000)
+	assert result.reason == ExitReason.STEPS
+	assert result.steps == 5000
+	# And carries on where it stopped
+	assert program.run(max_steps=10).steps == 10
+
+def test_deadline():
+	program = BefungeProgram(text='>')
+	result = program.run(deadline=0.05)
+	assert result.reason == ExitReason.DEADLINE
+	assert 0.05 <= result.seconds < 1
+	assert result.steps > 0
+
+def test_stack():
+	# Pushes forever
+	program = BefungeProgram(text='1')
+	result = program.run(max_stack=10000)
+	assert result.reason == ExitReason.STACK
+	assert 10000 < result.peak_stack <= 10000 + BefungeProgram.BATCH
+	# Copies of a stack count for each thread
+	program = BefungeProgram(text='1:::t>')
+	result = program.run(max_steps=5)
+	assert result.peak_stack == 8
+
+def test_cells():
+	# Puts n at n,n for ever growing n
+	program = BefungeProgram(text='2>:::p1+v\n ^      <')
+	result = program.run(max_cells=100000, max_steps=10 ** 7)
+	assert result.reason == ExitReason.CELLS
+	assert result.peak_cells > 100000
+	assert result.steps < 10 ** 7
+
+def test_loops():
+	# Counts down from 15 * 16 * 4 * 4 in closed form, in 8111 ticks
+	a = '"a",f:*4*>1-:#v_"c",@\n         ^    <'
+	for profile in [False, True]:
+		program = BefungeProgram(text=a, loops=True, output=CaptureOutput(), profile=profile)
+		result = program.run(max_steps=100)
+		assert result.reason == ExitReason.STEPS
+		assert result.steps == 100
+		assert result.output == 'a'
+		result = program.run(max_steps=10000)
+		assert result.reason == ExitReason.FINISHED
+		assert result.steps == 8011
+		assert result.output == 'ac'
+	# Without a limit the loop still runs at once
+	program = BefungeProgram(text=a, loops=True, output=CaptureOutput())
+	assert program.step(10000) == 8111
+	for jit in [False, True]:
+		program = BefungeProgram(text=a, loops=True, jit=jit, output=CaptureOutput())
+		assert program.run().steps == 8111
@@ -0,0 +1,65 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+
+def strip_program(a):
+	# Remove leading and trailing newline
+	a = a[1:-2]
+	# Remove tabs
+	a = a.replace('\t','')
+	return a
+
+def run_program(a, loops, strict=False):
+	program = BefungeProgram(text=a, loops=loops, strict=strict)
+	output = []
+	program.output = output.append
+	program.run()
+	return ''.join(output)
+
+def test_countdown():
+	# Two million iterations
+	a = strip_program("""
+	"}}}}"**  >1-:#v_$"enod",,,,55+,@
+	          ^    <
+	""")
+	program = BefungeProgram(text=a, loops=True)
+	assert len(program.loops.loops) == 1
+	loop = list(program.loops.loops.values())[0]
+	assert loop.ticks == 9
+	assert run_program(a, True) == 'done\n'
+
+def test_affine():
+	# Adds 3 to a sum on every iteration, counting up from -n to 0
+	for n in ['1-', '2-', '9-', '"}}"*-']:
+		a = '00%s>\\3+\\1+:#v_$.@\n%s^        <' % (n, ' ' * (len(n) + 2))
+		if len(n) == 2:
+			assert run_program(a, True) == run_program(a, False)
+		else:
+			assert run_program(a, True) == '46875 '
+
+def test_strict():
+	# Counts up by 1<<30 from 1<<30 until it wraps around to 0
+	big = '"@":*:*"@"*'
+	a = '0%s>\\3+\\%s+:#v_$.@\n%s^%s<' % (big, big, ' ' * (len(big) + 1), ' ' * (len(big) + 7))
+	assert run_program(a, True, True) == run_program(a, False, True) == '9 '
+	# Counts up from 1, which takes 1<<32 - 1 iterations
+	a = '01>\\3+\\1+:#v_$.@\n  ^        <'
+	assert run_program(a, True, True) == '-3 '
+
+def test_not_counted():
+	# The condition must change by the same amount every iteration
+	for body in ['2*:', '1-:!', '1-:.', '1-:g']:
+		a = '9>%s#v_@\n ^%s<' % (body, ' ' * len(body))
+		assert BefungeProgram(text=a, loops=True).loops.loops == {}, body
+	# Loops that never reach zero run as usual
+	a = '1>2-:#v_@\n ^    <'
+	program = BefungeProgram(text=a, loops=True)
+	program.step(100)
+	assert len(program.threads) == 1
+
+def test_put():
+	# A put into the loop drops it
+	a = '9>1-:#v_@\n ^    <'
+	program = BefungeProgram(text=a, loops=True)
+	assert len(program.loops.loops) == 1
+	program.text.put(2, 0, ord('2'))
+	assert program.loops.loops == {}
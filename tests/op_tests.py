@@ -1,6 +1,10 @@
+import io
+import os
+import tempfile
 from nose.tools import *
-from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeProgram import BefungeProgram, IllegalOpCodeException
 from befunge.BefungeCommon import Direction
+from befunge.BefungeInput import BefungeInput
 
 def strip_program(a):
 	# Remove leading and trailing newline
@@ -66,12 +70,98 @@ def test_math():
 	# Division
 	program.step(2)
 	assert len(stack) == 1
-	assert stack.peek() == 7/3
+	assert stack.peek() == 7//3
 	# Modulus
 	program.step(4)
 	assert len(stack) == 1
 	assert stack.peek() == (2+11) % 6
 
+def test_strict():
+	for a, unbounded, strict in [
+		# Wraps around at 32 bits
+		('"}}}"**:*.@', '3814697265625 ', '766306777 '),
+		# Division truncates towards zero, modulo takes the sign of b
+		('07-2/.07-2%.@', '-4 1 ', '-3 -1 '),
+		('"@":*:*"@"*2*01-/.@', '-2147483648 ', '-2147483648 '),
+		# Division by zero pushes 0
+		('10/.10%.@', None, '0 0 ')]:
+		for is_strict, expected in [(False, unbounded), (True, strict)]:
+			if expected is None:
+				continue
+			program = BefungeProgram(text=a, strict=is_strict)
+			output = []
+			program.output = output.append
+			program.run()
+			assert ''.join(output) == expected, (a, is_strict)
+
+def test_big_cells():
+	# p and g keep values beyond 64 bits
+	program = BefungeProgram(text='2' + '2*' * 69 + '00p00g.@')
+	output = []
+	program.output = output.append
+	program.run()
+	assert ''.join(output) == '%d ' % 2**70
+
+def test_stack_of_stacks():
+	for a, expected in [
+		# g and p are relative to the storage offset set by {
+		('51{00g.1}.@', '48 5 '),
+		('1{"A"00p0}20g,@', 'A'),
+		# } with a single stack reflects
+		('#@}1.@', ''),
+		('123 0{ 4u ....@', '2 3 0 0 ')]:
+		for strict in [False, True]:
+			program = BefungeProgram(text=a, strict=strict)
+			output = []
+			program.output = output.append
+			program.run()
+			assert ''.join(output) == expected, (a, strict)
+
+def test_iterate():
+	for a, expected in [
+		# Direction changes run once, the op is skipped afterwards
+		('93kv\n  .\n  @', '9 '),
+		('3k#123.@', '3 '),
+		# Zero skips the op, negative counts reflect
+		('10k..@', '1 '),
+		('#@01-k', ''),
+		# Stack ops run n times
+		('1234 2k+.@', '9 '),
+		('3k5+++.@', '15 '),
+		('12345 3k$ .@', '2 '),
+		('7 4k: .....@', '7 7 7 7 7 ')]:
+		for strict in [False, True]:
+			program = BefungeProgram(text=a, strict=strict)
+			output = []
+			program.output = output.append
+			program.run()
+			assert ''.join(output) == expected, (a, strict)
+
+def test_file_io():
+	directory = tempfile.mkdtemp()
+	source, target = os.path.join(directory, 'in'), os.path.join(directory, 'out')
+	with open(source, 'wb') as f:
+		f.write(b'ab  \ncde\n\n')
+	for strict in [False, True]:
+		# Load at 0,2, print y of Va, then write it back as text
+		a = '0200"%s"i:.10"%s"o@' % (source[::-1], target[::-1])
+		program = BefungeProgram(text=a, strict=strict)
+		output = []
+		program.output = output.append
+		program.run()
+		assert ''.join(output) == '2 ', strict
+		assert program.text.get(1, 3) == ord('d')
+		assert [list(row) for row in program.text.get_rect(0, 2, 2, 1)] == [[97, 98]]
+		with open(target, 'rb') as f:
+			assert f.read() == b'ab\ncde\n'
+	# Missing files reflect
+	a = '#@0"%s"i1.@' % os.path.join(directory, 'missing')[::-1]
+	program = BefungeProgram(text=a)
+	output = []
+	program.output = output.append
+	program.run()
+	assert ''.join(output) == ''
+
 def test_pc():
 	a = strip_program("""
 	# # # # 1;Whatever;2j789
@@ -231,4 +321,25 @@ def test_movement_turns():
 	assert thread.pc == (13,3)
 	# 11w
 	program.step(3)
-	assert thread.pc == (17,3)
\ No newline at end of file
+	assert thread.pc == (17,3)
+
+def test_directions():
+	# Turning four times in either direction comes back around
+	for d in Direction.ALL:
+		assert Direction.turn_left(Direction.turn_right(d)) == d
+		assert Direction.reverse(d) == Direction.turn_left(Direction.turn_left(d))
+	assert Direction.turn_left(Direction.RIGHT) == Direction.UP
+	assert Direction.turn_right(Direction.RIGHT) == Direction.DOWN
+
+def test_illegal_op():
+	for a in ['1X', '1' + chr(300)]:
+		program = BefungeProgram(text=a)
+		program.step()
+		assert_raises(IllegalOpCodeException, program.step)
+
+def test_input():
+	# End of input reflects, so the program walks back over 1 to @
+	program = BefungeProgram(text='1&.@', input=BefungeInput(io.BytesIO(b'')))
+	program.step(3)
+	assert program.threads[0].stack.stack == [1, 1]
+	assert program.threads[0].pc == (3, 0)
@@ -0,0 +1,38 @@
+import io
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram, CaptureOutput
+from befunge.BefungeOutput import BefungeOutput
+from befunge.BefungeCommon import FlushPolicy
+
+def test_policies():
+	# Bytes in the stream after each write, a full buffer is always flushed
+	for policy, flushed in [
+			(FlushPolicy.SIZE, [b'', b'', b'', b'ab\ncde']),
+			(FlushPolicy.NEWLINE, [b'', b'ab\n', b'ab\n', b'ab\n']),
+			(FlushPolicy.TIME, [b'a', b'ab\n', b'ab\ncd', b'ab\ncde']),
+			(FlushPolicy.EXIT, [b'', b'', b'', b'ab\ncde'])]:
+		stream = io.BytesIO()
+		output = BefungeOutput(stream, policy=policy, size=6, interval=0)
+		for s, expected in zip(['a', 'b\n', 'cd', 'e'], flushed):
+			output.write(s)
+			assert stream.getvalue() == expected, policy
+		output.flush()
+		assert stream.getvalue() == b'ab\ncde'
+		assert output.getvalue() == ''
+
+def test_unicode():
+	stream = io.BytesIO()
+	output = BefungeOutput(stream)
+	output.write(chr(233) + chr(0x263a))
+	output.flush()
+	assert stream.getvalue().decode('utf-8') == chr(233) + chr(0x263a)
+
+def test_capture():
+	program = BefungeProgram(text='"!iH",,,55+.@', output=CaptureOutput())
+	program.run()
+	assert program.stdout_log == 'Hi!10 '
+	# Captured by default when showing steps
+	assert type(BefungeProgram(text='@', show_steps=True).sink) is CaptureOutput
+
+def test_invalid_policy():
+	assert_raises(ValueError, BefungeOutput, policy='never')
@@ -0,0 +1,81 @@
+import io
+import time
+from nose.tools import *
+from befunge.BefungePacer import BefungePacer
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeOutput import BefungeOutput
+from befunge.BefungeCommon import FlushPolicy
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 0.0
+		self.sleeps = 0
+
+	def clock(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.sleeps += 1
+		self.now += seconds
+
+def test_rate():
+	# Ticks that take no time run at the rate, sleeping once a batch
+	fake = FakeClock()
+	pacer = BefungePacer(10000, clock=fake.clock, sleep=fake.sleep)
+	for i in range(10001):
+		pacer.wait()
+	pacer.stop()
+	assert abs(fake.now - 1.0) < 1e-9
+	assert pacer.ticks == 10001
+	assert fake.sleeps == 200
+	assert abs(pacer.achieved() - 10001) < 1e-6
+
+def test_slow_ticks():
+	# Ticks that take half their share still run at the rate,
+	# the sleeps make up for them
+	fake = FakeClock()
+	pacer = BefungePacer(1000, clock=fake.clock, sleep=fake.sleep)
+	for i in range(1000):
+		pacer.wait()
+		fake.now += 0.0005
+	pacer.stop()
+	assert abs(pacer.achieved() - 1000) < 10
+
+def test_burst():
+	# After a pause only BURST seconds of ticks are caught up
+	fake = FakeClock()
+	pacer = BefungePacer(1000, clock=fake.clock, sleep=fake.sleep)
+	pacer.wait()
+	fake.now += 10.0
+	ticks = 0
+	while not fake.sleeps:
+		pacer.wait()
+		ticks += 1
+	assert pacer.burst <= ticks <= pacer.burst + 2 * pacer.batch
+
+def test_flush():
+	# Output of a program gone quiet is flushed while the pacer sleeps
+	fake = FakeClock()
+	stream = io.BytesIO()
+	output = BefungeOutput(stream, policy=FlushPolicy.TIME, interval=0.1, clock=fake.clock)
+	pacer = BefungePacer(1000, clock=fake.clock, sleep=fake.sleep, poll=output.poll)
+	output.write('4 ')
+	while fake.now < 0.09:
+		pacer.wait()
+	assert stream.getvalue() == b''
+	while fake.now < 0.11:
+		pacer.wait()
+	assert stream.getvalue() == b'4 '
+
+def test_program():
+	# Counts down from 109, several ticks a count
+	program = BefungeProgram(text='"d"9+>1-:#v_@\n     ^    <', operations_per_second=2000)
+	program.output = lambda s: None
+	start = time.monotonic()
+	program.run()
+	seconds = time.monotonic() - start
+	ticks = program.pacer.ticks
+	assert ticks > 900
+	# Batches may start early by their length
+	assert seconds >= (ticks - program.pacer.batch) / 2000.0
+	assert abs(program.pacer.achieved() - 2000) < 200
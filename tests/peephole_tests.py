@@ -0,0 +1,46 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeCommon import Direction
+
+def run_steps(a, steps, peephole):
+	# Stacks only match between runs, since fused runs push at once
+	program = BefungeProgram(text=a, peephole=peephole)
+	output = []
+	program.output = output.append
+	program.step(steps)
+	return ''.join(output), [thread.stack.stack for thread in program.threads]
+
+def test_fold():
+	program = BefungeProgram(text='55+67*1+"Hi":$\\\\@', peephole=True)
+	fused = program.peephole.fused[((0, 0), Direction.RIGHT)]
+	assert fused.push == (10, 43, 72, 105)
+	assert fused.ticks == 16
+	assert fused.end == ((16, 0), Direction.RIGHT)
+	# One dispatch, then sitting out the remaining ticks
+	program.step()
+	assert program.threads[0].stack.stack == [10, 43, 72, 105]
+	program.step(15)
+	assert program.threads[0].pc == (16, 0)
+	program.step()
+	assert len(program.threads) == 0
+
+def test_guard():
+	# \\ on a short stack is not a no-op, so it runs cell by cell
+	for a in ['\\\\@', '1\\\\@', '12\\\\@']:
+		assert run_steps(a, 10, True) == run_steps(a, 10, False)
+
+def test_threads():
+	# Runs are left alone while other threads run
+	a = open('examples/split.bf').read()
+	assert run_steps(a, 2000, True)[0] == run_steps(a, 2000, False)[0]
+	# The child puts a 9 over the 7 before the parent gets there
+	a = 't123456789.@   @p09"7"'
+	assert run_steps(a, 100, False)[0] == '7 '
+	assert run_steps(a, 100, True)[0] == '7 '
+
+def test_self_modifying():
+	# Rewrites the 2 of 21+ to a 9 after the first lap
+	a = '>21+.78*1+10p v\n^             <\n'
+	expected = run_steps(a, 200, False)[0]
+	assert expected.startswith('3 10 10 ')
+	assert run_steps(a, 200, True)[0] == expected
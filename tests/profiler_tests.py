@@ -0,0 +1,60 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+
+def strip_program(a):
+	# Remove leading and trailing newline
+	a = a[1:-2]
+	# Remove tabs
+	a = a.replace('\t','')
+	return a
+
+def run_program(a, **options):
+	program = BefungeProgram(text=a, profile=True, **options)
+	output = []
+	program.output = output.append
+	program.run()
+	return program, ''.join(output)
+
+def test_disabled():
+	# Programs that are not profiled keep the plain step
+	program = BefungeProgram(text='@')
+	assert program.profiler is None
+	assert 'step' not in vars(program)
+
+def test_counts():
+	# Counts down from 3 and prints the counter
+	a = strip_program("""
+	3>:.1-:v
+	 ^     _@
+	""")
+	program, output = run_program(a)
+	assert output == '3 2 1 '
+	profiler = program.profiler
+	assert profiler.ops[ord('.')] == 3
+	assert profiler.cells[(1, 0)] == 3
+	assert profiler.cells[(8, 1)] == 1
+	assert profiler.ticks == sum(profiler.ops.values())
+	# String mode pushes are counted apart from ops
+	program, output = run_program('"+a",,@')
+	assert program.profiler.ops[None] == 2
+	assert program.profiler.ops[ord('"')] == 2
+	assert ord('+') not in program.profiler.ops
+
+def test_threads():
+	# The parent runs five ops and prints, the child runs only
+	# the @ behind the t
+	program, output = run_program('#@t1.@')
+	profiler = program.profiler
+	assert output == '1 '
+	assert [count for count, _ in profiler.threads.values()] == [5, 1]
+	assert profiler.dump()['threads'][1]['ops'] == 1
+
+def test_heatmap():
+	a = strip_program("""
+	3>:.1-:v
+	 ^     _@
+	""")
+	program, _ = run_program(a)
+	# The loop runs three times, the code around it once
+	assert program.profiler.heatmap(colored=False) == ['23333333 ', ' 3     32']
+	assert program.profiler.dump()['ops']['.'] == 3
@@ -0,0 +1,69 @@
+from io import StringIO
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram
+from befunge.BefungeRenderer import BefungeRenderer
+from befunge.BefungeCommon import Color
+
+def make_renderer(a, frames_per_second=0, size=(40, 20)):
+	program = BefungeProgram(text=a)
+	program.output = lambda s: None
+	stream = StringIO()
+	renderer = BefungeRenderer(program, frames_per_second, stream=stream, size=size, incremental=True)
+	return program, renderer, stream
+
+def test_incremental():
+	program, renderer, stream = make_renderer('1.2.@')
+	assert renderer.frame()
+	first = stream.getvalue()
+	# The first frame clears the screen and writes every line
+	assert first.startswith('\x1b[2J')
+	assert '1.2.@' in first
+	stream.seek(0)
+	stream.truncate()
+	assert renderer.frame()
+	# Nothing changed, only the cursor moves
+	assert stream.getvalue() == '\x1b[%d;1H' % (len(renderer.lines) + 1)
+	stream.seek(0)
+	stream.truncate()
+	program.step()
+	renderer.frame()
+	# Only the lines of the stack are written again
+	changed = stream.getvalue()
+	assert changed.count('\x1b[K') == 2
+	assert '\x1b[4;1HStack N: 1\x1b[K' in changed
+	assert '1.2.@' not in changed
+
+def test_rate():
+	program, renderer, stream = make_renderer('@', frames_per_second=1)
+	assert renderer.frame()
+	assert not renderer.frame()
+	assert renderer.frame(force=True)
+	assert renderer.frames == 2
+
+def test_viewport():
+	# The pc starts far right of a grid wider than the frame
+	a = 'v' + ' ' * 98 + '@\n>' + ' ' * 97 + '^'
+	program, renderer, stream = make_renderer(a, size=(20, 10))
+	for thread in program.threads:
+		thread.pc = (95, 1)
+	lines = renderer.render()
+	assert lines[1] == 'Code: 80,0 to 99,1 of 100x2'
+	assert lines[2] == ' ' * 19 + '@'
+	assert renderer.origin == (80, 0)
+	# Moving left inside of the viewport keeps it
+	for thread in program.threads:
+		thread.pc = (81, 1)
+	renderer.render()
+	assert renderer.origin == (80, 0)
+	for thread in program.threads:
+		thread.pc = (10, 1)
+	renderer.render()
+	assert renderer.origin == (0, 0)
+
+def test_render():
+	# Frames draw their code with program.render, like the heatmap
+	program, renderer, stream = make_renderer('12\n34')
+	program.step()
+	lines = renderer.render()
+	assert lines[2:4] == program.render({(1, 0): Color.grey_on_green})
+	assert program.render({(0, 1): str.lower}, 1, 1, 2, 1) == ['4 ']
@@ -0,0 +1,57 @@
+from nose.tools import *
+from befunge.BefungeProgram import BefungeProgram, BefungeThread
+from befunge.BefungeScheduler import BefungeScheduler
+from befunge.BefungeCommon import Direction
+
+def make(n):
+	return [BefungeThread((i, 0), Direction.RIGHT) for i in range(n)]
+
+def test_order():
+	a, b, c = make(3)
+	threads = BefungeScheduler([a])
+	threads.spawn(b)
+	threads.append(c)
+	assert list(threads) == [b, a, c]
+	assert len(threads) == 3
+	assert threads[0] is b
+	assert threads[-1] is c
+	assert_raises(IndexError, threads.__getitem__, 3)
+
+def test_retire():
+	a, b, c = make(3)
+	threads = BefungeScheduler([a, b, c])
+	threads.retire(b)
+	assert list(threads) == [a, c]
+	threads.retire(a)
+	threads.retire(c)
+	assert list(threads) == []
+	assert threads.head is None and threads.tail is None
+	threads.spawn(b)
+	assert list(threads) == [b]
+
+def test_iterate():
+	# Retiring the current thread and spawning in front of the
+	# head while iterating visits every other thread once
+	a, b, c, d = make(4)
+	threads = BefungeScheduler([a, b, c])
+	seen = []
+	for thread in threads:
+		seen.append(thread)
+		if thread is b:
+			threads.retire(b)
+			threads.spawn(d)
+	assert seen == [a, b, c]
+	assert list(threads) == [d, a, c]
+
+def test_split():
+	# Child runs from the next step, finished threads are gone at once
+	program = BefungeProgram(text='t@ 5')
+	program.step()
+	assert len(program.threads) == 2
+	child, parent = program.threads
+	assert child.direction == Direction.LEFT
+	assert parent.pc == (1, 0)
+	program.step()
+	assert len(program.threads) == 1
+	assert program.threads[0] is child
+	assert child.stack.stack == [5]
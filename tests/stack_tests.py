@@ -1,5 +1,5 @@
 from nose.tools import *
-from befunge.BefungeStack import BefungeStack
+from befunge.BefungeStack import BefungeStack, BefungeStack32
 
 def test_push():
 	stack = BefungeStack()
@@ -27,4 +27,118 @@ def test_clear():
 	stack.push(1)
 	assert len(stack) == 1
 	stack.clear()
-	assert len(stack) == 0
\ No newline at end of file
+	assert len(stack) == 0
+
+def test_copy():
+	stack = BefungeStack()
+	stack.push_many([1, 2, 3])
+	other = stack.copy()
+	assert len(other) == 3
+	# Changes on either side stay on that side
+	stack.push(4)
+	assert other.pop() == 3
+	other.push(5)
+	assert stack.values() == [1, 2, 3, 4]
+	assert other.values() == [1, 2, 5]
+	assert [stack.pop() for _ in range(5)] == [4, 3, 2, 1, 0]
+	assert other.peek() == 5
+	other.clear()
+	assert len(other) == 0
+
+def test_copy_chain():
+	stack = BefungeStack()
+	copies = []
+	for i in range(4):
+		stack.push(i)
+		copies.append(stack.copy())
+	assert len(stack) == 4
+	assert copies[1].reserve(0) == []
+	assert copies[1].reserve(1) == [1]
+	assert copies[1].reserve(2) == [0, 1]
+	assert len(copies[1]) == 2
+	assert copies[3].values() == [0, 1, 2, 3]
+
+def test_drop():
+	for stack in [BefungeStack(), BefungeStack32()]:
+		stack.push_many([1, 2, 3, 4])
+		other = stack.copy()
+		stack.drop(2)
+		assert stack.values() == [1, 2]
+		stack.drop(5)
+		assert len(stack) == 0
+		assert other.values() == [1, 2, 3, 4]
+
+def test_stack32():
+	stack = BefungeStack32()
+	assert stack.pop() == 0
+	assert stack.peek() == 0
+	# Grows past its first allocation, wrapping around at 32 bits
+	for i in range(100):
+		stack.push(i)
+	stack.push(2 ** 31)
+	stack.push_many([1, -2 ** 31 - 1])
+	assert len(stack) == 103
+	assert stack.values()[-3:] == [-2 ** 31, 1, 2 ** 31 - 1]
+	assert stack.peek_many(2) == [1, 2 ** 31 - 1]
+	other = stack.copy()
+	other.push(5)
+	assert stack.pop() == 2 ** 31 - 1
+	assert len(other) == 104
+	stack.clear()
+	assert len(stack) == 0
+	assert other.pop() == 5
+
+def test_stack_of_stacks():
+	for cls in [BefungeStack, BefungeStack32]:
+		stack = cls()
+		stack.push_many([1, 2, 3, 4])
+		stack.begin(2, (7, 8))
+		assert len(stack) == 2
+		assert stack.values() == [1, 2, 7, 8, 3, 4]
+		assert stack.pop() == 4
+		assert stack.pop() == 3
+		assert stack.pop() == 0
+		stack.push_many([5, 6, 9])
+		assert stack.end(2) == (7, 8)
+		assert stack.values() == [1, 2, 6, 9]
+		assert stack.end(1) is None
+		# Missing values are zeros, n < 0 pushes or pops on the stack below
+		stack = cls()
+		stack.push(1)
+		stack.begin(3, (0, 0))
+		assert stack.values() == [0, 0, 0, 0, 1]
+		stack.begin(-2, (5, 5))
+		assert len(stack) == 0
+		assert stack.values() == [0, 0, 0, 0, 1, 0, 0, 5, 5]
+		assert stack.end(-1) == (5, 5)
+		assert stack.values() == [0, 0, 0, 0, 1, 0]
+
+def test_stack_under():
+	for cls in [BefungeStack, BefungeStack32]:
+		stack = cls()
+		assert not stack.under(1)
+		stack.push_many([1, 2, 3])
+		stack.begin(0, (0, 0))
+		# One value at a time, so the order is reversed
+		stack.under(3)
+		assert stack.values() == [1, 2, 0, 0, 3]
+		assert len(stack) == 3
+		stack.under(-2)
+		assert stack.values() == [1, 2, 3, 0, 0]
+		assert len(stack) == 1
+		# 'u' moved the storage offset away
+		assert stack.end(0) == (3, 0)
+		assert stack.values() == [1, 2]
+
+def test_copy_stack_of_stacks():
+	stack = BefungeStack()
+	stack.push_many([1, 2, 3])
+	other = stack.copy()
+	other.begin(2, (9, 9))
+	assert other.values() == [1, 9, 9, 2, 3]
+	assert stack.values() == [1, 2, 3]
+	copy = other.copy()
+	copy.push(4)
+	assert copy.end(3) == (9, 9)
+	assert copy.values() == [1, 2, 3, 4]
+	assert other.values() == [1, 9, 9, 2, 3]
@@ -1,3 +1,6 @@
+import os
+import tempfile
+from array import array
 from nose.tools import *
 from befunge.BefungeText import BefungeText
 from befunge.BefungeCommon import Direction
@@ -19,13 +22,13 @@ def test_get():
 
 	assert program._number_of_rows() == 2
 	# Get regular values
-	assert program.get(0,0) == 'A'
-	assert program.get(2,0) == 'C'
+	assert program.get(0,0) == ord('A')
+	assert program.get(2,0) == ord('C')
 	# Check beyond row length
-	assert program.get(4,0) == ' '
+	assert program.get(4,0) == ord(' ')
 	# Check beyond row count
-	assert program.get(0,3) == ' '
-	assert program.get(3,3) == ' '
+	assert program.get(0,3) == ord(' ')
+	assert program.get(3,3) == ord(' ')
 	# Check that no rows were added by out of bounds requests
 	assert program._number_of_rows() == 2
 
@@ -38,17 +41,17 @@ def test_put():
 
 	assert program._number_of_rows() == 1
 	# Get, change, check
-	program.put(1,0,'X')
-	assert program.get(1,0) == 'X'
+	program.put(1,0,ord('X'))
+	assert program.get(1,0) == ord('X')
 	# Put beyond row length
-	program.put(4,0,'Z')
+	program.put(4,0,ord('Z'))
 	# Check for padding and value
-	assert program.get(3,0) == ' '
-	assert program.get(4,0) == 'Z'
+	assert program.get(3,0) == ord(' ')
+	assert program.get(4,0) == ord('Z')
 	# Put beyond row count
-	program.put(1,3,'Z')
-	assert program.get(1,3) == 'Z'
-	assert program.get(0,3) == ' '
+	program.put(1,3,ord('Z'))
+	assert program.get(1,3) == ord('Z')
+	assert program.get(0,3) == ord(' ')
 	assert program._number_of_rows() == 4
 
 def test_next_pc():
@@ -94,3 +97,208 @@ def test_next_pc():
 
 
 
+
+def test_cells():
+	a = strip_program("""
+	AB
+	C
+	""")
+	program = BefungeText(text=a)
+	# Rows are padded to the bounding box
+	assert (program.width, program.height) == (2, 2)
+	assert program.get(1,1) == ord(' ')
+	# Values outside the printable range are kept as is
+	program.put(0,1,-5)
+	program.put(1,1,7)
+	assert program.get(0,1) == -5
+	assert program.get(1,1) == 7
+	# Growing keeps existing cells in place
+	program.put(3,2,ord('D'))
+	assert (program.width, program.height) == (4, 3)
+	assert program.get(0,0) == ord('A')
+	assert program.get(1,0) == ord('B')
+	assert program.get(0,1) == -5
+	assert str(program) == 'AB\n-57\n   D\n'
+
+def test_next_pc_put():
+	a = strip_program("""
+	>    v
+	      
+	^    <
+	""")
+	program = BefungeText(text=a)
+	assert program.get_next_pc((0,0), Direction.RIGHT) == (5,0)
+	assert program.get_next_pc((5,0), Direction.LEFT) == (0,0)
+	assert program.get_next_pc((5,0), Direction.DOWN) == (5,2)
+	# Filling a gap is seen by all directions through that cell
+	program.put(2,0,ord('X'))
+	assert program.get_next_pc((0,0), Direction.RIGHT) == (2,0)
+	assert program.get_next_pc((5,0), Direction.LEFT) == (2,0)
+	assert program.get_next_pc((2,2), Direction.UP) == (2,0)
+	# And so is clearing it again
+	program.put(2,0,ord(' '))
+	assert program.get_next_pc((0,0), Direction.RIGHT) == (5,0)
+	assert program.get_next_pc((2,2), Direction.UP) == (2,1)
+	# A line of whitespace moves by one cell
+	assert program.get_next_pc((1,1), Direction.RIGHT) == (2,1)
+	assert program.get_next_pc((0,1), Direction.LEFT) == (5,1)
+
+def test_sparse():
+	program = BefungeText(text='>v\n^<')
+	# Far and negative puts only allocate the pages they touch
+	program.put(10**6, 10**6, ord('A'))
+	program.put(-5, -7, ord('B'))
+	assert len(program.pages) == 3
+	assert (program.x0, program.y0) == (-5, -7)
+	assert (program.width, program.height) == (10**6 + 6, 10**6 + 8)
+	assert program.get(10**6, 10**6) == ord('A')
+	assert program.get(-5, -7) == ord('B')
+	assert program.get(1, 0) == ord('v')
+	assert program.get(-10**9, 3) == ord(' ')
+	assert list(program.nonspace()) == [(-5, -7), (0, 0), (1, 0), (0, 1), (1, 1), (10**6, 10**6)]
+	# Spaces outside of the box do not grow it
+	program.put(-10**9, 0, ord(' '))
+	assert program.x0 == -5
+	# Whitespace is skipped across the whole box
+	assert program.get_next_pc((1, 0), Direction.RIGHT) == (0, 0)
+	assert program.get_next_pc((0, 1), Direction.UP) == (0, 0)
+	assert program.get_next_pc((-5, -7), Direction.DOWN) == (-5, -7)
+	assert program.get_next_pc((-5, -6), Direction.UP) == (-5, -7)
+	assert program.get_next_pc((-5, -6), Direction.RIGHT) == (-4, -6)
+	assert program.get_next_pc((10**6, 10**6), Direction.RIGHT, skip=False) == (-5, 10**6)
+	assert program.jump((0, 0), Direction.LEFT, 6) == (10**6, 0)
+
+def test_sparse_next_pc():
+	# Paged storage moves like dense storage, also after puts
+	a = strip_program("""
+	>  # v
+	 x
+	^    <
+	""")
+	dense, paged = BefungeText(text=a), BefungeText(text=a)
+	paged._promote()
+	for x, y, v in [(0, 0, 0), (1, 1, ord(' ')), (4, 2, ord('#')), (3, 1, ord('x'))]:
+		dense.put(x, y, v)
+		paged.put(x, y, v)
+		for y in range(3):
+			for x in range(6):
+				for direction in Direction.ALL:
+					pc = (x, y)
+					assert dense.get_next_pc(pc, direction) == paged.get_next_pc(pc, direction)
+	assert str(dense) == str(paged)
+
+def test_rect():
+	for promote in [False, True]:
+		program = BefungeText(text='>v\n^<')
+		if promote:
+			program._promote()
+		changed = []
+		program.watchers.append(lambda x, y: changed.append((x, y)))
+		# Grows the box once, spaces are written too
+		program.put_rect(1, 1, [b'AB', b' C'])
+		assert (program.width, program.height) == (3, 3)
+		assert [list(row) for row in program.get_rect(0, 1, 4, 2)] == [
+			[ord('^'), ord('A'), ord('B'), 32], [32, 32, ord('C'), 32]]
+		# Only cells that changed are reported
+		del changed[:]
+		program.put_rect(0, 0, [[ord('>'), ord('x')]])
+		assert changed == [(1, 0)]
+		assert program.get_next_pc((0, 2), Direction.RIGHT) == (2, 2)
+		assert program.get_next_pc((1, 0), Direction.DOWN) == (1, 1)
+		assert [list(row) for row in program.get_rect(-1, 5, 2, 1)] == [[32, 32]]
+
+def test_region():
+	program = BefungeText(text='abc\ndef')
+	# Full rows are a view of the cells
+	view = program.read_region(0, 0, 3, 2)
+	assert view.readonly and view.shape == (2, 3)
+	program.put(1, 0, ord('X'))
+	assert view.tolist() == [[97, 88, 99], [100, 101, 102]]
+	# Growing the box leaves the view as it was
+	program.put(0, 3, ord('Z'))
+	program.put(0, 0, ord('Y'))
+	assert view.tolist()[0] == [97, 88, 99]
+	assert program.read_region(2, 1, 2, 1).tolist() == [[102, 32]]
+	# Any buffer can be written, 64-bit ints as raw memory
+	program.write_region(0, 4, b'hi')
+	program.write_region(1, 5, memoryview(array('q', [65, 66, 67, 68])).cast('B').cast('q', [2, 2]))
+	program.write_region(-1, 0, array('i', [49]))
+	assert str(program) == '1YXc\n def\n\n Z\n hi\n  AB\n  CD\n'
+	assert_raises(ValueError, program.write_region, 0, 0, memoryview(bytes(8)).cast('B', [2, 2, 2]))
+
+def load_file(data, map_bytes):
+	# Load data from a file, mapped if it has at least map_bytes bytes
+	f = tempfile.NamedTemporaryFile(suffix='.bf', delete=False)
+	f.write(data)
+	f.close()
+	BefungeText.MAP_BYTES, old = map_bytes, BefungeText.MAP_BYTES
+	try:
+		return BefungeText(f.name)
+	finally:
+		BefungeText.MAP_BYTES = old
+		os.unlink(f.name)
+
+def test_mapped():
+	data = b'>  v  \r\n\r\n  ^ <\n\t x'
+	mapped, loaded = load_file(data, 1), load_file(data, len(data) + 1)
+	assert mapped.source is not None and loaded.source is None
+	assert (mapped.width, mapped.height) == (loaded.width, loaded.height) == (5, 4)
+	assert str(mapped) == str(loaded)
+	assert list(mapped.nonspace()) == list(loaded.nonspace())
+	assert mapped.get(3, 0) == ord('v')
+	assert mapped.get(4, 0) == ord(' ')
+	assert mapped.get(1, 3) == ord(' ')
+	assert mapped.get(10, 1) == ord(' ')
+	assert mapped.get(0, 3) == ord('\t')
+	assert mapped.get_next_pc((0, 0), Direction.RIGHT) == (3, 0)
+	assert mapped.get_next_pc((3, 0), Direction.DOWN) == (3, 0)
+	# Other deltas walk the mapped cells
+	assert mapped.get_next_pc((0, 0), (1, 1)) == (2, 2)
+	assert mapped.get_next_pc((0, 0), (1, 1)) == loaded.get_next_pc((0, 0), (1, 1))
+	# Puts go to the overlay
+	mapped.put(3, 1, ord('#'))
+	assert mapped.get(3, 1) == ord('#')
+	assert mapped.get_next_pc((3, 0), Direction.DOWN) == (3, 1)
+	mapped.put(3, 0, ord(' '))
+	assert mapped.get_next_pc((0, 0), Direction.RIGHT) == (0, 0)
+	assert mapped.source is not None
+	# Growing the box pages the program
+	mapped.put(6, 0, ord('@'))
+	assert mapped.source is None
+	assert mapped.get(3, 1) == ord('#')
+	assert mapped.get(2, 2) == ord('^')
+	assert mapped.get_next_pc((0, 0), Direction.RIGHT) == (6, 0)
+
+def test_not_mapped():
+	# Files that are not ASCII, or break lines with a lone CR, are read
+	for data in ['\xe9\n@'.encode('utf-8'), b'>\r@']:
+		assert load_file(data, 1).source is None
+
+def test_big():
+	# Cells beyond 64 bits go to pages that hold ints
+	program = BefungeText(text='a')
+	program.put(0, 0, 2**70)
+	program.put(1, 0, -2**80)
+	assert program.get(0, 0) == 2**70
+	assert program.get(1, 0) == -2**80
+	assert program.get_rect(0, 0, 3, 1) == [[2**70, -2**80, ord(' ')]]
+	assert_raises(OverflowError, program.read_region, 0, 0, 2, 1)
+	# Other pages stay arrays
+	program.put(100, 100, ord('b'))
+	assert program.get(100, 100) == ord('b')
+	assert isinstance(program.pages[(3, 3)], array)
+
+def test_mapped_rect():
+	# Rectangles of a mapped file go through its rows, like loaded ones
+	data = b'>  v\n\n  ^ <\n x'
+	mapped, loaded = load_file(data, 1), load_file(data, len(data) + 1)
+	for program in [mapped, loaded]:
+		program.put_rect(1, 1, [b'ab', b' '])
+		program.put(0, 3, ord('c'))
+	assert mapped.source is not None
+	assert sorted(mapped._overlay) == [1, 2, 3]
+	assert str(mapped) == str(loaded)
+	assert list(mapped.nonspace()) == list(loaded.nonspace())
+	for x, y, width, height in [(0, 0, 5, 4), (-2, -1, 9, 7), (2, 2, 1, 1), (7, 0, 2, 2)]:
+		assert mapped.get_rect(x, y, width, height) == loaded.get_rect(x, y, width, height)
+	assert mapped.get_next_pc((0, 1), Direction.RIGHT) == (1, 1)